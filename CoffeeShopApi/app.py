@@ -2,9 +2,14 @@ from flask import Flask, jsonify
 from datetime import timedelta
 import os
 from dotenv import load_dotenv
+from werkzeug.middleware.proxy_fix import ProxyFix
 
-from extensions import db, jwt
+from extensions import db, jwt, catalog_cache, user_cache, hasher, replica_router, metrics, compressor, idempotency, ratelimiter
 from swagger_config import configure_swagger
+from commands import register_commands
+import database
+import json_provider
+import logs
 
 load_dotenv()
 
@@ -15,22 +20,43 @@ def create_app(test_config=None):
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-key')
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)
-    app.config['JSON_AS_ASCII'] = False
-    app.config['JSONIFY_PRETTYPRINT_REGULAR'] = True
-    app.config['JSON_SORT_KEYS'] = False
-    app.config['JSONIFY_MIMETYPE'] = 'application/json'
     
     app.config['JWT_TOKEN_LOCATION'] = ['headers']
     app.config['JWT_HEADER_NAME'] = 'Authorization'
     app.config['JWT_HEADER_TYPE'] = 'Bearer'
     
+    app.config['COFFEE_IMPORT_CHUNK_SIZE'] = 1000
+    app.config['PURCHASE_EXPORT_BATCH_SIZE'] = 1000
+    app.config['BULK_REGISTER_MAX_USERS'] = 10000
+    app.config['BULK_REGISTER_BATCH_SIZE'] = 500
+    # Number of reverse proxies in front of the app whose X-Forwarded-For is trusted
+    app.config['PROXY_FIX_X_FOR'] = int(os.getenv('PROXY_FIX_X_FOR', '0'))
+    database.configure_defaults(app)
+    logs.configure_defaults(app)
+    
     if test_config:
         app.config.update(test_config)
     
+    if app.config['PROXY_FIX_X_FOR']:
+        # The rate limiter and /metrics see the client address, not the proxy's
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+    
+    logs.configure_logging(app)
+    json_provider.init_app(app)
+    metrics.init_app(app)
+    compressor.init_app(app)
+    ratelimiter.init_app(app)
+    database.configure_engine_options(app)
+    replica_router.init_app(app)
     db.init_app(app)
+    replica_router.install_bind(app, db)
+    database.install_engine_hooks(app)
     jwt.init_app(app)
+    catalog_cache.init_app(app)
+    user_cache.init_app(app)
+    hasher.init_app(app)
+    idempotency.init_app(app)
     
-    api = configure_swagger(app)
     @jwt.expired_token_loader
     def expired_token_callback(jwt_header, jwt_payload):
         return jsonify({"error": "Token has expired"}), 401
@@ -135,37 +161,30 @@ def create_app(test_config=None):
                 "5_buy_coffee": "curl -X POST http://localhost:5001/purchase/ -H 'Authorization: Bearer YOUR_TOKEN' -H 'Content-Type: application/json' -d '{\"coffee_id\":1,\"quantity\":2}'"
             }
         })
-        
+    
+    # After home() so the RESTX root endpoint does not shadow "/"
+    api = configure_swagger(app)
+    register_commands(app)
+    
     return app
 
-app = create_app()
-
-with app.app_context():
-    try:
-        from models import User, Coffee, Purchase
-        db.create_all()
-        
-        if not User.query.filter_by(username='admin').first():
-            admin = User(username='admin', email='admin@coffee.com', is_admin=True)
-            admin.set_password('admin123')
-            db.session.add(admin)
-            db.session.commit()
-    except Exception as e:
-        db.create_all()
+def __getattr__(name):
+    # ``gunicorn app:app`` and ``flask --app app`` still find an ``app``; it is
+    # built on first access instead of on import, and touches no database
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
+    from commands import init_database, seed_admin
+    
     app = create_app()
     
     with app.app_context():
         try:
-            from models import User, Coffee, Purchase
-            db.create_all()
-            
-            if not User.query.filter_by(username='admin').first():
-                admin = User(username='admin', email='admin@coffee.com', is_admin=True)
-                admin.set_password('admin123')
-                db.session.add(admin)
-                db.session.commit()
+            init_database()
+            if seed_admin('admin', 'admin@coffee.com', 'admin123'):
                 print("👤 Admin user created: admin/admin123")
             else:
                 print("👤 Admin user already exists")
@@ -174,7 +193,6 @@ if __name__ == '__main__':
             
         except Exception as e:
             print(f"❌ Error initializing database: {e}")
-            db.create_all()
     
     print("\n🚀 Coffee Shop API iniciada!")
     print("🏠 Página inicial: http://localhost:5001/")
@@ -182,4 +200,4 @@ if __name__ == '__main__':
     print("🔧 Endpoints funcionais em: /auth/, /coffee/, /purchase/")
     print("👤 Admin: admin/admin123")
     
-    app.run(debug=True, port=5001)
\ No newline at end of file
+    app.run(debug=True, port=5001)
@@ -0,0 +1,27 @@
+from functools import wraps
+
+from flask_jwt_extended import get_jwt, get_jwt_identity, verify_jwt_in_request
+
+from extensions import db, user_cache
+from models import User
+
+
+def admin_required(message="Unauthorized"):
+    """Require a valid JWT whose ``is_admin`` claim is true.
+
+    The claim is set at login, so no user lookup is needed per request.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            verify_jwt_in_request()
+            if not get_jwt().get('is_admin', False):
+                return {"error": message}, 403
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_user():
+    """Return a cached snapshot of the JWT's user, or ``None`` if it no longer exists."""
+    return user_cache.get(int(get_jwt_identity()), lambda user_id: db.session.get(User, user_id))
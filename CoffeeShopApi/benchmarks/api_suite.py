@@ -0,0 +1,251 @@
+"""Endpoint benchmark suite with a regression gate.
+
+Builds the app with ``create_app`` against a freshly seeded SQLite file and
+measures throughput and p50/p99 latency for every endpoint. Results are
+compared with a stored baseline; the run exits with status 1 when any
+endpoint's p50 or p99 grows, or its throughput drops, by more than
+``--threshold``, or when it has more failed (4xx/5xx) requests than the
+baseline, and with status 2 when there is no baseline to compare with.
+``--metrics`` limits the gate to some of those numbers.
+
+    python -m benchmarks.api_suite --save-baseline       # record benchmarks/baseline.json
+    python -m benchmarks.api_suite --threshold 0.2       # compare against it
+    python -m benchmarks.api_suite --only login,purchase_create --requests 500
+
+Baselines are only comparable on the same machine with the same options, so
+none is committed: CI records one from the base branch and compares the pull
+request against it in the same job (see ``.github/workflows/ci.yml``).
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from extensions import catalog_cache, db, hasher
+from models import User, Coffee, Purchase
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def seed(coffees, users, purchases, rng):
+    admin = User(username='admin', email='admin@example.com', is_admin=True)
+    admin.set_password('admin123')
+    buyer = User(username='buyer', email='buyer@example.com')
+    buyer.set_password('buyer123')
+    db.session.add_all([admin, buyer])
+    db.session.add_all(User(username=f'user{i}', email=f'user{i}@example.com', password_hash='x')
+                       for i in range(users))
+    db.session.flush()
+
+    catalog = [Coffee(name=f'Coffee {i}', description=f'Seeded coffee {i}', price=round(rng.uniform(2, 9), 2),
+                      stock=10 ** 9) for i in range(coffees)]
+    db.session.add_all(catalog)
+    db.session.flush()
+    db.session.bulk_save_objects([
+        Purchase(user_id=buyer.id, coffee_id=coffee.id, quantity=1, total_price=coffee.price)
+        for coffee in (rng.choice(catalog) for _ in range(purchases))
+    ])
+    db.session.commit()
+    return [coffee.id for coffee in catalog]
+
+
+def scenarios(coffee_ids, requests):
+    """``name -> (setup, send)``; ``setup(app)`` returns an iterator of per-request arguments
+    covering at least ``requests`` calls."""
+    def deletable(app):
+        with app.app_context():
+            doomed = [Coffee(name=f'Doomed {i}', description='', price=1.0, stock=1) for i in range(requests)]
+            db.session.add_all(doomed)
+            db.session.commit()
+            return iter([coffee.id for coffee in doomed])
+
+    def cold_list(client, auth, _):
+        catalog_cache.invalidate()
+        return client.get('/coffee/')
+
+    names = itertools.count()
+    return {
+        'login': (None, lambda client, auth, _: client.post(
+            '/auth/login', json={'username': 'buyer', 'password': 'buyer123'})),
+        'coffee_list': (None, lambda client, auth, _: client.get('/coffee/')),
+        'coffee_list_cold': (None, cold_list),
+        'coffee_add': (None, lambda client, auth, _: client.post(
+            '/coffee/', headers=auth['admin'],
+            json={'name': f'Added {next(names)}', 'description': 'Bench', 'price': 4.5, 'stock': 10})),
+        'coffee_update': (lambda app: itertools.cycle(coffee_ids), lambda client, auth, coffee_id: client.put(
+            f'/coffee/{coffee_id}', headers=auth['admin'],
+            json={'name': f'Coffee {coffee_id}', 'description': 'Updated', 'price': 5.0, 'stock': 10 ** 9})),
+        'coffee_delete': (deletable, lambda client, auth, coffee_id: client.delete(
+            f'/coffee/{coffee_id}', headers=auth['admin'])),
+        'purchase_create': (lambda app: itertools.cycle(coffee_ids), lambda client, auth, coffee_id: client.post(
+            '/purchase/', headers=auth['buyer'], json={'coffee_id': coffee_id, 'quantity': 1})),
+        'purchase_history': (None, lambda client, auth, _: client.get(
+            '/purchase/?limit=50', headers=auth['buyer'])),
+    }
+
+
+def measure(app, auth, setup, send, requests, threads, warmup):
+    args = setup(app) if setup else itertools.repeat(None)
+    lock = threading.Lock()
+    client = app.test_client()
+    for _ in range(warmup):
+        send(client, auth, next(args))
+
+    def next_arg():
+        with lock:
+            return next(args)
+
+    latencies, failures = [], []
+
+    def worker(count):
+        client = app.test_client()
+        for _ in range(count):
+            arg = next_arg()
+            started = time.perf_counter()
+            response = send(client, auth, arg)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code >= 400:
+                    failures.append(response.status_code)
+
+    shares = [requests // threads + (1 if i < requests % threads else 0) for i in range(threads)]
+    pool = [threading.Thread(target=worker, args=(share,)) for share in shares]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'failures': len(failures),
+        'throughput': len(latencies) / wall,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            'PASSWORD_HASH_METHOD': args.hash_method,
+            'JWT_SECRET_KEY': 'benchmark-secret-key-' + 'x' * 32,
+            'JWT_ACCESS_TOKEN_EXPIRES': False,
+            'LOG_LEVEL': 'WARNING',
+            'RATELIMIT_ENABLED': False,
+        })
+        with app.app_context():
+            db.create_all()
+            coffee_ids = seed(args.coffees, args.users, args.purchases, rng)
+
+        client = app.test_client()
+        auth = {}
+        for username in ('admin', 'buyer'):
+            token = client.post('/auth/login', json={'username': username, 'password': f'{username}123'}).json
+            auth[username] = {'Authorization': f"Bearer {token['access_token']}"}
+
+        selected = scenarios(coffee_ids, args.requests + args.warmup)
+        if args.only:
+            selected = {name: selected[name] for name in args.only.split(',')}
+        for name, (setup, send) in selected.items():
+            results[name] = measure(app, auth, setup, send, args.requests, args.threads, args.warmup)
+            print(f"{name:>18}: {results[name]['throughput']:9.1f} req/s  p50 {results[name]['p50_ms']:7.2f} ms  "
+                  f"p99 {results[name]['p99_ms']:7.2f} ms  failures={results[name]['failures']}")
+
+        with app.app_context():
+            hasher.shutdown()
+            db.engine.dispose()
+    return results
+
+
+GATED_METRICS = ('p50_ms', 'p99_ms', 'throughput')
+
+
+def compare(results, baseline, threshold, metrics=GATED_METRICS):
+    """Return one message per gated metric that regressed by more than ``threshold``.
+
+    More failed requests than the baseline is always a regression, whatever
+    ``metrics`` says: a scenario answering 4xx/5xx quickly would look faster.
+    """
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        base_failures = base.get('failures', 0) if base is not None else 0
+        if current['failures'] > base_failures:
+            regressions.append(f"{name} failures: {base_failures} -> {current['failures']}")
+        if base is None:
+            continue
+        for metric in ('p50_ms', 'p99_ms'):
+            if metric in metrics and current[metric] > base[metric] * (1 + threshold):
+                regressions.append(f"{name} {metric}: {base[metric]:.2f} -> {current[metric]:.2f}")
+        if 'throughput' in metrics and current['throughput'] < base['throughput'] * (1 - threshold):
+            regressions.append(f"{name} throughput: {base['throughput']:.1f} -> {current['throughput']:.1f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=20, help='unmeasured requests per endpoint')
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--coffees', type=int, default=200)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--purchases', type=int, default=5000, help='history rows for the benchmark user')
+    parser.add_argument('--hash-method', default='pbkdf2:sha256:1000',
+                        help='password hash method; the default keeps login about request overhead')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', help='comma-separated endpoint names')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative regression, e.g. 0.25')
+    parser.add_argument('--metrics', default=','.join(GATED_METRICS),
+                        help='comma-separated metrics the gate checks; p99 is noisy on shared machines')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args(argv)
+    metrics = args.metrics.split(',')
+    unknown = set(metrics) - set(GATED_METRICS)
+    if unknown:
+        parser.error(f"unknown metrics: {', '.join(sorted(unknown))}")
+
+    if not args.save_baseline and not os.path.exists(args.baseline):
+        # A gate without a baseline would pass every run
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one", file=sys.stderr)
+        return 2
+
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.threshold, metrics)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        return 1
+    print(f"No regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""JSON encode benchmark for large list payloads.
+
+Encodes a catalog-like and a purchase-history-like list with the old
+settings (stdlib, pretty-printed) and with ``FastJSONProvider`` in compact
+mode on the stdlib and orjson backends.
+
+    python -m benchmarks.json_encode --rows 100000 --repeat 5
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+import json_provider
+
+
+def payloads(rows):
+    started = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    catalog = [{'id': i, 'name': f'Coffee {i}', 'description': f'Café número {i}', 'price': 3.5 + i % 7,
+                'stock': i % 100} for i in range(rows)]
+    history = [{'id': i, 'user_id': 7, 'coffee_id': i % 50, 'coffee_name': f'Coffee {i % 50}', 'quantity': 1 + i % 3,
+                'total_price': 4.25 * (1 + i % 3), 'purchase_date': started + timedelta(minutes=i)} for i in range(rows)]
+    return {'catalog': catalog, 'history': history}
+
+
+def encoders():
+    app = Flask(__name__)
+    pretty = json_provider.FastJSONProvider(app, 'stdlib', compact=False)
+    yield 'stdlib pretty', lambda obj: pretty.dumps(obj, indent=2, sort_keys=True).encode('utf-8')
+    yield 'stdlib compact', json_provider.FastJSONProvider(app, 'stdlib', compact=True).dumps_bytes
+    if json_provider.orjson is not None:
+        yield 'orjson compact', json_provider.FastJSONProvider(app, 'orjson', compact=True).dumps_bytes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    data = payloads(args.rows)
+    if json_provider.orjson is None:
+        print("orjson is not installed; only the stdlib backend is measured")
+    for label, encode in encoders():
+        for name, payload in data.items():
+            best = float('inf')
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                body = encode(payload)
+                best = min(best, time.perf_counter() - started)
+            print(f"{label:>15} {name:>8}: {best * 1000:8.1f} ms  {len(body) / 1e6:6.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
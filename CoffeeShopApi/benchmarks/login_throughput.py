@@ -0,0 +1,78 @@
+"""Login throughput benchmark.
+
+Fires concurrent ``POST /auth/login`` requests through the test client and
+reports logins per second for a hash method, inline and with a process pool.
+
+    python -m benchmarks.login_throughput --method scrypt --threads 8 --workers 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from extensions import db, hasher
+from models import User
+
+
+def run(method, threads, logins, workers):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            'PASSWORD_HASH_METHOD': method,
+            'PASSWORD_HASH_WORKERS': workers,
+            'RATELIMIT_ENABLED': False,
+        })
+        with app.app_context():
+            db.create_all()
+            user = User(username='bench', email='bench@example.com')
+            user.set_password('bench123')
+            db.session.add(user)
+            db.session.commit()
+
+        failures = []
+        barrier = threading.Barrier(threads + 1)
+
+        def worker():
+            client = app.test_client()
+            barrier.wait()
+            for _ in range(logins):
+                response = client.post('/auth/login', json={'username': 'bench', 'password': 'bench123'})
+                if response.status_code != 200:
+                    failures.append(response.status_code)
+
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in pool:
+            thread.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for thread in pool:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        with app.app_context():
+            hasher.shutdown()
+            db.engine.dispose()
+
+    return threads * logins / elapsed, len(failures)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--method', default='scrypt', help='Werkzeug hash method, e.g. scrypt or pbkdf2:sha256:600000')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--logins', type=int, default=10, help='logins per thread')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='process pool size for the pooled run')
+    args = parser.parse_args(argv)
+
+    for label, workers in (('inline', 0), (f'pool({args.workers})', args.workers)):
+        rate, failures = run(args.method, args.threads, args.logins, workers)
+        print(f"{args.method} {label:>10}: {rate:8.1f} logins/s  failures={failures}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Concurrent purchase stress benchmark.
+
+Hammers a single coffee from many threads and compares the guarded
+``Coffee.reserve_stock`` path with the old read-modify-write path,
+reporting purchases per second and oversold units for each.
+
+    python -m benchmarks.purchase_stress --threads 16 --attempts 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from extensions import db
+from models import User, Coffee, Purchase
+
+
+def read_modify_write(coffee_id, user_id, quantity):
+    coffee = db.session.get(Coffee, coffee_id)
+    if coffee.stock < quantity:
+        return False
+    coffee.stock -= quantity
+    db.session.add(Purchase(user_id=user_id, coffee_id=coffee_id, quantity=quantity,
+                            total_price=coffee.price * quantity))
+    db.session.commit()
+    return True
+
+
+def guarded_update(coffee_id, user_id, quantity):
+    reserved = Coffee.reserve_stock(coffee_id, quantity)
+    if reserved is None:
+        db.session.rollback()
+        return False
+    db.session.add(Purchase(user_id=user_id, coffee_id=coffee_id, quantity=quantity,
+                            total_price=reserved[1] * quantity))
+    db.session.commit()
+    return True
+
+
+STRATEGIES = {
+    'read-modify-write': read_modify_write,
+    'guarded-update': guarded_update,
+}
+
+
+def run(strategy, threads, attempts, stock, extra_config=None):
+    with tempfile.TemporaryDirectory() as tmp:
+        config = {
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            'RATELIMIT_ENABLED': False,
+        }
+        config.update(extra_config or {})
+        app = create_app(config)
+        with app.app_context():
+            db.create_all()
+            user = User(username='bench', email='bench@example.com', password_hash='x')
+            coffee = Coffee(name='Bench Coffee', description='', price=1.0, stock=stock)
+            db.session.add_all([user, coffee])
+            db.session.commit()
+            user_id, coffee_id = user.id, coffee.id
+
+        counts = {'ok': 0, 'rejected': 0, 'errors': 0}
+        lock = threading.Lock()
+        barrier = threading.Barrier(threads + 1)
+
+        def worker():
+            barrier.wait()
+            for _ in range(attempts):
+                with app.app_context():
+                    try:
+                        outcome = 'ok' if strategy(coffee_id, user_id, 1) else 'rejected'
+                    except Exception:
+                        db.session.rollback()
+                        outcome = 'errors'
+                with lock:
+                    counts[outcome] += 1
+
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in pool:
+            thread.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for thread in pool:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        with app.app_context():
+            final_stock = db.session.get(Coffee, coffee_id).stock
+            sold = db.session.query(db.func.coalesce(db.func.sum(Purchase.quantity), 0)).scalar()
+            db.engine.dispose()
+
+        return {
+            'purchases_per_second': counts['ok'] / elapsed if elapsed else 0.0,
+            'attempts_per_second': threads * attempts / elapsed if elapsed else 0.0,
+            'oversold': max(0, sold - stock),
+            'lost_decrements': sold - (stock - final_stock),
+            'final_stock': final_stock,
+            **counts,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--attempts', type=int, default=100, help='purchase attempts per thread')
+    parser.add_argument('--stock', type=int, default=None, help='initial stock (default: half of all attempts)')
+    args = parser.parse_args(argv)
+
+    stock = args.stock if args.stock is not None else args.threads * args.attempts // 2
+    for name, strategy in STRATEGIES.items():
+        result = run(strategy, args.threads, args.attempts, stock)
+        print(f"{name:>18}: {result['purchases_per_second']:8.1f} purchases/s "
+              f"{result['attempts_per_second']:8.1f} attempts/s  ok={result['ok']} "
+              f"rejected={result['rejected']} errors={result['errors']} "
+              f"final_stock={result['final_stock']} oversold={result['oversold']} "
+              f"lost_decrements={result['lost_decrements']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""SQLite read/write concurrency benchmark.
+
+Runs purchase writers and purchase-history readers against a file database,
+once with SQLite's stock settings (rollback journal, synchronous=FULL) and
+once with the ``SQLITE_PRAGMAS`` profile from ``create_app``.
+
+    python -m benchmarks.sqlite_concurrency --writers 4 --readers 8 --seconds 5
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_jwt_extended import create_access_token
+
+from app import create_app
+from extensions import db
+from models import User, Coffee, Purchase
+
+PROFILES = {
+    'stock sqlite': {'SQLITE_PRAGMAS': {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'busy_timeout': 0}},
+    'production': {},
+}
+
+
+def run(profile_config, writers, readers, seconds):
+    with tempfile.TemporaryDirectory() as tmp:
+        config = {
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            'CATALOG_CACHE_TTL': 0,
+            'RATELIMIT_ENABLED': False,
+        }
+        config.update(profile_config)
+        app = create_app(config)
+        with app.app_context():
+            db.create_all()
+            user = User(username='bench', email='bench@example.com', password_hash='x')
+            coffee = Coffee(name='Bench Coffee', description='', price=1.0, stock=10 ** 9)
+            db.session.add_all([user, coffee])
+            db.session.flush()
+            db.session.add_all([Purchase(user_id=user.id, coffee_id=coffee.id, quantity=1, total_price=1.0)
+                                for _ in range(200)])
+            db.session.commit()
+            coffee_id = coffee.id
+            token = create_access_token(identity=str(user.id), additional_claims={'is_admin': False})
+
+        headers = {'Authorization': f'Bearer {token}'}
+        counts = {'reads': 0, 'writes': 0, 'read_errors': 0, 'write_errors': 0}
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        def writer():
+            client = app.test_client()
+            while not stop.is_set():
+                response = client.post('/purchase/', json={'coffee_id': coffee_id, 'quantity': 1}, headers=headers)
+                with lock:
+                    counts['writes' if response.status_code == 201 else 'write_errors'] += 1
+
+        def reader():
+            client = app.test_client()
+            while not stop.is_set():
+                response = client.get('/purchase/?limit=50', headers=headers)
+                with lock:
+                    counts['reads' if response.status_code == 200 else 'read_errors'] += 1
+
+        pool = [threading.Thread(target=writer) for _ in range(writers)]
+        pool += [threading.Thread(target=reader) for _ in range(readers)]
+        for thread in pool:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in pool:
+            thread.join()
+
+        with app.app_context():
+            db.engine.dispose()
+
+    return {key: value / seconds if key in ('reads', 'writes') else value for key, value in counts.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    # "database is locked" failures are counted, not logged with a traceback each
+    logging.disable(logging.CRITICAL)
+    for name, profile in PROFILES.items():
+        result = run(profile, args.writers, args.readers, args.seconds)
+        print(f"{name:>12}: {result['reads']:8.1f} reads/s {result['writes']:8.1f} writes/s  "
+              f"read_errors={result['read_errors']} write_errors={result['write_errors']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""Startup cost benchmark.
+
+Times, in fresh interpreters, ``import app`` and building an app with
+``create_app()``: what every gunicorn worker, test session and ``flask``
+CLI invocation pays before doing any work.
+
+    python -m benchmarks.startup --runs 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = '''
+import time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app({'SQLALCHEMY_DATABASE_URI': %r})
+built = time.perf_counter()
+print(imported - started, built - imported)
+'''
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    imports, builds = [], []
+    with tempfile.TemporaryDirectory() as tmp:
+        probe = PROBE % f"sqlite:///{os.path.join(tmp, 'startup.db')}"
+        for _ in range(args.runs):
+            output = subprocess.run([sys.executable, '-c', probe], cwd=ROOT, check=True,
+                                    capture_output=True, text=True).stdout
+            import_time, build_time = map(float, output.split()[-2:])
+            imports.append(import_time)
+            builds.append(build_time)
+
+    print(f"import app:   median {statistics.median(imports) * 1000:7.1f} ms  max {max(imports) * 1000:7.1f} ms")
+    print(f"create_app(): median {statistics.median(builds) * 1000:7.1f} ms  max {max(builds) * 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
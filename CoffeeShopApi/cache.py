@@ -0,0 +1,122 @@
+import hashlib
+import threading
+import time
+
+
+class CachedPayload:
+    __slots__ = ('version', 'body', 'etag', 'created_at')
+
+    def __init__(self, version, body, etag):
+        self.version = version
+        self.body = body
+        self.etag = etag
+        self.created_at = time.monotonic()
+
+
+class CatalogCache:
+    """In-process cache of the serialized coffee catalog.
+
+    Writers call ``invalidate()`` after committing; a payload built while
+    the version moved underneath it is returned but never stored.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 0
+        self._lock = threading.Lock()
+        self._version = 0
+        self._entry = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CATALOG_CACHE_TTL', 30)
+        self.ttl = app.config['CATALOG_CACHE_TTL']
+        app.extensions['catalog_cache'] = self
+
+    @property
+    def version(self):
+        return self._version
+
+    def peek(self):
+        entry = self._entry
+        if entry is None or entry.version != self._version:
+            return None
+        if self.ttl and time.monotonic() - entry.created_at > self.ttl:
+            return None
+        return entry
+
+    def get(self, build):
+        entry = self.peek()
+        if entry is not None:
+            return entry
+
+        version = self._version
+        body = build()
+        entry = CachedPayload(version, body, hashlib.sha256(body).hexdigest()[:32])
+        with self._lock:
+            if self._version == version:
+                self._entry = entry
+        return entry
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+            self._entry = None
+
+
+class CachedUser:
+    __slots__ = ('id', 'username', 'email', 'is_admin', 'expires_at')
+
+    def __init__(self, user, expires_at):
+        self.id = user.id
+        self.username = user.username
+        self.email = user.email
+        self.is_admin = bool(user.is_admin)
+        self.expires_at = expires_at
+
+
+class UserCache:
+    """Short-TTL, per-process cache of user rows keyed by id.
+
+    Holds plain snapshots rather than ORM instances so entries can be shared
+    across requests and sessions. ``USER_CACHE_TTL = 0`` disables it.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 0
+        self.max_size = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('USER_CACHE_TTL', 60)
+        app.config.setdefault('USER_CACHE_SIZE', 10000)
+        self.ttl = app.config['USER_CACHE_TTL']
+        self.max_size = app.config['USER_CACHE_SIZE']
+        app.extensions['user_cache'] = self
+
+    def get(self, user_id, load):
+        now = time.monotonic()
+        entry = self._entries.get(user_id)
+        if entry is not None and entry.expires_at > now:
+            return entry
+
+        user = load(user_id)
+        if user is None:
+            return None
+        entry = CachedUser(user, now + self.ttl)
+        if self.ttl > 0:
+            with self._lock:
+                if len(self._entries) >= self.max_size:
+                    self._entries.pop(next(iter(self._entries)), None)
+                self._entries[user_id] = entry
+        return entry
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
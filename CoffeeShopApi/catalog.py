@@ -0,0 +1,87 @@
+import base64
+import binascii
+import json
+
+from sqlalchemy import literal_column, select, tuple_
+
+from models import Coffee
+
+SORTS = ('id', '-id', 'name', '-name', 'price', '-price')
+
+LIST_COLUMNS = (Coffee.id, Coffee.name, Coffee.price, Coffee.stock)
+
+
+# JSON types a cursor may carry for each sort key
+_CURSOR_TYPES = {'id': int, 'name': str, 'price': (int, float)}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def encode_cursor(sort, row):
+    key = sort.lstrip('-')
+    payload = [sort, getattr(row, key), row.id]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        cursor_sort, value, last_id = payload
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+    if cursor_sort != sort:
+        raise InvalidCursor("Cursor does not match the sort order")
+    if not _is_int(last_id) or not isinstance(value, _CURSOR_TYPES[sort.lstrip('-')]) or isinstance(value, bool):
+        raise InvalidCursor("Invalid cursor")
+    if sort.lstrip('-') == 'id' and value != last_id:
+        raise InvalidCursor("Invalid cursor")
+    return value, last_id
+
+
+def catalog_page_query(sort='id', in_stock=None, min_price=None, max_price=None, name_prefix=None,
+                       cursor=None, limit=50, include_description=False):
+    """Keyset-paginated catalog query; fetches ``limit + 1`` rows so the caller can tell if more remain.
+
+    With ``limit=None`` every matching row is returned.
+
+    Each filter is served by an index on ``coffee``: ``ix_coffee_in_stock``
+    (partial, ``stock > 0``), ``ix_coffee_price_id`` and ``ix_coffee_name``;
+    the name prefix is a range scan, so it is case-sensitive.
+    """
+    descending = sort.startswith('-')
+    key = getattr(Coffee, sort.lstrip('-'))
+    columns = LIST_COLUMNS + ((Coffee.description,) if include_description else ())
+    stmt = select(*columns)
+
+    if in_stock is True:
+        # A literal, not a bound parameter, so it matches the partial index predicate
+        stmt = stmt.where(Coffee.stock > literal_column('0'))
+    elif in_stock is False:
+        stmt = stmt.where((Coffee.stock <= 0) | Coffee.stock.is_(None))
+    if min_price is not None:
+        stmt = stmt.where(Coffee.price >= min_price)
+    if max_price is not None:
+        stmt = stmt.where(Coffee.price <= max_price)
+    if name_prefix:
+        stmt = stmt.where(Coffee.name >= name_prefix, Coffee.name < name_prefix + '\U0010ffff')
+
+    if cursor is not None:
+        value, last_id = decode_cursor(cursor, sort)
+        if key is Coffee.id:
+            stmt = stmt.where(Coffee.id < last_id if descending else Coffee.id > last_id)
+        elif descending:
+            stmt = stmt.where(tuple_(key, Coffee.id) < tuple_(value, last_id))
+        else:
+            stmt = stmt.where(tuple_(key, Coffee.id) > tuple_(value, last_id))
+
+    order = [key.desc() if descending else key.asc()]
+    if key is not Coffee.id:
+        order.append(Coffee.id.desc() if descending else Coffee.id.asc())
+    stmt = stmt.order_by(*order)
+    return stmt if limit is None else stmt.limit(limit + 1)
@@ -0,0 +1,176 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from extensions import db, idempotency, ratelimiter
+from replica import REPLICA_BIND, sync_sqlite_replica
+import importer
+import migrations
+import rollups
+import search
+import synthetic
+
+
+def register_commands(app):
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(seed_admin_command)
+    app.cli.add_command(db_upgrade_command)
+    app.cli.add_command(db_status_command)
+    app.cli.add_command(import_coffees_command)
+    app.cli.add_command(sync_replica_command)
+    app.cli.add_command(backfill_rollups_command)
+    app.cli.add_command(generate_data_command)
+    app.cli.add_command(purge_idempotency_keys_command)
+
+
+def init_database():
+    """Create missing tables, then apply pending migrations; returns the migrations that ran."""
+    db.create_all()
+    ratelimiter.create_storage()
+    ran = migrations.upgrade(db.engine)
+    search.forget_fts(db.engine)
+    return ran
+
+
+def seed_admin(username, email, password):
+    """Create the admin user unless ``username`` exists; returns whether it was created."""
+    from models import User
+
+    if db.session.execute(db.select(User.id).filter_by(username=username)).first() is not None:
+        return False
+    admin = User(username=username, email=email, is_admin=True)
+    admin.set_password(password)
+    db.session.add(admin)
+    db.session.commit()
+    return True
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create the schema and bring it up to the latest migration."""
+    for step in init_database():
+        click.echo(f"Applied {step.version}: {step.description}")
+    click.echo("Database initialized.")
+
+
+@click.command('seed-admin')
+@with_appcontext
+@click.option('--username', default='admin', show_default=True)
+@click.option('--email', default='admin@coffee.com', show_default=True)
+@click.option('--password', envvar='ADMIN_PASSWORD', default='admin123',
+              help='Defaults to $ADMIN_PASSWORD, then admin123.')
+def seed_admin_command(username, email, password):
+    """Create the admin user if it does not exist yet."""
+    if seed_admin(username, email, password):
+        click.echo(f"Admin user {username} created.")
+    else:
+        click.echo(f"User {username} already exists.")
+
+
+@click.command('db-upgrade')
+@with_appcontext
+def db_upgrade_command():
+    """Apply pending schema migrations to the configured database."""
+    ran = migrations.upgrade(db.engine)
+    ratelimiter.create_storage()
+    search.forget_fts(db.engine)
+    for step in ran:
+        click.echo(f"Applied {step.version}: {step.description}")
+    if not ran:
+        click.echo("Database is up to date.")
+
+
+@click.command('db-status')
+@with_appcontext
+def db_status_command():
+    """List schema migrations and whether they have been applied."""
+    applied = migrations.applied_versions(db.engine)
+    for step in migrations.MIGRATIONS:
+        state = 'applied' if step.version in applied else 'pending'
+        click.echo(f"{step.version:>4} {state:<8} {step.description}")
+
+
+@click.command('import-coffees')
+@with_appcontext
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(importer.FORMATS),
+              help='File format; defaults to the file extension.')
+@click.option('--chunk-size', type=int, default=None, help='Rows per bulk insert/commit.')
+def import_coffees_command(path, fmt, chunk_size):
+    """Upsert coffees from a CSV or NDJSON file."""
+    from routes_swagger import coffee_model
+
+    fmt = fmt or importer.detect_format(filename=path)
+    if fmt is None:
+        raise click.UsageError('Cannot detect file format, pass --format.')
+
+    with open(path, 'rb') as stream:
+        result = importer.import_coffees(
+            importer.iter_rows(stream, fmt),
+            coffee_model,
+            chunk_size=chunk_size or current_app.config['COFFEE_IMPORT_CHUNK_SIZE']
+        )
+
+    click.echo(f"{result['rows']} rows: {result['inserted']} inserted, "
+               f"{result['updated']} updated, {result['error_count']} errors")
+    for error in result['errors']:
+        click.echo(f"  line {error['line']}: {error['error']}", err=True)
+    if 'error' in result:
+        raise click.ClickException(f"Import stopped: {result['error']}")
+
+
+@click.command('sync-replica')
+@with_appcontext
+def sync_replica_command():
+    """Copy the SQLite primary onto the replica file (local replica setups)."""
+    replica_uri = current_app.config.get('SQLALCHEMY_REPLICA_URI')
+    if not replica_uri:
+        raise click.UsageError('SQLALCHEMY_REPLICA_URI / REPLICA_DATABASE_URL is not set.')
+
+    # Close pooled connections so the copy is not racing this process
+    db.engines[REPLICA_BIND].dispose()
+    sync_sqlite_replica(current_app.config['SQLALCHEMY_DATABASE_URI'], replica_uri, current_app.instance_path)
+    click.echo("Replica synchronized.")
+
+
+@click.command('backfill-rollups')
+@with_appcontext
+def backfill_rollups_command():
+    """Rebuild the sales and per-user rollup tables from the purchase history."""
+    rollups.backfill_all(db.session)
+    db.session.commit()
+    click.echo("Rollups rebuilt.")
+
+
+@click.command('purge-idempotency-keys')
+@with_appcontext
+def purge_idempotency_keys_command():
+    """Delete stored Idempotency-Key responses older than IDEMPOTENCY_TTL."""
+    click.echo(f"Deleted {idempotency.purge()} expired idempotency keys.")
+
+
+@click.command('generate-data')
+@with_appcontext
+@click.option('--users', type=int, default=10000, show_default=True)
+@click.option('--coffees', type=int, default=200, show_default=True)
+@click.option('--purchases', type=int, default=1000000, show_default=True)
+@click.option('--seed', type=int, default=0, show_default=True)
+@click.option('--days', type=click.IntRange(min=1), default=365, show_default=True,
+              help='Spread purchases over this many days.')
+@click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']),
+              help='Last day of the spread (default: today, UTC). Fix it, and start from an empty '
+                   'database, to reproduce a dataset.')
+@click.option('--chunk-size', type=click.IntRange(min=1), default=10000, show_default=True,
+              help='Rows per bulk insert/commit.')
+def generate_data_command(users, coffees, purchases, seed, days, end, chunk_size):
+    """Append a deterministic synthetic dataset for profiling at scale."""
+    def progress(table, count):
+        if count % (chunk_size * 10) == 0:
+            click.echo(f"  {table}: {count} rows")
+
+    result = synthetic.generate(users, coffees, purchases, seed=seed, days=days,
+                                end=end.date() if end else None, chunk_size=chunk_size, progress=progress)
+    click.echo(f"Inserted {result['users']} users, {result['coffees']} coffees and "
+               f"{result['purchases']} purchases; rollups rebuilt. "
+               f"Synthetic users log in with password '{synthetic.SYNTHETIC_PASSWORD}'.")
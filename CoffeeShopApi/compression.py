@@ -0,0 +1,124 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+DEFAULT_MIMETYPES = (
+    'application/json',
+    'application/x-ndjson',
+    'text/csv',
+    'text/html',
+    'text/plain',
+    'text/css',
+    'application/javascript',
+)
+
+
+class Compressor:
+    """gzip/brotli response compression negotiated through ``Accept-Encoding``.
+
+    Bodies of cacheable responses (a strong ``ETag``, or an endpoint listed
+    in ``COMPRESS_CACHE_ENDPOINTS``) are compressed once per encoding and
+    kept in a small LRU. Streamed responses are left alone.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.min_size = 0
+        self.gzip_level = 6
+        self.brotli_quality = 5
+        self.mimetypes = frozenset()
+        self.cache_endpoints = frozenset()
+        self.cache_size = 0
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_ENABLED', True)
+        app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+        app.config.setdefault('COMPRESS_LEVEL', 6)
+        app.config.setdefault('COMPRESS_BROTLI_QUALITY', 5)
+        app.config.setdefault('COMPRESS_MIMETYPES', DEFAULT_MIMETYPES)
+        app.config.setdefault('COMPRESS_CACHE_ENDPOINTS', ('specs', 'home'))
+        app.config.setdefault('COMPRESS_CACHE_SIZE', 64)
+        self.enabled = app.config['COMPRESS_ENABLED']
+        self.min_size = app.config['COMPRESS_MIN_SIZE']
+        self.gzip_level = app.config['COMPRESS_LEVEL']
+        self.brotli_quality = app.config['COMPRESS_BROTLI_QUALITY']
+        self.mimetypes = frozenset(app.config['COMPRESS_MIMETYPES'])
+        self.cache_endpoints = frozenset(app.config['COMPRESS_CACHE_ENDPOINTS'])
+        self.cache_size = app.config['COMPRESS_CACHE_SIZE']
+        self.clear()
+        app.extensions['compressor'] = self
+        if self.enabled:
+            app.after_request(self._compress_response)
+
+    @property
+    def encodings(self):
+        return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def clear(self):
+        with self._lock:
+            self._cache = OrderedDict()
+
+    def compress(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+
+    def _cached_compress(self, key, data, encoding):
+        if key is None or not self.cache_size:
+            return self.compress(data, encoding)
+        key = (key, encoding)
+        with self._lock:
+            body = self._cache.get(key)
+            if body is not None:
+                self._cache.move_to_end(key)
+                return body
+        body = self.compress(data, encoding)
+        with self._lock:
+            self._cache[key] = body
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return body
+
+    def _cache_key(self, response, data):
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            return 'etag:' + etag
+        if request.endpoint in self.cache_endpoints:
+            return 'body:' + hashlib.blake2b(data, digest_size=16).hexdigest()
+        return None
+
+    def _compress_response(self, response):
+        if response.mimetype not in self.mimetypes:
+            return response
+        response.vary.add('Accept-Encoding')
+        if (response.status_code < 200 or response.status_code in (204, 304)
+                or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers):
+            return response
+
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        response.set_data(self._cached_compress(self._cache_key(response, data), data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            # The compressed bytes differ from the identity ones; If-None-Match compares weakly
+            response.set_etag(etag, weak=True)
+        return response
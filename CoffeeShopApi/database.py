@@ -0,0 +1,68 @@
+import re
+from functools import partial
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from extensions import db
+
+DEFAULT_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+_PRAGMA_TOKEN = re.compile(r'^-?\w+$')
+
+
+def configure_defaults(app):
+    app.config['SQLITE_PRAGMAS'] = dict(DEFAULT_SQLITE_PRAGMAS)
+    app.config['DB_POOL_SIZE'] = 10
+    app.config['DB_MAX_OVERFLOW'] = 20
+    app.config['DB_POOL_TIMEOUT'] = 30
+    app.config['DB_POOL_RECYCLE'] = 1800
+    app.config['DB_POOL_PRE_PING'] = True
+
+
+def configure_engine_options(app):
+    """Fill ``SQLALCHEMY_ENGINE_OPTIONS`` for the primary URI; explicit options win."""
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    if url.get_backend_name() == 'sqlite':
+        return
+
+    options.setdefault('pool_size', app.config['DB_POOL_SIZE'])
+    options.setdefault('max_overflow', app.config['DB_MAX_OVERFLOW'])
+    options.setdefault('pool_timeout', app.config['DB_POOL_TIMEOUT'])
+    options.setdefault('pool_recycle', app.config['DB_POOL_RECYCLE'])
+    options.setdefault('pool_pre_ping', app.config['DB_POOL_PRE_PING'])
+
+
+def _apply_sqlite_pragmas(pragmas, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def apply_sqlite_pragmas(engine, pragmas):
+    """Run ``pragmas`` (a mapping) on every new connection of a SQLite ``engine``."""
+    checked = []
+    for name, value in (pragmas or {}).items():
+        if not (_PRAGMA_TOKEN.match(str(name)) and _PRAGMA_TOKEN.match(str(value))):
+            raise ValueError(f"Invalid SQLite pragma: {name}={value}")
+        checked.append((name, value))
+    if checked and engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', partial(_apply_sqlite_pragmas, checked))
+
+
+def install_engine_hooks(app):
+    """Apply ``SQLITE_PRAGMAS`` to every new SQLite connection of the app's engines."""
+    with app.app_context():
+        for engine in db.engines.values():
+            apply_sqlite_pragmas(engine, app.config.get('SQLITE_PRAGMAS'))
@@ -0,0 +1,69 @@
+import csv
+import io
+
+from flask import current_app
+from sqlalchemy import select
+
+from extensions import db
+from models import User, Coffee, Purchase, isoformat_utc
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+COLUMNS = ('id', 'user_id', 'username', 'coffee_id', 'coffee_name', 'quantity', 'total_price', 'purchase_date')
+
+
+def purchase_export_query(start=None, end=None, coffee_id=None):
+    stmt = select(
+        Purchase.id,
+        Purchase.user_id,
+        User.username,
+        Purchase.coffee_id,
+        Coffee.name,
+        Purchase.quantity,
+        Purchase.total_price,
+        Purchase.created_at
+    ).outerjoin(User, Purchase.user_id == User.id) \
+        .outerjoin(Coffee, Purchase.coffee_id == Coffee.id) \
+        .order_by(Purchase.id)
+
+    if start is not None:
+        stmt = stmt.where(Purchase.created_at >= start)
+    if end is not None:
+        stmt = stmt.where(Purchase.created_at < end)
+    if coffee_id is not None:
+        stmt = stmt.where(Purchase.coffee_id == coffee_id)
+    return stmt
+
+
+def _row_values(row):
+    values = list(row)
+    values[-1] = isoformat_utc(values[-1])
+    return values
+
+
+def iter_export(stmt, fmt, batch_size=1000):
+    """Yield the export body in chunks of ``batch_size`` rows.
+
+    Rows are fetched with ``yield_per`` (a server-side cursor where the driver
+    supports it), so memory does not grow with the number of purchases.
+    """
+    result = db.session.execute(stmt.execution_options(yield_per=batch_size))
+
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(COLUMNS)
+        for partition in result.partitions():
+            writer.writerows(_row_values(row) for row in partition)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    else:
+        dumps = current_app.json.dumps_bytes
+        for partition in result.partitions():
+            yield b''.join(dumps(dict(zip(COLUMNS, _row_values(row)))) + b'\n' for row in partition)
@@ -1,5 +1,21 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 
-db = SQLAlchemy()
-jwt = JWTManager() 
\ No newline at end of file
+from cache import CatalogCache, UserCache
+from compression import Compressor
+from idempotency import IdempotencyStore
+from metrics import Metrics
+from passwords import PasswordHasher
+from ratelimit import RateLimiter
+from replica import ReplicaRouter, RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+jwt = JWTManager()
+catalog_cache = CatalogCache()
+user_cache = UserCache()
+hasher = PasswordHasher()
+replica_router = ReplicaRouter()
+metrics = Metrics()
+compressor = Compressor()
+idempotency = IdempotencyStore()
+ratelimiter = RateLimiter()
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, select
+
+
+class StoredResponse:
+    __slots__ = ('request_hash', 'status_code', 'body', 'expires_at')
+
+    def __init__(self, request_hash, status_code, body, expires_at):
+        self.request_hash = request_hash
+        self.status_code = status_code
+        self.body = body
+        self.expires_at = expires_at
+
+
+def request_fingerprint(data):
+    """Stable hash of a JSON request body, independent of key order and spacing."""
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class IdempotencyStore:
+    """Responses of committed requests, keyed by user and ``Idempotency-Key``.
+
+    ``save()`` adds the row to the caller's session so it commits, or rolls
+    back, together with the work it describes. Lookups go through a bounded
+    per-process LRU, then the ``idempotency_key`` table, which every worker
+    shares. Rows older than ``IDEMPOTENCY_TTL`` seconds are ignored and
+    removed by ``purge()``.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 0
+        self.max_size = 0
+        self.max_key_length = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('IDEMPOTENCY_TTL', 24 * 3600)
+        app.config.setdefault('IDEMPOTENCY_CACHE_SIZE', 10000)
+        app.config.setdefault('IDEMPOTENCY_KEY_MAX_LENGTH', 255)
+        self.ttl = app.config['IDEMPOTENCY_TTL']
+        self.max_size = app.config['IDEMPOTENCY_CACHE_SIZE']
+        self.max_key_length = app.config['IDEMPOTENCY_KEY_MAX_LENGTH']
+        self.clear()
+        app.extensions['idempotency'] = self
+
+    def clear(self):
+        with self._lock:
+            self._entries = OrderedDict()
+
+    def _cutoff(self):
+        return datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+
+    def remember(self, user_id, key, entry):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[(user_id, key)] = entry
+            self._entries.move_to_end((user_id, key))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def lookup(self, user_id, key):
+        """Return the ``StoredResponse`` for ``key``, or None if it is unknown or expired."""
+        from extensions import db
+        from models import IdempotencyKey
+
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is not None:
+                self._entries.move_to_end((user_id, key))
+        if entry is not None and entry.expires_at > time.monotonic():
+            return entry
+
+        row = db.session.execute(select(IdempotencyKey).where(
+            IdempotencyKey.user_id == user_id, IdempotencyKey.key == key
+        )).scalar_one_or_none()
+        if row is None:
+            return None
+        created_at = row.created_at.replace(tzinfo=row.created_at.tzinfo or timezone.utc)
+        remaining = self.ttl - (datetime.now(timezone.utc) - created_at).total_seconds()
+        if remaining <= 0:
+            # Free the key for reuse; the delete commits with the caller's transaction
+            db.session.delete(row)
+            return None
+        entry = StoredResponse(row.request_hash, row.status_code, json.loads(row.response_body),
+                               time.monotonic() + remaining)
+        self.remember(user_id, key, entry)
+        return entry
+
+    def save(self, user_id, key, request_hash, status_code, body):
+        """Stage the response in the current transaction and return it.
+
+        Pass the result to ``remember()`` once the transaction has committed.
+        """
+        from extensions import db
+        from models import IdempotencyKey
+
+        db.session.add(IdempotencyKey(
+            user_id=user_id,
+            key=key,
+            request_hash=request_hash,
+            status_code=status_code,
+            response_body=json.dumps(body, separators=(',', ':'), default=str)
+        ))
+        return StoredResponse(request_hash, status_code, body, time.monotonic() + self.ttl)
+
+    def purge(self):
+        """Delete expired rows and cache entries; returns the number of rows deleted."""
+        from extensions import db
+        from models import IdempotencyKey
+
+        now = time.monotonic()
+        with self._lock:
+            self._entries = OrderedDict((k, v) for k, v in self._entries.items() if v.expires_at > now)
+        result = db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < self._cutoff()))
+        db.session.commit()
+        return result.rowcount
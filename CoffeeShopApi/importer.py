@@ -0,0 +1,174 @@
+import csv
+import io
+import json
+import math
+
+from flask_restx import fields
+from sqlalchemy import insert, select, update
+
+from extensions import db
+from models import Coffee
+
+FORMATS = ('csv', 'ndjson')
+MAX_REPORTED_ERRORS = 100
+
+def _integer(value):
+    """``int()`` that rejects booleans and fractions instead of truncating them."""
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, str):
+        try:
+            return int(value.strip())
+        except ValueError:
+            value = float(value)
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(value)
+    return int(value)
+
+
+_CONVERTERS = (
+    (fields.Integer, _integer),
+    (fields.Float, float),
+    (fields.Boolean, lambda value: str(value).strip().lower() in ('1', 'true', 'yes')),
+    (fields.String, str),
+)
+
+
+class RowError(ValueError):
+    pass
+
+
+def detect_format(content_type=None, filename=None):
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    if content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+        return 'ndjson'
+    if filename:
+        if filename.lower().endswith('.csv'):
+            return 'csv'
+        if filename.lower().endswith(('.ndjson', '.jsonl')):
+            return 'ndjson'
+    return None
+
+
+def iter_rows(stream, fmt):
+    """Yield ``(line_number, row)`` pairs from a binary stream, one at a time."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, RowError(f"Invalid JSON: {e}")
+                continue
+            yield line_number, row
+
+
+def validate_row(row, model):
+    if isinstance(row, RowError):
+        raise row
+    if not isinstance(row, dict):
+        raise RowError("Row must be an object")
+
+    values = {}
+    for name, field in model.items():
+        value = row.get(name)
+        if value is None or value == '':
+            if field.required:
+                raise RowError(f"Missing required field: {name}")
+            continue
+        convert = next((c for kind, c in _CONVERTERS if isinstance(field, kind)), str)
+        try:
+            values[name] = convert(value)
+        except (TypeError, ValueError, OverflowError):
+            raise RowError(f"Invalid value for {name}: {value!r}")
+        # Prices and stock: NaN would also render as invalid JSON
+        if isinstance(field, (fields.Integer, fields.Float)) and \
+                not (math.isfinite(values[name]) and values[name] >= 0):
+            raise RowError(f"Invalid value for {name}: {value!r}")
+    return values
+
+
+def _upsert_chunk(chunk):
+    """Upsert ``(line_number, values)`` rows by name in one commit.
+
+    Returns ``(inserted, updated, errors)``; ``errors`` lists the
+    ``(line_number, message)`` rows that were skipped: a name repeated later
+    in the chunk (the last row wins, as across chunks), or a name that
+    several existing coffees share, so there is no single row to update.
+    """
+    by_name = {}
+    errors = []
+    for line_number, values in chunk:
+        previous = by_name.get(values['name'])
+        if previous is not None:
+            errors.append((previous[0], f"Duplicate name {values['name']!r}: superseded by line {line_number}"))
+        by_name[values['name']] = (line_number, values)
+
+    ids = {}
+    for name, coffee_id in db.session.execute(
+        select(Coffee.name, Coffee.id).where(Coffee.name.in_(list(by_name)))
+    ):
+        ids.setdefault(name, []).append(coffee_id)
+    inserts = [values for name, (_, values) in by_name.items() if name not in ids]
+    updates = [dict(values, id=ids[name][0]) for name, (_, values) in by_name.items() if len(ids.get(name, ())) == 1]
+    errors.extend((line_number, f"Ambiguous name: {len(ids[name])} coffees are named {name!r}")
+                  for name, (line_number, _) in by_name.items() if len(ids.get(name, ())) > 1)
+
+    if inserts:
+        db.session.execute(insert(Coffee), inserts)
+    if updates:
+        db.session.execute(update(Coffee), updates)
+    db.session.commit()
+    return len(inserts), len(updates), sorted(errors)
+
+
+def import_coffees(rows, model, chunk_size=1000):
+    """Validate and upsert coffees (matched by name) in chunked bulk statements.
+
+    ``rows`` is an iterable of ``(line_number, row)``. Only one chunk is held
+    in memory at a time and at most ``MAX_REPORTED_ERRORS`` errors are kept.
+    Every full chunk is committed as it is read; if the input turns out not
+    to be UTF-8, the import stops there and the result carries an ``error``
+    next to the counts of what was already imported.
+    """
+    result = {'rows': 0, 'inserted': 0, 'updated': 0, 'error_count': 0, 'errors': []}
+    chunk = []
+    try:
+        for line_number, row in rows:
+            result['rows'] += 1
+            try:
+                chunk.append((line_number, validate_row(row, model)))
+            except RowError as e:
+                _report(result, line_number, str(e))
+                continue
+            if len(chunk) >= chunk_size:
+                _flush(chunk, result)
+    except UnicodeDecodeError:
+        result['error'] = "File must be UTF-8 encoded"
+
+    if chunk:
+        _flush(chunk, result)
+    return result
+
+
+def _report(result, line_number, message):
+    result['error_count'] += 1
+    if len(result['errors']) < MAX_REPORTED_ERRORS:
+        result['errors'].append({'line': line_number, 'error': message})
+
+
+def _flush(chunk, result):
+    inserted, updated, errors = _upsert_chunk(chunk)
+    result['inserted'] += inserted
+    result['updated'] += updated
+    for line_number, message in errors:
+        _report(result, line_number, message)
+    chunk.clear()
@@ -0,0 +1,91 @@
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date, datetime, time
+
+from flask import current_app, make_response
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+BACKENDS = ('auto', 'orjson', 'stdlib')
+
+
+def _default(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson when it is installed, else the stdlib.
+
+    Datetimes are written as ISO 8601 by both backends. Output is compact
+    unless ``compact`` is False, or None with the app in debug mode.
+    """
+
+    sort_keys = False
+    ensure_ascii = False
+
+    def __init__(self, app, backend='auto', compact=None):
+        super().__init__(app)
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown JSON backend: {backend}")
+        if backend == 'orjson' and orjson is None:
+            raise RuntimeError("JSON_BACKEND is 'orjson' but orjson is not installed")
+        self.backend = 'stdlib' if backend == 'stdlib' or orjson is None else 'orjson'
+        self.compact = compact
+
+    def _pretty(self):
+        return self.compact is False or (self.compact is None and self._app.debug)
+
+    def dumps_bytes(self, obj):
+        """Encode ``obj`` to UTF-8 bytes without an intermediate ``str`` when possible."""
+        if self.backend == 'orjson':
+            option = orjson.OPT_NON_STR_KEYS
+            if self._pretty():
+                option |= orjson.OPT_INDENT_2
+            return orjson.dumps(obj, default=_default, option=option)
+        return self.dumps(obj).encode('utf-8')
+
+    def dumps(self, obj, **kwargs):
+        if self.backend == 'orjson' and not kwargs:
+            return self.dumps_bytes(obj).decode('utf-8')
+        kwargs.setdefault('default', _default)
+        kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+        kwargs.setdefault('sort_keys', self.sort_keys)
+        if self._pretty():
+            kwargs.setdefault('indent', 2)
+        else:
+            kwargs.setdefault('separators', (',', ':'))
+        return json.dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+
+def init_app(app):
+    app.config.setdefault('JSON_BACKEND', 'auto')
+    app.config.setdefault('JSON_COMPACT', None)
+    app.json = FastJSONProvider(app, app.config['JSON_BACKEND'], app.config['JSON_COMPACT'])
+
+
+def output_json(data, code, headers=None):
+    """Flask-RESTX representation for ``application/json`` through ``app.json``."""
+    resp = make_response(current_app.json.dumps_bytes(data) + b'\n', code)
+    resp.headers.extend(headers or {})
+    resp.mimetype = 'application/json'
+    return resp
@@ -0,0 +1,169 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+
+REDACTED = '[REDACTED]'
+
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+_listener = None
+_handler = None
+
+
+def configure_defaults(app):
+    app.config['LOG_LEVEL'] = 'INFO'
+    app.config['LOG_QUEUE_SIZE'] = 10000
+    app.config['LOG_SAMPLE_RATES'] = {}
+    app.config['LOG_DEFAULT_SAMPLE_RATE'] = 1.0
+    app.config['LOG_REDACT_FIELDS'] = ('password', 'password_hash', 'access_token', 'token')
+
+
+def redact(value, fields):
+    if isinstance(value, dict):
+        return {key: REDACTED if str(key).lower() in fields else redact(item, fields)
+                for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item, fields) for item in value]
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; runs on the listener thread, so the
+    message, redaction and traceback are built off the request thread."""
+
+    def __init__(self, redact_fields=()):
+        super().__init__()
+        self.redact_fields = {field.lower() for field in redact_fields}
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith('_'):
+                entry[key] = redact(value, self.redact_fields) if key == 'body' else value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RequestContextFilter(logging.Filter):
+    """Tags records with the current request and drops the unsampled ones.
+
+    The sampling decision is made once per request, so a request's records
+    are kept or dropped together. Warnings and errors are always kept.
+    """
+
+    def __init__(self, rates, default_rate):
+        super().__init__()
+        self.rates = dict(rates)
+        self.default_rate = default_rate
+
+    def filter(self, record):
+        if not has_request_context():
+            return True
+        if record.levelno < logging.WARNING and not self._sampled():
+            return False
+        record.method = request.method
+        record.path = request.path
+        record.endpoint = request.endpoint
+        return True
+
+    def _sampled(self):
+        sampled = g.get('_log_sampled')
+        if sampled is None:
+            rate = self.rates.get(request.endpoint, self.default_rate)
+            sampled = g._log_sampled = rate >= 1 or random.random() < rate
+        return sampled
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Enqueues records without formatting them and drops them when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        # Set in forked children; started by the first record (see _restart_in_child)
+        self.pending_listener = None
+
+    def prepare(self, record):
+        # The stock implementation formats the message here, on the caller's thread
+        return copy.copy(record)
+
+    def enqueue(self, record):
+        # emit() runs under the handler lock, so only one caller starts it
+        if self.pending_listener is not None:
+            self.pending_listener.start()
+            self.pending_listener = None
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(app, stream=None):
+    """Route all logging through a bounded queue drained by a background thread.
+
+    Logging is process-wide, so calling this again (another app in the same
+    process) replaces the previous handler and listener.
+    """
+    global _listener, _handler
+    shutdown()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter(app.config['LOG_REDACT_FIELDS']))
+
+    _handler = DroppingQueueHandler(queue.Queue(maxsize=app.config['LOG_QUEUE_SIZE']))
+    _handler.addFilter(RequestContextFilter(app.config['LOG_SAMPLE_RATES'], app.config['LOG_DEFAULT_SAMPLE_RATE']))
+    _listener = QueueListener(_handler.queue, output, respect_handler_level=True)
+
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(app.config['LOG_LEVEL'])
+    _listener.start()
+    app.extensions['log_handler'] = _handler
+
+
+def shutdown():
+    """Flush queued records and detach the queue handler."""
+    global _listener, _handler
+    if _listener is not None:
+        if _handler is not None and _handler.pending_listener is _listener:
+            # Never started, so nothing was queued
+            _handler.pending_listener = None
+        else:
+            _listener.stop()
+        _listener = None
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+        _handler = None
+
+
+def _restart_in_child():
+    # A forked worker (gunicorn --preload) inherits the handler but not the
+    # listener thread; give it a fresh queue and a listener that starts with
+    # the first record, so children that never log (the password-hashing
+    # process pool) do not run an idle thread
+    global _listener
+    if _listener is None:
+        return
+    _handler.queue = queue.Queue(maxsize=_handler.queue.maxsize)
+    _listener = QueueListener(_handler.queue, *_listener.handlers, respect_handler_level=True)
+    _handler.pending_listener = _listener
+
+
+atexit.register(shutdown)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_in_child)
@@ -0,0 +1,338 @@
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+ARCHIVE_FILE = 'archived.json'
+LOCK_FILE = '.archive.lock'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100)
+
+HELP = {
+    'http_requests_total': ('counter', 'Requests by namespace, route, method and status'),
+    'http_request_duration_seconds': ('histogram', 'Request latency by namespace, route and method'),
+    'http_request_sql_statements': ('histogram', 'SQL statements executed per request'),
+    'http_request_sql_seconds': ('histogram', 'Time spent in SQL per request'),
+    'sql_statements_total': ('counter', 'SQL statements executed by route'),
+    'sql_duration_seconds_total': ('counter', 'Time spent in SQL by route'),
+}
+
+_engine_hooks_installed = False
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'metrics_start' in g:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_metrics_started', None)
+    if started is not None and has_request_context() and 'metrics_start' in g:
+        g.metrics_sql_count += 1
+        g.metrics_sql_seconds += time.perf_counter() - started
+
+
+class Metrics:
+    """Per-route request and SQL metrics in Prometheus text format.
+
+    Each process keeps its own counters. With ``METRICS_DIR`` set, every
+    worker also writes them to ``<METRICS_DIR>/metrics-<pid>.json`` and
+    ``/metrics`` sums all the files, so any worker can answer a scrape
+    for the whole server. Totals of workers that have exited are folded
+    into ``<METRICS_DIR>/archived.json`` before their files are deleted, so
+    counters never go down when gunicorn replaces a worker.
+    """
+
+    def __init__(self, app=None):
+        self.directory = None
+        self.flush_interval = 0
+        self.public = False
+        self.allowed_ips = frozenset()
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._last_flush = 0.0
+        self._token = None
+        self._token_pid = None
+        self._claimed = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        global _engine_hooks_installed
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_DIR', os.getenv('METRICS_DIR'))
+        app.config.setdefault('METRICS_FLUSH_INTERVAL', 5)
+        app.config.setdefault('METRICS_PUBLIC', False)
+        app.config.setdefault('METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+        app.extensions['metrics'] = self
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        self.directory = app.config['METRICS_DIR']
+        self.flush_interval = app.config['METRICS_FLUSH_INTERVAL']
+        self.public = app.config['METRICS_PUBLIC']
+        self.allowed_ips = frozenset(app.config['METRICS_ALLOWED_IPS'])
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+        # Run first so the latency covers the other before_request hooks too
+        app.before_request_funcs.setdefault(None, []).insert(0, self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule('/metrics', 'metrics', self._scrape)
+
+        if not _engine_hooks_installed:
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            _engine_hooks_installed = True
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+
+    def inc(self, name, labels, amount=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': list(buckets), 'counts': [0] * len(buckets),
+                                                     'sum': 0, 'count': 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+                    break
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            if self._token_pid != os.getpid():
+                # Each process, forked workers included, writes under its own token
+                self._token = uuid.uuid4().hex
+                self._token_pid = os.getpid()
+            return {
+                'token': self._token,
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, list(labels), dict(h, counts=list(h['counts']))]
+                               for (name, labels), h in self._histograms.items()],
+            }
+
+    def flush(self):
+        """Write this worker's snapshot atomically to ``METRICS_DIR``."""
+        if not self.directory:
+            return
+        snapshot = self.snapshot()
+        path = os.path.join(self.directory, f'metrics-{os.getpid()}.json')
+        if self._claimed != snapshot['token']:
+            # A previous worker with the same pid left its file behind; archive
+            # it before overwriting so its counts are not lost
+            with self._archive_lock():
+                previous = _load(path)
+                if previous is not None and previous.get('token') != snapshot['token']:
+                    self._archive([path], [previous])
+                _write(path, snapshot, self.directory)
+            self._claimed = snapshot['token']
+        else:
+            _write(path, snapshot, self.directory)
+        self._last_flush = time.monotonic()
+
+    def collect(self):
+        """Counters and histograms summed over every worker's snapshot and the archive."""
+        if not self.directory:
+            return _merge([self.snapshot()])
+
+        self.flush()
+        with self._archive_lock():
+            snapshots, dead_paths, dead = [], [], []
+            for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+                snapshot = _load(path)
+                if self._exited(path):
+                    dead_paths.append(path)
+                    if snapshot is not None:
+                        dead.append(snapshot)
+                elif snapshot is not None:
+                    snapshots.append(snapshot)
+            if dead_paths:
+                self._archive(dead_paths, dead)
+            archive = _load(os.path.join(self.directory, ARCHIVE_FILE))
+        if archive is not None:
+            snapshots.append(archive)
+        return _merge(snapshots)
+
+    def _archive(self, paths, snapshots):
+        """Fold exited workers' totals into the archive, then delete their files.
+
+        Every series here is a counter or a histogram, so nothing is dropped;
+        summed totals never go down when a worker is replaced.
+        """
+        archive_path = os.path.join(self.directory, ARCHIVE_FILE)
+        archive = _load(archive_path)
+        if archive is not None:
+            snapshots = [archive] + snapshots
+        _write(archive_path, _dump(*_merge(snapshots)), self.directory)
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @contextmanager
+    def _archive_lock(self):
+        # Workers scrape concurrently; only one may archive a dead worker's file
+        with open(os.path.join(self.directory, LOCK_FILE), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _exited(self, path):
+        """Whether the worker that wrote ``path`` is gone."""
+        try:
+            pid = int(os.path.basename(path)[len('metrics-'):-len('.json')])
+        except ValueError:
+            return True
+        if pid == os.getpid():
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            # Alive, owned by another user
+            pass
+        return False
+
+    def render(self):
+        counters, histograms = self.collect()
+        lines = []
+        for name, (kind, text) in HELP.items():
+            series = sorted((labels, value) for (n, labels), value in
+                            (counters if kind == 'counter' else histograms).items() if n == name)
+            if not series:
+                continue
+            lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in series:
+                if kind == 'counter':
+                    lines.append(f'{name}{_labels(labels)} {value}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(value['buckets'], value['counts']):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", _number(bound)),))} {cumulative}')
+                lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {value["count"]}')
+                lines.append(f'{name}_sum{_labels(labels)} {value["sum"]}')
+                lines.append(f'{name}_count{_labels(labels)} {value["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def _start_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_sql_count = 0
+        g.metrics_sql_seconds = 0.0
+
+    def _finish_request(self, response):
+        if 'metrics_start' not in g:
+            return response
+        elapsed = time.perf_counter() - g.metrics_start
+        if request.url_rule is not None:
+            route = request.url_rule.rule
+            namespace = route.strip('/').split('/')[0] or 'root'
+        else:
+            route = namespace = 'unmatched'
+        labels = {'namespace': namespace, 'route': route, 'method': request.method}
+
+        self.inc('http_requests_total', dict(labels, status=str(response.status_code)))
+        self.observe('http_request_duration_seconds', labels, elapsed, LATENCY_BUCKETS)
+        self.observe('http_request_sql_statements', labels, g.metrics_sql_count, STATEMENT_BUCKETS)
+        self.observe('http_request_sql_seconds', labels, g.metrics_sql_seconds, LATENCY_BUCKETS)
+        self.inc('sql_statements_total', labels, g.metrics_sql_count)
+        self.inc('sql_duration_seconds_total', labels, g.metrics_sql_seconds)
+
+        if self.directory and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+        return response
+
+    def _authorized(self):
+        if self.public or request.remote_addr in self.allowed_ips:
+            return True
+        try:
+            verify_jwt_in_request()
+        except Exception:
+            return False
+        return bool(get_jwt().get('is_admin', False))
+
+    def _scrape(self):
+        if not self._authorized():
+            return {"error": "Metrics are restricted to allowed addresses and admins"}, 403
+        return Response(self.render(), mimetype=None, content_type=CONTENT_TYPE)
+
+
+def _load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write(path, snapshot, directory):
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.metrics-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp, path)
+
+
+def _merge(snapshots):
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, h in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, {'buckets': h['buckets'], 'counts': [0] * len(h['buckets']),
+                                                 'sum': 0, 'count': 0})
+            merged['counts'] = [a + b for a, b in zip(merged['counts'], h['counts'])]
+            merged['sum'] += h['sum']
+            merged['count'] += h['count']
+    return counters, histograms
+
+
+def _dump(counters, histograms):
+    return {
+        'counters': [[name, [list(pair) for pair in labels], value] for (name, labels), value in counters.items()],
+        'histograms': [[name, [list(pair) for pair in labels], h] for (name, labels), h in histograms.items()],
+    }
+
+
+def _number(value):
+    return repr(float(value))
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
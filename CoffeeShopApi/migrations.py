@@ -0,0 +1,148 @@
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from sqlalchemy import (Column, Date, DateTime, Float, ForeignKey, Index, Integer, MetaData, String, Table, Text,
+                        insert, select, text)
+
+Migration = namedtuple('Migration', ('version', 'description', 'apply'))
+
+MIGRATIONS = []
+
+schema_migrations = Table(
+    'schema_migrations', MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+
+def migration(version, description):
+    """Register an upgrade step.
+
+    Steps run in version order, each in its own transaction, and must be
+    idempotent: a database built by ``db.create_all()`` already has the
+    objects they create. A step spells out its schema as it was at that
+    version, in SQL or its own ``Table`` objects, never through the live
+    models, so changing a model later cannot change an applied step.
+    """
+    def decorator(fn):
+        MIGRATIONS.append(Migration(version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return fn
+    return decorator
+
+
+def applied_versions(engine):
+    with engine.begin() as conn:
+        schema_migrations.create(conn, checkfirst=True)
+        return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def pending(engine):
+    applied = applied_versions(engine)
+    return [m for m in MIGRATIONS if m.version not in applied]
+
+
+def _frozen_metadata(*referenced):
+    """A MetaData for one step's tables, with bare ``referenced`` tables so foreign keys resolve."""
+    metadata = MetaData()
+    for name in referenced:
+        Table(name, metadata, Column('id', Integer, primary_key=True))
+    return metadata
+
+
+def upgrade(engine):
+    """Apply every pending migration and return the ones that ran."""
+    ran = []
+    for step in pending(engine):
+        with engine.begin() as conn:
+            step.apply(conn)
+            conn.execute(insert(schema_migrations).values(
+                version=step.version,
+                description=step.description,
+                applied_at=datetime.now(timezone.utc)
+            ))
+        ran.append(step)
+    return ran
+
+
+@migration(1, 'Indexes for purchase history, per-coffee and date-range queries and coffee name lookups')
+def _hot_query_indexes(conn):
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_purchase_user_id_id ON purchase (user_id, id)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_purchase_coffee_id_created_at ON purchase (coffee_id, created_at)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_purchase_created_at ON purchase (created_at)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_coffee_name ON coffee (name)'))
+
+
+@migration(2, 'Daily sales rollup table, backfilled from existing purchases')
+def _sales_daily(conn):
+    from rollups import backfill_sales_daily
+
+    sales_daily = Table(
+        'sales_daily', _frozen_metadata('coffee'),
+        Column('day', Date, primary_key=True),
+        Column('coffee_id', Integer, ForeignKey('coffee.id'), primary_key=True),
+        Column('units', Integer, nullable=False),
+        Column('revenue', Float, nullable=False),
+        Column('purchase_count', Integer, nullable=False),
+        Index('ix_sales_daily_coffee_id_day', 'coffee_id', 'day')
+    )
+    sales_daily.create(conn, checkfirst=True)
+    for index in sales_daily.indexes:
+        index.create(conn, checkfirst=True)
+    backfill_sales_daily(conn)
+
+
+@migration(3, 'Per-user purchase summary table, backfilled from existing purchases')
+def _user_purchase_summary(conn):
+    from rollups import backfill_user_summaries
+
+    Table(
+        'user_purchase_summary', _frozen_metadata('user'),
+        Column('user_id', Integer, ForeignKey('user.id'), primary_key=True),
+        Column('purchase_count', Integer, nullable=False),
+        Column('units', Integer, nullable=False),
+        Column('total_spent', Float, nullable=False),
+        Column('last_purchase_at', DateTime)
+    ).create(conn, checkfirst=True)
+    backfill_user_summaries(conn)
+
+
+@migration(4, 'Indexes for catalog price, in-stock and name filters')
+def _catalog_indexes(conn):
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_coffee_name ON coffee (name)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_coffee_price_id ON coffee (price, id)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_coffee_in_stock ON coffee (id) WHERE stock > 0'))
+
+
+@migration(5, 'Full-text search index over coffee name and description')
+def _coffee_fts(conn):
+    from models import create_coffee_fts
+
+    create_coffee_fts(conn, rebuild=True)
+
+
+@migration(6, 'Stored responses for Idempotency-Key retries')
+def _idempotency_keys(conn):
+    idempotency_key = Table(
+        'idempotency_key', _frozen_metadata('user'),
+        Column('user_id', Integer, ForeignKey('user.id'), primary_key=True),
+        Column('key', String(255), primary_key=True),
+        Column('request_hash', String(64), nullable=False),
+        Column('status_code', Integer, nullable=False),
+        Column('response_body', Text, nullable=False),
+        Column('created_at', DateTime, nullable=False),
+        Index('ix_idempotency_key_created_at', 'created_at')
+    )
+    idempotency_key.create(conn, checkfirst=True)
+    for index in idempotency_key.indexes:
+        index.create(conn, checkfirst=True)
+
+
+@migration(7, 'Read-your-writes markers shared by every worker for replica routing')
+def _recent_writes(conn):
+    Table(
+        'recent_write', _frozen_metadata(),
+        Column('key', String(100), primary_key=True),
+        Column('expires_at', Float, nullable=False)
+    ).create(conn, checkfirst=True)
@@ -1,6 +1,25 @@
-from extensions import db
+from extensions import db, hasher
+from sqlalchemy import case, event, select, update
 from datetime import datetime, timezone
-from werkzeug.security import generate_password_hash, check_password_hash
+
+
+def naive_utc(value):
+    """Convert an aware datetime to naive UTC, the way timestamps are stored; naive values are kept."""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def isoformat_utc(value):
+    """Serialize a timestamp as naive UTC ISO 8601, the way the database returns it.
+    
+    Rows built in this request still hold the aware datetime from the column
+    default; rows read back from SQLite are naive. Both come out the same.
+    """
+    if value is None:
+        return None
+    return naive_utc(value).isoformat()
+
 
 class User(db.Model):
     __tablename__ = 'user'
@@ -14,13 +33,21 @@ class User(db.Model):
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hasher.hash(password)
         
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return hasher.verify(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        return hasher.needs_rehash(self.password_hash)
 
 class Coffee(db.Model):
     __tablename__ = 'coffee'
+    __table_args__ = (
+        db.Index('ix_coffee_name', 'name'),
+        db.Index('ix_coffee_price_id', 'price', 'id'),
+        db.Index('ix_coffee_in_stock', 'id', sqlite_where=db.text('stock > 0'), postgresql_where=db.text('stock > 0')),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -29,9 +56,103 @@ class Coffee(db.Model):
     stock = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    
+    @classmethod
+    def reserve_stock(cls, coffee_id, quantity):
+        """Atomically take ``quantity`` units from stock.
+        
+        Runs a single guarded ``UPDATE ... WHERE stock >= :q`` so concurrent
+        buyers can never oversell. Returns ``(name, price)`` of the coffee, or
+        ``None`` when it does not exist or has too little stock.
+        """
+        stmt = update(cls).where(cls.id == coffee_id, cls.stock >= quantity) \
+            .values(stock=cls.stock - quantity) \
+            .execution_options(synchronize_session=False)
+        
+        if db.session.get_bind().dialect.update_returning:
+            row = db.session.execute(stmt.returning(cls.name, cls.price)).first()
+        elif db.session.execute(stmt).rowcount != 1:
+            return None
+        else:
+            row = db.session.execute(select(cls.name, cls.price).where(cls.id == coffee_id)).first()
+        if row is None:
+            return None
+        # SQLite hands back an integral REAL from RETURNING as an int
+        return row.name, float(row.price)
+    
+    @classmethod
+    def reserve_stock_many(cls, quantities):
+        """Atomically take stock for several coffees in one ``UPDATE``.
+        
+        ``quantities`` maps coffee id to units. Returns a dict of coffee id to
+        ``(name, price)`` when every line could be reserved, otherwise ``None``
+        and the caller must roll back.
+        """
+        requested = case(quantities, value=cls.id)
+        stmt = update(cls).where(cls.id.in_(quantities), cls.stock >= requested) \
+            .values(stock=cls.stock - requested) \
+            .execution_options(synchronize_session=False)
+        
+        if db.session.get_bind().dialect.update_returning:
+            rows = db.session.execute(stmt.returning(cls.id, cls.name, cls.price)).all()
+            if len(rows) != len(quantities):
+                return None
+        else:
+            if db.session.execute(stmt).rowcount != len(quantities):
+                return None
+            rows = db.session.execute(select(cls.id, cls.name, cls.price).where(cls.id.in_(quantities))).all()
+        return {coffee_id: (name, float(price)) for coffee_id, name, price in rows}
+
+COFFEE_FTS_TABLE = 'coffee_fts'
+
+# External-content FTS5 index over coffee name and description. The triggers
+# keep it in step with every write to ``coffee``, including bulk imports;
+# stock-only updates (purchases) do not touch it.
+COFFEE_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS coffee_fts USING fts5("
+    "name, description, content='coffee', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS coffee_fts_ai AFTER INSERT ON coffee BEGIN "
+    "INSERT INTO coffee_fts (rowid, name, description) VALUES (new.id, new.name, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS coffee_fts_ad AFTER DELETE ON coffee BEGIN "
+    "INSERT INTO coffee_fts (coffee_fts, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS coffee_fts_au AFTER UPDATE OF name, description ON coffee BEGIN "
+    "INSERT INTO coffee_fts (coffee_fts, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); "
+    "INSERT INTO coffee_fts (rowid, name, description) VALUES (new.id, new.name, new.description); END",
+)
+
+def supports_fts(conn):
+    if conn.dialect.name != 'sqlite':
+        return False
+    return bool(conn.exec_driver_sql("SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar())
+
+def create_coffee_fts(conn, rebuild=False):
+    """Create the coffee search index and its triggers where FTS5 is available."""
+    if not supports_fts(conn):
+        return False
+    for statement in COFFEE_FTS_DDL:
+        conn.exec_driver_sql(statement)
+    if rebuild:
+        conn.exec_driver_sql("INSERT INTO coffee_fts (coffee_fts) VALUES ('rebuild')")
+    return True
+
+@event.listens_for(Coffee.__table__, 'after_create')
+def _after_coffee_create(target, connection, **kw):
+    create_coffee_fts(connection)
+
+@event.listens_for(Coffee.__table__, 'before_drop')
+def _before_coffee_drop(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql('DROP TABLE IF EXISTS coffee_fts')
 
 class Purchase(db.Model):
     __tablename__ = 'purchase'
+    __table_args__ = (
+        db.Index('ix_purchase_user_id_id', 'user_id', 'id'),
+        db.Index('ix_purchase_coffee_id_created_at', 'coffee_id', 'created_at'),
+        db.Index('ix_purchase_created_at', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -42,4 +163,52 @@ class Purchase(db.Model):
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
     
     user = db.relationship('User', backref=db.backref('purchases', lazy=True))
-    coffee = db.relationship('Coffee', backref=db.backref('purchases', lazy=True)) 
\ No newline at end of file
+    coffee = db.relationship('Coffee', backref=db.backref('purchases', lazy=True))
+
+
+class SalesDaily(db.Model):
+    """Units and revenue per coffee per UTC day, kept in step with ``Purchase``."""
+    __tablename__ = 'sales_daily'
+    __table_args__ = (
+        db.Index('ix_sales_daily_coffee_id_day', 'coffee_id', 'day'),
+    )
+    
+    day = db.Column(db.Date, primary_key=True)
+    coffee_id = db.Column(db.Integer, db.ForeignKey('coffee.id'), primary_key=True)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    purchase_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class UserPurchaseSummary(db.Model):
+    """Running purchase totals per user, kept in step with ``Purchase``."""
+    __tablename__ = 'user_purchase_summary'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    purchase_count = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    total_spent = db.Column(db.Float, nullable=False, default=0.0)
+    last_purchase_at = db.Column(db.DateTime)
+
+
+class IdempotencyKey(db.Model):
+    """Committed response of a request sent with an ``Idempotency-Key`` header, per user."""
+    __tablename__ = 'idempotency_key'
+    __table_args__ = (
+        db.Index('ix_idempotency_key_created_at', 'created_at'),
+    )
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer, nullable=False)
+    response_body = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+
+class RecentWrite(db.Model):
+    """Until when reads of a key (a user's purchases, the catalog) must skip the read replica."""
+    __tablename__ = 'recent_write'
+    
+    key = db.Column(db.String(100), primary_key=True)
+    expires_at = db.Column(db.Float, nullable=False)
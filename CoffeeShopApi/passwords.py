@@ -0,0 +1,121 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from flask import current_app
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+def canonical_method(method):
+    """Expand a Werkzeug hash method to the exact prefix it writes, e.g. ``scrypt`` -> ``scrypt:32768:8:1``."""
+    name, *args = method.split(':')
+    if name == 'scrypt' and not args:
+        return f'scrypt:{2 ** 15}:8:1'
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = args[1] if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    return method
+
+
+class HasherBusy(Exception):
+    """The process pool did not finish a hash within ``PASSWORD_HASH_TIMEOUT`` seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__("Password hashing is busy, try again later")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords with the cost configured on the app.
+
+    With ``PASSWORD_HASH_WORKERS > 0`` the CPU-heavy work runs in a bounded
+    process pool instead of on the request thread. When the pool is saturated
+    and a hash takes longer than ``PASSWORD_HASH_TIMEOUT``, ``HasherBusy``
+    is raised so the view can answer 503 instead of 500.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt')
+        app.config.setdefault('PASSWORD_HASH_SALT_LENGTH', 16)
+        app.config.setdefault('PASSWORD_HASH_WORKERS', 0)
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 30)
+        app.config.setdefault('PASSWORD_HASH_RETRY_AFTER', 5)
+        app.extensions['password_hasher'] = self
+
+    def _pool(self):
+        workers = current_app.config['PASSWORD_HASH_WORKERS']
+        if not workers:
+            return None
+        # A pool inherited through fork (e.g. gunicorn preload) is unusable in the child
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(max_workers=workers)
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _run(self, fn, *args):
+        pool = self._pool()
+        if pool is None:
+            return fn(*args)
+        return self._result(pool.submit(fn, *args))
+
+    def _result(self, future):
+        config = current_app.config
+        try:
+            return future.result(timeout=config['PASSWORD_HASH_TIMEOUT'])
+        except FutureTimeout:
+            # Drop it if still queued; a hash already running finishes unseen
+            future.cancel()
+            raise HasherBusy(config['PASSWORD_HASH_RETRY_AFTER']) from None
+
+    def hash(self, password):
+        config = current_app.config
+        return self._run(generate_password_hash, password,
+                         config['PASSWORD_HASH_METHOD'], config['PASSWORD_HASH_SALT_LENGTH'])
+
+    def hash_many(self, passwords):
+        """Hash a batch of passwords in parallel.
+
+        Uses the process pool when configured, otherwise a short-lived thread
+        pool (hashlib's scrypt and pbkdf2 release the GIL).
+        """
+        config = current_app.config
+        args = (config['PASSWORD_HASH_METHOD'], config['PASSWORD_HASH_SALT_LENGTH'])
+        pool = self._pool()
+        if pool is not None:
+            futures = [pool.submit(generate_password_hash, password, *args) for password in passwords]
+            try:
+                return [self._result(future) for future in futures]
+            except HasherBusy:
+                for future in futures:
+                    future.cancel()
+                raise
+        if len(passwords) < 2:
+            return [generate_password_hash(password, *args) for password in passwords]
+        with ThreadPoolExecutor(max_workers=min(len(passwords), os.cpu_count() or 1)) as threads:
+            return list(threads.map(lambda password: generate_password_hash(password, *args), passwords))
+
+    def verify(self, pwhash, password):
+        if not pwhash:
+            return False
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        method = pwhash.split('$', 1)[0]
+        return method != canonical_method(current_app.config['PASSWORD_HASH_METHOD'])
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._executor_pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._executor_pid = None
@@ -0,0 +1,129 @@
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db, hasher
+from models import User
+
+REQUIRED_FIELDS = ('username', 'email', 'password')
+
+FIELD_TYPE_MESSAGE = "Username, email and password must be strings"
+
+
+def has_string_fields(data):
+    """Whether every required field of ``data`` is a string (lists or objects would crash the queries)."""
+    return all(isinstance(data[k], str) for k in REQUIRED_FIELDS)
+
+
+def find_duplicate(username, email):
+    """Return the first clashing field (``'username'`` or ``'email'``) in one query, or ``None``."""
+    rows = db.session.execute(
+        select(User.username, User.email).where(or_(User.username == username, User.email == email)).limit(2)
+    ).all()
+    if any(row.username == username for row in rows):
+        return 'username'
+    if rows:
+        return 'email'
+    return None
+
+
+def duplicate_field(error):
+    """Map a unique-constraint ``IntegrityError`` on ``user`` to the clashing field."""
+    message = str(error.orig).lower()
+    for field in ('username', 'email'):
+        if field in message:
+            return field
+    return None
+
+
+def duplicate_message(field):
+    if field == 'username':
+        return "Username already exists"
+    if field == 'email':
+        return "Email already exists"
+    return "Username or email already exists"
+
+
+def _existing(column, values):
+    if not values:
+        return set()
+    return set(db.session.execute(select(column).where(column.in_(values))).scalars())
+
+
+def _insert_batch(rows, result):
+    try:
+        db.session.execute(insert(User), [values for _, values in rows])
+        db.session.commit()
+        result['created'] += len(rows)
+        return
+    except IntegrityError:
+        db.session.rollback()
+
+    # Someone registered a clashing user meanwhile; retry row by row to isolate it
+    for index, values in rows:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(User), [values])
+            result['created'] += 1
+        except IntegrityError as e:
+            result['errors'].append({'index': index, 'username': values['username'],
+                                     'error': duplicate_message(duplicate_field(e))})
+    db.session.commit()
+
+
+def _valid_entries(entries, reject):
+    """``(index, entry)`` pairs that are complete and unique within the request; ``reject`` gets the rest."""
+    seen_usernames, seen_emails = set(), set()
+    valid = []
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict) or not all(entry.get(k) for k in REQUIRED_FIELDS):
+            reject(index, entry, "Missing required fields")
+        elif not has_string_fields(entry):
+            reject(index, entry, FIELD_TYPE_MESSAGE)
+        elif entry['username'] in seen_usernames:
+            reject(index, entry, "Duplicate username in request")
+        elif entry['email'] in seen_emails:
+            reject(index, entry, "Duplicate email in request")
+        else:
+            seen_usernames.add(entry['username'])
+            seen_emails.add(entry['email'])
+            valid.append((index, entry))
+    return valid
+
+
+def provision_users(entries, batch_size=500):
+    """Create many users: validate, check uniqueness per batch, hash in parallel, bulk insert."""
+    result = {'created': 0, 'errors': []}
+
+    def reject(index, entry, message):
+        username = entry.get('username') if isinstance(entry, dict) else None
+        username = username if isinstance(username, str) else None
+        result['errors'].append({'index': index, 'username': username, 'error': message})
+
+    valid = _valid_entries(entries, reject)
+    for start in range(0, len(valid), batch_size):
+        batch = valid[start:start + batch_size]
+        taken_usernames = _existing(User.username, [entry['username'] for _, entry in batch])
+        taken_emails = _existing(User.email, [entry['email'] for _, entry in batch])
+
+        fresh = []
+        for index, entry in batch:
+            if entry['username'] in taken_usernames:
+                reject(index, entry, duplicate_message('username'))
+            elif entry['email'] in taken_emails:
+                reject(index, entry, duplicate_message('email'))
+            else:
+                fresh.append((index, entry))
+        if not fresh:
+            continue
+
+        hashes = hasher.hash_many([entry['password'] for _, entry in fresh])
+        rows = [(index, {
+            'username': entry['username'],
+            'email': entry['email'],
+            'password_hash': password_hash,
+            'is_admin': bool(entry.get('is_admin', False))
+        }) for (index, entry), password_hash in zip(fresh, hashes)]
+        _insert_batch(rows, result)
+
+    result['errors'].sort(key=lambda error: error['index'])
+    return result
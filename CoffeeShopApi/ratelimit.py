@@ -0,0 +1,276 @@
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import ExitStack
+
+from flask import request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from sqlalchemy import Column, Float, MetaData, String, Table, create_engine, event, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+
+logger = logging.getLogger(__name__)
+
+# endpoint -> [(key, limit, period in seconds)]; a bucket holds ``limit``
+# tokens and refills at ``limit / period`` per second
+DEFAULT_RULES = {
+    'auth_login': [('ip', 30, 60), ('username', 10, 60)],
+    'auth_register': [('ip', 10, 60)],
+    'auth_bulk_register': [('user', 5, 60)],
+    'purchase_purchase_list': [('user', 60, 60), ('ip', 300, 60)],
+    'purchase_cart': [('user', 30, 60), ('ip', 150, 60)],
+}
+
+KEYS = ('ip', 'username', 'user')
+
+_STRIPES = 64
+
+
+def _wait(rules, tokens):
+    """Seconds until every bucket has a token, or 0 when all of them have one now."""
+    return max([(1 - t) / rate for (_, _, rate), t in zip(rules, tokens) if t < 1], default=0)
+
+
+class MemoryBuckets:
+    """Per-process token buckets split into lock stripes, each with its own LRU.
+
+    A request only locks the stripes of its own keys, so unrelated clients
+    rarely contend. A full stripe evicts its least recently used bucket, so
+    a client that keeps hitting a limit stays throttled.
+    """
+
+    def __init__(self, max_keys):
+        self.max_keys = max(1, max_keys // _STRIPES)
+        self._stripes = [(threading.Lock(), OrderedDict()) for _ in range(_STRIPES)]
+
+    def take_all(self, rules):
+        """Take one token from each ``(key, capacity, rate)`` bucket, or from none.
+
+        Returns 0 when the request is allowed, else the seconds until it would be.
+        """
+        indexes = [hash(key) % _STRIPES for key, _, _ in rules]
+        with ExitStack() as stack:
+            # Sorted, so two requests never wait on each other's stripes
+            for index in sorted(set(indexes)):
+                stack.enter_context(self._stripes[index][0])
+            now = time.monotonic()
+            tokens = []
+            for (key, capacity, rate), index in zip(rules, indexes):
+                buckets = self._stripes[index][1]
+                bucket = buckets.get(key)
+                if bucket is not None:
+                    # Denied requests count as use too
+                    buckets.move_to_end(key)
+                tokens.append(capacity if bucket is None else min(capacity, bucket[0] + (now - bucket[1]) * rate))
+            wait = _wait(rules, tokens)
+            if wait:
+                return wait
+            for (key, _, _), index, available in zip(rules, indexes, tokens):
+                buckets = self._stripes[index][1]
+                if key not in buckets and len(buckets) >= self.max_keys:
+                    buckets.popitem(last=False)
+                buckets[key] = [available - 1, now]
+            return 0
+
+    def clear(self):
+        for lock, buckets in self._stripes:
+            with lock:
+                buckets.clear()
+
+
+_INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+class SQLBuckets:
+    """Token buckets in a database table shared by every worker (SQLite or PostgreSQL).
+
+    Each check is one short transaction that locks the request's rows:
+    ``BEGIN IMMEDIATE`` on SQLite, ``SELECT ... FOR UPDATE`` on PostgreSQL.
+    SQLite connections get the app's ``SQLITE_PRAGMAS``, so waiting workers
+    honour its ``busy_timeout``.
+
+    A bucket untouched for ``idle_after`` seconds (the longest rule period)
+    has refilled and holds no state, so at most every ``prune_interval``
+    seconds each process deletes such rows. The table is created by
+    ``init-db``/``db-upgrade`` or on first use, never at app creation.
+    """
+
+    def __init__(self, uri, pragmas=None, idle_after=60, prune_interval=60):
+        import database
+
+        self.engine = create_engine(uri)
+        if self.engine.dialect.name not in _INSERTS:
+            raise ValueError(f"Unsupported rate limit storage: {self.engine.dialect.name}")
+        if self.engine.dialect.name == 'sqlite':
+            database.apply_sqlite_pragmas(self.engine, pragmas)
+            event.listen(self.engine, 'connect', _sqlite_manual_transactions)
+            event.listen(self.engine, 'begin', _sqlite_begin_immediate)
+        self.idle_after = idle_after
+        self.prune_interval = prune_interval
+        self._next_prune = 0
+        self._created = False
+        self._metadata = MetaData()
+        self.table = Table(
+            'rate_limit_bucket', self._metadata,
+            Column('key', String(300), primary_key=True),
+            Column('tokens', Float, nullable=False),
+            Column('updated_at', Float, nullable=False)
+        )
+
+    def create_table(self):
+        self._metadata.create_all(self.engine)
+        self._created = True
+
+    def take_all(self, rules):
+        if not self._created:
+            self.create_table()
+        table = self.table
+        insert = _INSERTS[self.engine.dialect.name]
+        keys = [key for key, _, _ in rules]
+        with self.engine.begin() as conn:
+            now = time.time()
+            conn.execute(insert(table).on_conflict_do_nothing(index_elements=['key']), [
+                {'key': key, 'tokens': float(capacity), 'updated_at': now} for key, capacity, _ in rules
+            ])
+            stored = {row.key: row for row in conn.execute(
+                select(table).where(table.c.key.in_(keys)).order_by(table.c.key).with_for_update()
+            )}
+            # A row pruned by another worker in the meantime was a full bucket
+            tokens = [capacity if key not in stored
+                      else min(capacity, stored[key].tokens + (now - stored[key].updated_at) * rate)
+                      for key, capacity, rate in rules]
+            wait = _wait(rules, tokens)
+            if not wait:
+                upsert = insert(table)
+                conn.execute(upsert.on_conflict_do_update(index_elements=['key'], set_={
+                    'tokens': upsert.excluded.tokens, 'updated_at': upsert.excluded.updated_at
+                }), [{'key': key, 'tokens': available - 1, 'updated_at': now} for key, available in zip(keys, tokens)])
+        if now >= self._next_prune:
+            self._next_prune = now + self.prune_interval
+            self.prune(now)
+        return wait
+
+    def prune(self, now=None):
+        """Delete buckets idle long enough to have refilled; returns how many went."""
+        cutoff = (time.time() if now is None else now) - self.idle_after
+        with self.engine.begin() as conn:
+            return conn.execute(self.table.delete().where(self.table.c.updated_at < cutoff)).rowcount
+
+    def clear(self):
+        if not self._created and not inspect(self.engine).has_table(self.table.name):
+            return
+        with self.engine.begin() as conn:
+            conn.execute(self.table.delete())
+
+
+def _sqlite_manual_transactions(dbapi_connection, connection_record):
+    # Let SQLAlchemy's begin event open the transaction instead of pysqlite
+    dbapi_connection.isolation_level = None
+
+
+def _sqlite_begin_immediate(conn):
+    # Take the write lock up front; a deferred transaction could fail to upgrade it
+    conn.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+class RateLimiter:
+    """Token-bucket limits per endpoint, checked before the view runs.
+
+    ``RATELIMIT_RULES`` maps endpoint names to ``(key, limit, period)``
+    rules, where key is the client ``ip``, the ``username`` in a JSON body
+    or the JWT ``user`` id. Only ``RATELIMIT_METHODS`` are limited. Buckets
+    live in this process unless ``RATELIMIT_STORAGE_URI`` names a database
+    shared by every worker; if that database fails, requests are let through.
+    Idle rows there are pruned every ``RATELIMIT_PRUNE_INTERVAL`` seconds.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.rules = {}
+        self.methods = frozenset()
+        self.storage = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+        app.config.setdefault('RATELIMIT_RULES', DEFAULT_RULES)
+        app.config.setdefault('RATELIMIT_METHODS', ('POST', 'PUT', 'PATCH', 'DELETE'))
+        app.config.setdefault('RATELIMIT_STORAGE_URI', None)
+        app.config.setdefault('RATELIMIT_MAX_KEYS', 100000)
+        app.config.setdefault('RATELIMIT_PRUNE_INTERVAL', 60)
+        self.enabled = app.config['RATELIMIT_ENABLED']
+        self.methods = frozenset(app.config['RATELIMIT_METHODS'])
+        self.rules = {}
+        for endpoint, rules in app.config['RATELIMIT_RULES'].items():
+            for key, limit, period in rules:
+                if key not in KEYS:
+                    raise ValueError(f"Unknown rate limit key: {key}")
+                if limit < 1 or period <= 0:
+                    raise ValueError(f"Invalid rate limit for {endpoint}: {limit}/{period}s")
+            self.rules[endpoint] = [(key, limit, limit / period) for key, limit, period in rules]
+        uri = app.config['RATELIMIT_STORAGE_URI']
+        if uri:
+            idle_after = max([limit / rate for rules in self.rules.values() for _, limit, rate in rules], default=0)
+            self.storage = SQLBuckets(uri, app.config.get('SQLITE_PRAGMAS'), idle_after,
+                                      app.config['RATELIMIT_PRUNE_INTERVAL'])
+        else:
+            self.storage = MemoryBuckets(app.config['RATELIMIT_MAX_KEYS'])
+        app.extensions['ratelimiter'] = self
+        if self.enabled:
+            app.before_request(self._check)
+
+    def create_storage(self):
+        """Create the shared bucket table, if buckets are stored in a database."""
+        if isinstance(self.storage, SQLBuckets):
+            self.storage.create_table()
+
+    def reset(self):
+        if self.storage is not None:
+            self.storage.clear()
+
+    def _identity(self, key):
+        if key == 'ip':
+            return request.remote_addr
+        if key == 'username':
+            data = request.get_json(silent=True)
+            username = data.get('username') if isinstance(data, dict) else None
+            return username.lower() if isinstance(username, str) and username else None
+        try:
+            verify_jwt_in_request(optional=True)
+            return get_jwt_identity()
+        except Exception:
+            # The view reports the bad token; there is no user to limit yet
+            return None
+
+    def _check(self):
+        if request.method not in self.methods:
+            return None
+        rules = self.rules.get(request.endpoint)
+        if not rules:
+            return None
+
+        # Every rule is checked before any bucket is spent, so a request
+        # denied by one rule does not drain the others
+        buckets = []
+        for key, limit, rate in rules:
+            identity = self._identity(key)
+            if identity is not None:
+                buckets.append((f'{request.endpoint}:{key}:{identity}', limit, rate))
+        if not buckets:
+            return None
+        try:
+            retry_after = self.storage.take_all(buckets)
+        except SQLAlchemyError:
+            logger.exception("Rate limit storage failed; allowing request")
+            return None
+
+        if retry_after:
+            logger.warning("Rate limit exceeded for %s", request.endpoint)
+            return {"error": "Too many requests"}, 429, {'Retry-After': str(math.ceil(retry_after))}
+        return None
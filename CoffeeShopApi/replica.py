@@ -0,0 +1,219 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, request
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy.session import Session
+from sqlalchemy import insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_BIND = 'replica'
+
+_UPSERT_INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+class RoutingSession(Session):
+    """Session that sends reads to the replica bind when the request asked for it.
+
+    Writes, flushes and explicit binds always go to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and not isinstance(clause, UpdateBase)
+                and has_app_context() and current_app.extensions['replica_router'].reads_from_replica()):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouter:
+    """Routes GET requests to a read replica, except within the
+    read-your-writes window that follows a user's own write.
+
+    ``record_write()`` stores the end of the window in the primary's
+    ``recent_write`` table, so whichever worker serves the follow-up read
+    sees it. Each process remembers the deadlines it has written or looked
+    up, and for ``REPLICA_MISS_TTL`` seconds that a key had no live marker,
+    so most replica reads skip the primary lookup. Without a replica nothing
+    is recorded.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.window = 0
+        self.max_tracked = 0
+        self.miss_ttl = 0
+        self._lock = threading.Lock()
+        self._recent = {}
+        self._misses = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQLALCHEMY_REPLICA_URI', os.getenv('REPLICA_DATABASE_URL'))
+        app.config.setdefault('REPLICA_READ_YOUR_WRITES_WINDOW', 5)
+        app.config.setdefault('REPLICA_MAX_TRACKED_WRITERS', 100000)
+        app.config.setdefault('REPLICA_MISS_TTL', 1)
+        self.window = app.config['REPLICA_READ_YOUR_WRITES_WINDOW']
+        self.max_tracked = app.config['REPLICA_MAX_TRACKED_WRITERS']
+        self.miss_ttl = app.config['REPLICA_MISS_TTL']
+        app.extensions['replica_router'] = self
+
+        uri = app.config['SQLALCHEMY_REPLICA_URI']
+        self.enabled = bool(uri) and self.window > 0
+        if uri:
+            binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+            binds.setdefault(REPLICA_BIND, uri)
+            app.config['SQLALCHEMY_BINDS'] = binds
+            app.before_request(self._select_bind)
+
+    def install_bind(self, app, db):
+        """Forget the metadata ``db.init_app`` registered for the replica bind.
+
+        The replica mirrors the primary's tables and has none of its own. The
+        entry lives on the shared ``db``, so leaving it would make
+        ``create_all()`` fail in every other app without the bind.
+        """
+        if app.config.get('SQLALCHEMY_REPLICA_URI'):
+            metadata = db.metadatas.get(REPLICA_BIND)
+            if metadata is not None and not metadata.tables:
+                del db.metadatas[REPLICA_BIND]
+
+    def record_write(self, key):
+        """Pin reads for ``key`` (``('user', 7)`` after a purchase, ``'catalog'``
+        after an admin coffee write) to the primary for a while.
+
+        Call after the write has committed; the marker is written in its own
+        transaction on the primary.
+        """
+        if not self.enabled:
+            return
+        from models import RecentWrite
+
+        expires_at = time.time() + self.window
+        with current_app.extensions['sqlalchemy'].engine.begin() as conn:
+            table = RecentWrite.__table__
+            if conn.dialect.name in _UPSERT_INSERTS:
+                stmt = _UPSERT_INSERTS[conn.dialect.name](table).values(key=_marker(key), expires_at=expires_at)
+                conn.execute(stmt.on_conflict_do_update(index_elements=['key'], set_={'expires_at': expires_at}))
+            elif conn.execute(update(table).where(table.c.key == _marker(key))
+                              .values(expires_at=expires_at)).rowcount == 0:
+                conn.execute(insert(table).values(key=_marker(key), expires_at=expires_at))
+        self._remember(key, expires_at)
+
+    def _remember(self, key, expires_at):
+        with self._lock:
+            self._misses.pop(key, None)
+            self._recent = _bounded(self._recent, self.max_tracked)
+            self._recent[key] = expires_at
+
+    def _remember_miss(self, key):
+        with self._lock:
+            self._misses = _bounded(self._misses, self.max_tracked)
+            self._misses[key] = time.time() + self.miss_ttl
+
+    def clear(self):
+        """Forget what this process knows about recent writes; markers on the primary stay."""
+        with self._lock:
+            self._recent = {}
+            self._misses = {}
+
+    def recently_written(self, key):
+        if not self.enabled:
+            return False
+        now = time.time()
+        deadline = self._recent.get(key)
+        if deadline is not None and deadline > now:
+            return True
+        missed_until = self._misses.get(key)
+        if missed_until is not None and missed_until > now:
+            return False
+        from models import RecentWrite
+
+        # A connection of its own: this also runs from inside RoutingSession.get_bind
+        with current_app.extensions['sqlalchemy'].engine.connect() as conn:
+            deadline = conn.execute(select(RecentWrite.expires_at).where(RecentWrite.key == _marker(key))).scalar()
+        if deadline is not None and deadline > time.time():
+            self._remember(key, deadline)
+            return True
+        if self.miss_ttl > 0:
+            self._remember_miss(key)
+        return False
+
+    @contextmanager
+    def primary(self):
+        previous = g.get('use_replica', False)
+        g.use_replica = False
+        try:
+            yield
+        finally:
+            g.use_replica = previous
+
+    def _select_bind(self):
+        if request.method in ('GET', 'HEAD'):
+            g.use_replica = True
+
+    def reads_from_replica(self):
+        """Whether the current request's reads may use the replica.
+
+        Asked on each read rather than in ``before_request``, so the user is
+        taken from the JWT the view has already verified instead of decoding
+        it a second time. The answer is kept for the rest of the request.
+        """
+        if not g.get('use_replica'):
+            return False
+        try:
+            identity = get_jwt_identity()
+        except RuntimeError:
+            # No JWT verified for this request (public endpoint)
+            return True
+        if identity is None:
+            return True
+        if 'replica_pinned' not in g:
+            g.replica_pinned = self.recently_written(('user', int(identity)))
+        return not g.replica_pinned
+
+
+def _bounded(deadlines, limit):
+    """Return ``deadlines`` with room for one more key, dropping expired ones first."""
+    if len(deadlines) < limit:
+        return deadlines
+    now = time.time()
+    deadlines = {k: v for k, v in deadlines.items() if v > now}
+    if len(deadlines) >= limit:
+        deadlines.pop(next(iter(deadlines)))
+    return deadlines
+
+
+def _marker(key):
+    return ':'.join(map(str, key)) if isinstance(key, tuple) else key
+
+
+def sync_sqlite_replica(primary_uri, replica_uri, root_path=None):
+    """Copy a SQLite primary onto the replica file with the online backup API."""
+    paths = []
+    for uri in (primary_uri, replica_uri):
+        url = make_url(uri)
+        if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+            raise ValueError(f"Not a SQLite file database: {uri}")
+        path = url.database
+        if root_path and not os.path.isabs(path):
+            path = os.path.join(root_path, path)
+        paths.append(path)
+
+    source = sqlite3.connect(paths[0])
+    target = sqlite3.connect(paths[1])
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
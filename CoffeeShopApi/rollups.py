@@ -0,0 +1,91 @@
+from sqlalchemy import case, delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from extensions import db
+from models import Purchase, SalesDaily, UserPurchaseSummary
+
+_UPSERT_INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+def increment(model, keys, amounts, latest=None):
+    """Add ``amounts`` to the row identified by ``keys``, creating it if needed.
+
+    Columns in ``latest`` keep the greater of the stored and the given value.
+    A single ``INSERT ... ON CONFLICT DO UPDATE`` on SQLite and PostgreSQL;
+    other backends fall back to UPDATE then INSERT.
+    """
+    table = model.__table__
+    latest = latest or {}
+    upsert = _UPSERT_INSERTS.get(db.session.get_bind(model.__mapper__, clause=table.insert()).dialect.name)
+    if upsert is not None:
+        stmt = upsert(table).values(**keys, **amounts, **latest)
+        changes = {column: table.c[column] + stmt.excluded[column] for column in amounts}
+        changes.update({column: _greatest(table.c[column], stmt.excluded[column]) for column in latest})
+        db.session.execute(stmt.on_conflict_do_update(index_elements=list(keys), set_=changes))
+        return
+
+    where = [table.c[column] == value for column, value in keys.items()]
+    changes = {column: table.c[column] + value for column, value in amounts.items()}
+    changes.update({column: _greatest(table.c[column], value) for column, value in latest.items()})
+    result = db.session.execute(update(table).where(*where).values(changes))
+    if result.rowcount == 0:
+        db.session.execute(insert(table).values(**keys, **amounts, **latest))
+
+
+def _greatest(stored, value):
+    return case((stored > value, stored), else_=value)
+
+
+def record_purchases(purchases):
+    """Fold flushed ``Purchase`` rows into the rollup tables, inside the caller's transaction."""
+    sales = {}
+    for purchase in purchases:
+        key = (purchase.created_at.date(), purchase.coffee_id)
+        units, revenue, count = sales.get(key, (0, 0.0, 0))
+        sales[key] = (units + purchase.quantity, revenue + purchase.total_price, count + 1)
+
+    for (day, coffee_id), (units, revenue, count) in sorted(sales.items()):
+        increment(SalesDaily, {'day': day, 'coffee_id': coffee_id},
+                  {'units': units, 'revenue': revenue, 'purchase_count': count})
+
+    totals = {}
+    for purchase in purchases:
+        count, units, spent, last = totals.get(purchase.user_id, (0, 0, 0.0, purchase.created_at))
+        totals[purchase.user_id] = (count + 1, units + purchase.quantity, spent + purchase.total_price,
+                                    max(last, purchase.created_at))
+
+    for user_id, (count, units, spent, last) in sorted(totals.items()):
+        increment(UserPurchaseSummary, {'user_id': user_id},
+                  {'purchase_count': count, 'units': units, 'total_spent': spent},
+                  latest={'last_purchase_at': last})
+
+
+def backfill_sales_daily(executor):
+    """Rebuild ``sales_daily`` from every purchase with one ``INSERT ... SELECT``."""
+    day = func.date(Purchase.created_at)
+    executor.execute(delete(SalesDaily.__table__))
+    executor.execute(insert(SalesDaily.__table__).from_select(
+        ['day', 'coffee_id', 'units', 'revenue', 'purchase_count'],
+        select(day, Purchase.coffee_id, func.sum(Purchase.quantity), func.sum(Purchase.total_price), func.count())
+        .where(Purchase.created_at.is_not(None))
+        .group_by(day, Purchase.coffee_id)
+    ))
+
+
+def backfill_user_summaries(executor):
+    """Rebuild ``user_purchase_summary`` from every purchase with one ``INSERT ... SELECT``."""
+    executor.execute(delete(UserPurchaseSummary.__table__))
+    executor.execute(insert(UserPurchaseSummary.__table__).from_select(
+        ['user_id', 'purchase_count', 'units', 'total_spent', 'last_purchase_at'],
+        select(Purchase.user_id, func.count(), func.sum(Purchase.quantity), func.sum(Purchase.total_price),
+               func.max(Purchase.created_at))
+        .group_by(Purchase.user_id)
+    ))
+
+
+def backfill_all(executor):
+    backfill_sales_daily(executor)
+    backfill_user_summaries(executor)
@@ -5,12 +5,15 @@ from models import User, Coffee, Purchase
 from sqlalchemy.exc import SQLAlchemyError
 import logging
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 auth_bp = Blueprint('auth', __name__)
 coffee_bp = Blueprint('coffee', __name__)
 purchase_bp = Blueprint('purchase', __name__)
+
+DEFAULT_HISTORY_LIMIT = 50
+MAX_HISTORY_LIMIT = 500
+
 @auth_bp.route('/register', methods=['POST'], strict_slashes=False)
 def register():
     logger.info("Received register request")
@@ -19,7 +22,7 @@ def register():
         return jsonify({"error": "Missing JSON in request"}), 400
     
     data = request.get_json()
-    logger.info(f"Received registration data: {data}")
+    logger.info("Received registration data", extra={'body': data})
     
     if not all(k in data for k in ('username', 'email', 'password')):
         return jsonify({"error": "Missing required fields"}), 400
@@ -52,7 +55,7 @@ def login():
         return jsonify({"error": "Missing JSON in request"}), 400
     
     data = request.get_json()
-    logger.info(f"Received login data: {data}")
+    logger.info("Received login data", extra={'body': data})
     
     if not all(k in data for k in ('username', 'password')):
         return jsonify({"error": "Missing username or password"}), 400
@@ -87,7 +90,7 @@ def add_coffee():
         return jsonify({"error": "Missing JSON in request"}), 400
     
     data = request.get_json()
-    logger.info(f"Received coffee data: {data}")
+    logger.info("Received coffee data", extra={'body': data})
     
     if not all(k in data for k in ('name', 'description', 'price', 'stock')):
         return jsonify({"error": "Missing required fields"}), 400
@@ -121,13 +124,13 @@ def add_coffee():
 @coffee_bp.route('/<int:coffee_id>', methods=['PUT'], strict_slashes=False)
 @jwt_required()
 def update_coffee(coffee_id):
-    logger.info(f"Received update coffee request for ID: {coffee_id}")
+    logger.info("Received update coffee request for ID: %s", coffee_id)
     if not request.is_json:
         logger.error("Request is not JSON")
         return jsonify({"error": "Missing JSON in request"}), 400
     
     data = request.get_json()
-    logger.info(f"Received update data for coffee {coffee_id}: {data}")
+    logger.info("Received update data for coffee %s", coffee_id, extra={'body': data})
     
     current_user_id = int(get_jwt_identity())
     user = User.query.get(current_user_id)
@@ -162,7 +165,7 @@ def update_coffee(coffee_id):
 @coffee_bp.route('/<int:coffee_id>', methods=['DELETE'], strict_slashes=False)
 @jwt_required()
 def delete_coffee(coffee_id):
-    logger.info(f"Received delete coffee request for ID: {coffee_id}")
+    logger.info("Received delete coffee request for ID: %s", coffee_id)
     current_user_id = int(get_jwt_identity())
     user = User.query.get(current_user_id)
     
@@ -189,7 +192,7 @@ def create_purchase():
         return jsonify({"error": "Missing JSON in request"}), 400
     
     data = request.get_json()
-    logger.info(f"Received purchase data: {data}")
+    logger.info("Received purchase data", extra={'body': data})
     
     if not all(k in data for k in ('coffee_id', 'quantity')):
         return jsonify({"error": "Missing required fields"}), 400
@@ -200,29 +203,26 @@ def create_purchase():
     if not user:
         return jsonify({"error": "User not found"}), 404
     
-    coffee = Coffee.query.get(data['coffee_id'])
-    if not coffee:
-        return jsonify({"error": "Coffee not found"}), 404
-    
     quantity = int(data['quantity'])
     if quantity <= 0:
         return jsonify({"error": "Quantity must be positive"}), 400
     
-    if coffee.stock < quantity:
-        return jsonify({"error": "Insufficient stock"}), 400
-    
-    total_price = coffee.price * quantity
-    
     try:
+        reserved = Coffee.reserve_stock(data['coffee_id'], quantity)
+        if reserved is None:
+            db.session.rollback()
+            if db.session.get(Coffee, data['coffee_id']) is None:
+                return jsonify({"error": "Coffee not found"}), 404
+            return jsonify({"error": "Insufficient stock"}), 400
+        
+        coffee_name, price = reserved
         purchase = Purchase(
             user_id=current_user_id,
-            coffee_id=coffee.id,
+            coffee_id=data['coffee_id'],
             quantity=quantity,
-            total_price=total_price
+            total_price=price * quantity
         )
         
-        coffee.stock -= quantity
-        
         db.session.add(purchase)
         db.session.commit()
         
@@ -230,7 +230,7 @@ def create_purchase():
             'id': purchase.id,
             'user_id': purchase.user_id,
             'coffee_id': purchase.coffee_id,
-            'coffee_name': coffee.name,
+            'coffee_name': coffee_name,
             'quantity': purchase.quantity,
             'total_price': purchase.total_price,
             'purchase_date': purchase.created_at.isoformat()
@@ -245,15 +245,30 @@ def create_purchase():
 def get_purchase_history():
     logger.info("Received get purchase history request")
     current_user_id = int(get_jwt_identity())
-    
-    purchases = Purchase.query.filter_by(user_id=current_user_id).all()
-    
-    return jsonify([{
+    after_id = request.args.get('after_id', type=int)
+    limit = request.args.get('limit', type=int)
+    
+    query = db.session.query(Purchase, Coffee.name).join(Coffee, Purchase.coffee_id == Coffee.id) \
+        .filter(Purchase.user_id == current_user_id).order_by(Purchase.id)
+    if after_id is None and limit is None:
+        # Clients that do not page still get their whole history
+        rows = query.all()
+        limit = len(rows)
+    else:
+        limit = min(max(DEFAULT_HISTORY_LIMIT if limit is None else limit, 1), MAX_HISTORY_LIMIT)
+        if after_id is not None:
+            query = query.filter(Purchase.id > after_id)
+        rows = query.limit(limit + 1).all()
+    
+    response = jsonify([{
         'id': purchase.id,
         'user_id': purchase.user_id,
         'coffee_id': purchase.coffee_id,
-        'coffee_name': purchase.coffee.name,
+        'coffee_name': coffee_name,
         'quantity': purchase.quantity,
         'total_price': purchase.total_price,
         'purchase_date': purchase.created_at.isoformat()
-    } for purchase in purchases]), 200 
\ No newline at end of file
+    } for purchase, coffee_name in rows[:limit]])
+    if len(rows) > limit:
+        response.headers['X-Next-After-Id'] = str(rows[limit - 1][0].id)
+    return response, 200 
\ No newline at end of file
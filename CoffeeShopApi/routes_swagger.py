@@ -1,17 +1,28 @@
-from flask import request, jsonify
-from flask_restx import Namespace, Resource, fields
+from flask import current_app, request, Response, stream_with_context
+from flask_restx import Namespace, Resource, fields, inputs
 from flask_jwt_extended import jwt_required, create_access_token, get_jwt_identity
-from extensions import db
-from models import User, Coffee, Purchase
-from sqlalchemy.exc import SQLAlchemyError
+from extensions import db, catalog_cache, replica_router, idempotency
+from auth import admin_required, current_user
+import catalog
+import exporter
+from idempotency import request_fingerprint
+import importer
+from passwords import HasherBusy
+import provisioning
+import rollups
+import search
+from models import User, Coffee, Purchase, SalesDaily, UserPurchaseSummary, isoformat_utc, naive_utc
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 import logging
+import math
+from datetime import date, datetime, timedelta, timezone
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 auth_ns = Namespace('auth', description='Operações de autenticação')
 coffee_ns = Namespace('coffee', description='Operações com cafés')
 purchase_ns = Namespace('purchase', description='Operações de compra')
+analytics_ns = Namespace('analytics', description='Relatórios de vendas (apenas admin)')
 user_model = auth_ns.model('User', {
     'username': fields.String(required=True, description='Nome de usuário'),
     'email': fields.String(required=True, description='Email do usuário'),
@@ -19,6 +30,21 @@ user_model = auth_ns.model('User', {
     'is_admin': fields.Boolean(description='Se o usuário é admin (opcional, padrão: false)')
 })
 
+bulk_user_model = auth_ns.model('BulkUsers', {
+    'users': fields.List(fields.Nested(user_model), required=True, description='Usuários a criar')
+})
+
+bulk_user_error_model = auth_ns.model('BulkUserError', {
+    'index': fields.Integer(description='Posição do usuário na lista enviada'),
+    'username': fields.String(description='Nome de usuário'),
+    'error': fields.String(description='Mensagem de erro')
+})
+
+bulk_user_result_model = auth_ns.model('BulkUsersResult', {
+    'created': fields.Integer(description='Usuários criados'),
+    'errors': fields.List(fields.Nested(bulk_user_error_model), description='Usuários rejeitados')
+})
+
 login_model = auth_ns.model('Login', {
     'username': fields.String(required=True, description='Nome de usuário'),
     'password': fields.String(required=True, description='Senha do usuário')
@@ -54,6 +80,43 @@ purchase_response_model = purchase_ns.model('PurchaseResponse', {
     'purchase_date': fields.String(description='Data da compra')
 })
 
+purchase_summary_model = purchase_ns.model('PurchaseSummary', {
+    'purchase_count': fields.Integer(description='Número de compras'),
+    'units': fields.Integer(description='Unidades compradas'),
+    'total_spent': fields.Float(description='Total gasto'),
+    'last_purchase_date': fields.String(description='Data da última compra, nula se nunca comprou')
+})
+
+cart_item_model = purchase_ns.model('CartItem', {
+    'coffee_id': fields.Integer(required=True, description='ID do café'),
+    'quantity': fields.Integer(required=True, description='Quantidade a comprar')
+})
+
+cart_model = purchase_ns.model('Cart', {
+    'items': fields.List(fields.Nested(cart_item_model), required=True, description='Itens do carrinho')
+})
+
+cart_response_model = purchase_ns.model('CartResponse', {
+    'purchases': fields.List(fields.Nested(purchase_response_model), description='Compras criadas'),
+    'total_price': fields.Float(description='Preço total do carrinho')
+})
+
+import_error_model = coffee_ns.model('CoffeeImportError', {
+    'line': fields.Integer(description='Linha do arquivo'),
+    'error': fields.String(description='Mensagem de erro')
+})
+
+import_result_model = coffee_ns.model('ImportResult', {
+    'rows': fields.Integer(description='Linhas lidas'),
+    'inserted': fields.Integer(description='Cafés inseridos'),
+    'updated': fields.Integer(description='Cafés atualizados (mesmo nome)'),
+    'error_count': fields.Integer(description='Total de linhas com erro'),
+    'errors': fields.List(fields.Nested(import_error_model),
+                          description=f'Primeiros {importer.MAX_REPORTED_ERRORS} erros por linha'),
+    'error': fields.String(description='Motivo da interrupção (ex.: arquivo não UTF-8); as contagens '
+                                       'indicam o que já foi importado')
+})
+
 token_response_model = auth_ns.model('TokenResponse', {
     'access_token': fields.String(description='Token JWT de acesso')
 })
@@ -66,6 +129,95 @@ success_model = auth_ns.model('Success', {
     'message': fields.String(description='Mensagem de sucesso')
 })
 
+sales_row_model = analytics_ns.model('SalesRow', {
+    'day': fields.String(description='Dia (UTC), ausente quando agrupado por café'),
+    'coffee_id': fields.Integer(description='ID do café'),
+    'coffee_name': fields.String(description='Nome do café'),
+    'units': fields.Integer(description='Unidades vendidas'),
+    'revenue': fields.Float(description='Receita'),
+    'purchases': fields.Integer(description='Número de compras')
+})
+
+sales_report_model = analytics_ns.model('SalesReport', {
+    'start': fields.String(description='Dia inicial (inclusivo)'),
+    'end': fields.String(description='Dia final (inclusivo)'),
+    'units': fields.Integer(description='Total de unidades no período'),
+    'revenue': fields.Float(description='Receita total no período'),
+    'purchases': fields.Integer(description='Total de compras no período'),
+    'rows': fields.List(fields.Nested(sales_row_model), description='Vendas agrupadas')
+})
+
+DEFAULT_SALES_DAYS = 30
+MAX_SALES_DAYS = 366
+
+DEFAULT_CATALOG_LIMIT = 50
+MAX_CATALOG_LIMIT = 200
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+DEFAULT_HISTORY_LIMIT = 50
+MAX_HISTORY_LIMIT = 500
+
+def _utc_datetime(value):
+    """ISO 8601 date/time as naive UTC; an offset is converted, a time without one is taken as UTC."""
+    return naive_utc(datetime.fromisoformat(value))
+
+def _finite_float(value):
+    """A float that is not NaN or infinite, which would filter out everything or nothing."""
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"Not a finite number: {value}")
+    return number
+
+export_parser = purchase_ns.parser()
+export_parser.add_argument('format', location='args', choices=list(exporter.FORMATS), default='ndjson',
+                           help='Formato do arquivo exportado')
+export_parser.add_argument('start', type=_utc_datetime, location='args',
+                           help='Data/hora inicial ISO 8601 (inclusiva; UTC se não houver fuso)')
+export_parser.add_argument('end', type=_utc_datetime, location='args',
+                           help='Data/hora final ISO 8601 (exclusiva; UTC se não houver fuso)')
+export_parser.add_argument('coffee_id', type=int, location='args', help='Filtrar por café')
+
+sales_parser = analytics_ns.parser()
+sales_parser.add_argument('start', type=date.fromisoformat, location='args',
+                          help=f'Dia inicial AAAA-MM-DD (padrão: {DEFAULT_SALES_DAYS} dias antes do final)')
+sales_parser.add_argument('end', type=date.fromisoformat, location='args',
+                          help='Dia final AAAA-MM-DD, inclusivo (padrão: hoje, UTC)')
+sales_parser.add_argument('coffee_id', type=int, location='args', help='Filtrar por café')
+sales_parser.add_argument('group_by', location='args', choices=('day', 'coffee'), default='day',
+                          help='Uma linha por café e dia, ou por café no período')
+
+catalog_parser = coffee_ns.parser()
+catalog_parser.add_argument('in_stock', type=inputs.boolean, location='args',
+                            help='Apenas cafés com (true) ou sem (false) estoque')
+catalog_parser.add_argument('min_price', type=_finite_float, location='args', help='Preço mínimo (inclusivo)')
+catalog_parser.add_argument('max_price', type=_finite_float, location='args', help='Preço máximo (inclusivo)')
+catalog_parser.add_argument('name_prefix', location='args', help='Prefixo do nome (diferencia maiúsculas)')
+catalog_parser.add_argument('sort', location='args', choices=catalog.SORTS, default='id',
+                            help='Ordenação; prefixo "-" para decrescente')
+catalog_parser.add_argument('cursor', location='args', help='Cursor de X-Next-Cursor da página anterior')
+catalog_parser.add_argument('limit', type=int, location='args', default=DEFAULT_CATALOG_LIMIT,
+                            help=f'Quantidade máxima de cafés por página (máx. {MAX_CATALOG_LIMIT})')
+catalog_parser.add_argument('include_description', type=inputs.boolean, location='args', default=True,
+                            help='Incluir a descrição (false para listagens leves)')
+catalog_parser.add_argument('_', location='args', help='Ignorado (cache-buster)')
+
+# Only these page the catalog; filters alone return every matching coffee
+CATALOG_PAGING_ARGS = ('limit', 'cursor', 'sort')
+
+search_parser = coffee_ns.parser()
+search_parser.add_argument('q', required=True, location='args', help='Palavras a buscar no nome e na descrição')
+search_parser.add_argument('limit', type=int, location='args', default=DEFAULT_SEARCH_LIMIT,
+                           help=f'Quantidade máxima de resultados (máx. {MAX_SEARCH_LIMIT})')
+
+history_parser = purchase_ns.parser()
+history_parser.add_argument('after_id', type=int, location='args',
+                            help='Retorna apenas compras com ID maior que este (cursor)')
+history_parser.add_argument('limit', type=int, location='args',
+                            help=f'Quantidade máxima de compras por página (padrão {DEFAULT_HISTORY_LIMIT}, '
+                                 f'máx. {MAX_HISTORY_LIMIT}); sem limit nem after_id retorna o histórico completo')
+
 @auth_ns.route('/register')
 class Register(Resource):
     @auth_ns.doc('register_user')
@@ -73,6 +225,7 @@ class Register(Resource):
     @auth_ns.response(201, 'Usuário registrado com sucesso', success_model)
     @auth_ns.response(400, 'Dados inválidos ou usuário já existe', error_model)
     @auth_ns.response(500, 'Erro interno do servidor', error_model)
+    @auth_ns.response(503, 'Hash de senha sobrecarregado, tente após Retry-After', error_model)
     def post(self):
         logger.info("Received register request")
         if not request.is_json:
@@ -80,16 +233,16 @@ class Register(Resource):
             return {"error": "Missing JSON in request"}, 400
         
         data = request.get_json()
-        logger.info(f"Received registration data: {data}")
+        logger.info("Received registration data", extra={'body': data})
         
-        if not all(k in data for k in ('username', 'email', 'password')):
+        if not isinstance(data, dict) or not all(k in data for k in ('username', 'email', 'password')):
             return {"error": "Missing required fields"}, 400
+        if not provisioning.has_string_fields(data):
+            return {"error": provisioning.FIELD_TYPE_MESSAGE}, 400
         
-        if User.query.filter_by(username=data['username']).first():
-            return {"error": "Username already exists"}, 400
-        
-        if User.query.filter_by(email=data['email']).first():
-            return {"error": "Email already exists"}, 400
+        duplicate = provisioning.find_duplicate(data['username'], data['email'])
+        if duplicate:
+            return {"error": provisioning.duplicate_message(duplicate)}, 400
         
         try:
             user = User(
@@ -101,9 +254,50 @@ class Register(Resource):
             db.session.add(user)
             db.session.commit()
             return {"message": "User registered successfully"}, 201
+        except HasherBusy as e:
+            return _hasher_busy(e)
+        except IntegrityError as e:
+            db.session.rollback()
+            return {"error": provisioning.duplicate_message(provisioning.duplicate_field(e))}, 400
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            return {"error": str(e)}, 500
+
+@auth_ns.route('/bulk-register')
+class BulkRegister(Resource):
+    @auth_ns.doc('bulk_register_users')
+    @auth_ns.expect(bulk_user_model)
+    @auth_ns.response(201, 'Usuários processados', bulk_user_result_model)
+    @auth_ns.response(400, 'Dados inválidos', error_model)
+    @auth_ns.response(403, 'Acesso negado - apenas admins', error_model)
+    @auth_ns.response(500, 'Erro interno do servidor', error_model)
+    @auth_ns.response(503, 'Hash de senha sobrecarregado; lotes anteriores já foram criados', error_model)
+    @admin_required()
+    def post(self):
+        logger.info("Received bulk register request")
+        if not request.is_json:
+            logger.error("Request is not JSON")
+            return {"error": "Missing JSON in request"}, 400
+        
+        data = request.get_json()
+        users = data.get('users') if isinstance(data, dict) else None
+        if not isinstance(users, list) or not users:
+            return {"error": "Missing users list"}, 400
+        
+        max_users = current_app.config['BULK_REGISTER_MAX_USERS']
+        if len(users) > max_users:
+            return {"error": f"At most {max_users} users per request"}, 400
+        
+        logger.info("Received bulk registration of %d users", len(users))
+        try:
+            result = provisioning.provision_users(users, batch_size=current_app.config['BULK_REGISTER_BATCH_SIZE'])
+        except HasherBusy as e:
+            db.session.rollback()
+            return _hasher_busy(e)
         except SQLAlchemyError as e:
             db.session.rollback()
             return {"error": str(e)}, 500
+        return result, 201
 
 @auth_ns.route('/login')
 class Login(Resource):
@@ -112,6 +306,7 @@ class Login(Resource):
     @auth_ns.response(200, 'Login realizado com sucesso', token_response_model)
     @auth_ns.response(400, 'Dados inválidos', error_model)
     @auth_ns.response(401, 'Credenciais inválidas', error_model)
+    @auth_ns.response(503, 'Hash de senha sobrecarregado, tente após Retry-After', error_model)
     def post(self):
         logger.info("Received login request")
         if not request.is_json:
@@ -119,32 +314,104 @@ class Login(Resource):
             return {"error": "Missing JSON in request"}, 400
         
         data = request.get_json()
-        logger.info(f"Received login data: {data}")
+        logger.info("Received login data", extra={'body': data})
         
         if not all(k in data for k in ('username', 'password')):
             return {"error": "Missing username or password"}, 400
         
         user = User.query.filter_by(username=data['username']).first()
-        if user and user.check_password(data['password']):
-            access_token = create_access_token(identity=str(user.id))
+        try:
+            valid = user is not None and user.check_password(data['password'])
+        except HasherBusy as e:
+            return _hasher_busy(e)
+        if valid:
+            if user.password_needs_rehash():
+                try:
+                    user.set_password(data['password'])
+                    db.session.commit()
+                except (SQLAlchemyError, HasherBusy):
+                    db.session.rollback()
+                    logger.exception("Failed to rehash password for user %s", user.id)
+            access_token = create_access_token(
+                identity=str(user.id),
+                additional_claims={'is_admin': bool(user.is_admin)}
+            )
             return {"access_token": access_token}, 200
         
         return {"error": "Invalid username or password"}, 401
 
+def _hasher_busy(e):
+    logger.warning("Password hashing timed out")
+    return {"error": str(e)}, 503, {'Retry-After': str(e.retry_after)}
+
+def _serialize_catalog():
+    coffees = Coffee.query.all()
+    return current_app.json.dumps_bytes([{
+        'id': coffee.id,
+        'name': coffee.name,
+        'description': coffee.description,
+        'price': coffee.price,
+        'stock': coffee.stock
+    } for coffee in coffees])
+
 @coffee_ns.route('/')
 class CoffeeList(Resource):
     @coffee_ns.doc('list_coffees')
-    @coffee_ns.response(200, 'Lista de cafés disponíveis', [coffee_response_model])
+    @coffee_ns.response(200, 'Lista de cafés disponíveis', [coffee_response_model],
+                        headers={'ETag': 'Versão do catálogo, para uso em If-None-Match (sem filtros)',
+                                 'X-Next-Cursor': 'Cursor para a próxima página filtrada, ausente na última'})
+    @coffee_ns.response(304, 'Catálogo não modificado')
+    @coffee_ns.response(400, 'Parâmetros inválidos', error_model)
+    @coffee_ns.expect(catalog_parser)
     def get(self):
         logger.info("Received get coffees request")
-        coffees = Coffee.query.all()
-        return [{
-            'id': coffee.id,
-            'name': coffee.name,
-            'description': coffee.description,
-            'price': coffee.price,
-            'stock': coffee.stock
-        } for coffee in coffees], 200
+        if set(request.args) - {'_'}:
+            return self._get_page()
+        
+        if replica_router.recently_written('catalog'):
+            with replica_router.primary():
+                entry = catalog_cache.get(_serialize_catalog)
+        else:
+            entry = catalog_cache.get(_serialize_catalog)
+        response = Response(entry.body, mimetype='application/json')
+        response.set_etag(entry.etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+    
+    def _get_page(self):
+        # Filtered and paginated requests skip the whole-catalog cache and read through indexes
+        args = catalog_parser.parse_args(strict=True)
+        limit = None
+        if any(name in request.args for name in CATALOG_PAGING_ARGS):
+            if args['limit'] < 1:
+                return {"error": "limit must be positive"}, 400
+            limit = min(args['limit'], MAX_CATALOG_LIMIT)
+        try:
+            stmt = catalog.catalog_page_query(
+                sort=args['sort'],
+                in_stock=args['in_stock'],
+                min_price=args['min_price'],
+                max_price=args['max_price'],
+                name_prefix=args['name_prefix'],
+                cursor=args['cursor'],
+                limit=limit,
+                include_description=args['include_description']
+            )
+        except catalog.InvalidCursor as e:
+            return {"error": str(e)}, 400
+        
+        if replica_router.recently_written('catalog'):
+            with replica_router.primary():
+                rows = db.session.execute(stmt).all()
+        else:
+            rows = db.session.execute(stmt).all()
+        
+        headers = {}
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            headers['X-Next-Cursor'] = catalog.encode_cursor(args['sort'], rows[-1])
+        
+        return [dict(row._mapping) for row in rows], 200, headers
 
     @coffee_ns.doc('add_coffee')
     @coffee_ns.expect(coffee_model)
@@ -152,7 +419,7 @@ class CoffeeList(Resource):
     @coffee_ns.response(400, 'Dados inválidos', error_model)
     @coffee_ns.response(403, 'Acesso negado - apenas admins', error_model)
     @coffee_ns.response(500, 'Erro interno do servidor', error_model)
-    @jwt_required()
+    @admin_required()
     def post(self):
         logger.info("Received add coffee request")
         if not request.is_json:
@@ -160,17 +427,11 @@ class CoffeeList(Resource):
             return {"error": "Missing JSON in request"}, 400
         
         data = request.get_json()
-        logger.info(f"Received coffee data: {data}")
+        logger.info("Received coffee data", extra={'body': data})
         
         if not all(k in data for k in ('name', 'description', 'price', 'stock')):
             return {"error": "Missing required fields"}, 400
         
-        current_user_id = int(get_jwt_identity())
-        user = User.query.get(current_user_id)
-        
-        if not user or not user.is_admin:
-            return {"error": "Unauthorized"}, 403
-        
         try:
             coffee = Coffee(
                 name=data['name'],
@@ -180,6 +441,8 @@ class CoffeeList(Resource):
             )
             db.session.add(coffee)
             db.session.commit()
+            catalog_cache.invalidate()
+            replica_router.record_write('catalog')
             return {
                 'id': coffee.id,
                 'name': coffee.name,
@@ -191,6 +454,24 @@ class CoffeeList(Resource):
             db.session.rollback()
             return {"error": str(e)}, 500
 
+@coffee_ns.route('/search')
+class CoffeeSearch(Resource):
+    @coffee_ns.doc('search_coffees')
+    @coffee_ns.expect(search_parser)
+    @coffee_ns.response(200, 'Cafés encontrados, do mais relevante ao menos relevante', [coffee_response_model])
+    @coffee_ns.response(400, 'Busca inválida', error_model)
+    def get(self):
+        args = search_parser.parse_args()
+        logger.info("Received search coffees request")
+        if not search.terms(args['q']):
+            return {"error": "Missing search terms"}, 400
+        limit = min(max(args['limit'], 1), MAX_SEARCH_LIMIT)
+        
+        if replica_router.recently_written('catalog'):
+            with replica_router.primary():
+                return search.search_coffees(args['q'], limit), 200
+        return search.search_coffees(args['q'], limit), 200
+
 @coffee_ns.route('/<int:coffee_id>')
 class CoffeeDetail(Resource):
     @coffee_ns.doc('update_coffee')
@@ -200,21 +481,15 @@ class CoffeeDetail(Resource):
     @coffee_ns.response(403, 'Acesso negado - apenas admins', error_model)
     @coffee_ns.response(404, 'Café não encontrado', error_model)
     @coffee_ns.response(500, 'Erro interno do servidor', error_model)
-    @jwt_required()
+    @admin_required()
     def put(self, coffee_id):
-        logger.info(f"Received update coffee request for ID: {coffee_id}")
+        logger.info("Received update coffee request for ID: %s", coffee_id)
         if not request.is_json:
             logger.error("Request is not JSON")
             return {"error": "Missing JSON in request"}, 400
         
         data = request.get_json()
-        logger.info(f"Received update data for coffee {coffee_id}: {data}")
-        
-        current_user_id = int(get_jwt_identity())
-        user = User.query.get(current_user_id)
-        
-        if not user or not user.is_admin:
-            return {"error": "Unauthorized"}, 403
+        logger.info("Received update data for coffee %s", coffee_id, extra={'body': data})
         
         coffee = Coffee.query.get_or_404(coffee_id)
         
@@ -229,6 +504,8 @@ class CoffeeDetail(Resource):
                 coffee.stock = int(data['stock'])
             
             db.session.commit()
+            catalog_cache.invalidate()
+            replica_router.record_write('catalog')
             return {
                 'id': coffee.id,
                 'name': coffee.name,
@@ -245,32 +522,136 @@ class CoffeeDetail(Resource):
     @coffee_ns.response(403, 'Acesso negado - apenas admins', error_model)
     @coffee_ns.response(404, 'Café não encontrado', error_model)
     @coffee_ns.response(500, 'Erro interno do servidor', error_model)
-    @jwt_required()
+    @admin_required("Only admins can delete coffee")
     def delete(self, coffee_id):
-        logger.info(f"Received delete coffee request for ID: {coffee_id}")
-        current_user_id = int(get_jwt_identity())
-        user = User.query.get(current_user_id)
-        
-        if not user or not user.is_admin:
-            return {"error": "Only admins can delete coffee"}, 403
-        
+        logger.info("Received delete coffee request for ID: %s", coffee_id)
         coffee = Coffee.query.get_or_404(coffee_id)
         
         try:
             db.session.delete(coffee)
             db.session.commit()
+            catalog_cache.invalidate()
+            replica_router.record_write('catalog')
             return {"message": "Coffee deleted successfully"}, 200
         except SQLAlchemyError as e:
             db.session.rollback()
             return {"error": str(e)}, 500
 
+@coffee_ns.route('/import')
+class CoffeeImport(Resource):
+    @coffee_ns.doc('import_coffees', params={
+        'format': {'in': 'query', 'type': 'string', 'enum': list(importer.FORMATS),
+                   'description': 'Formato do corpo; padrão: deduzido do Content-Type (text/csv ou application/x-ndjson)'}
+    })
+    @coffee_ns.response(200, 'Importação concluída', import_result_model)
+    @coffee_ns.response(400, 'Formato inválido ou arquivo não UTF-8 (com as contagens do que já foi importado)',
+                        import_result_model)
+    @coffee_ns.response(403, 'Acesso negado - apenas admins', error_model)
+    @coffee_ns.response(500, 'Erro interno do servidor', error_model)
+    @admin_required()
+    def post(self):
+        logger.info("Received import coffees request")
+        fmt = request.args.get('format') or importer.detect_format(request.content_type)
+        if fmt not in importer.FORMATS:
+            return {"error": "Unsupported format, use text/csv or application/x-ndjson"}, 400
+        
+        try:
+            result = importer.import_coffees(
+                importer.iter_rows(request.stream, fmt),
+                coffee_model,
+                chunk_size=current_app.config['COFFEE_IMPORT_CHUNK_SIZE']
+            )
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            return {"error": str(e)}, 500
+        finally:
+            catalog_cache.invalidate()
+            replica_router.record_write('catalog')
+        
+        if 'error' in result:
+            # Chunks before the undecodable bytes are committed; report them too
+            logger.warning("Import stopped: %s", result['error'])
+            return result, 400
+        logger.info("Imported coffees: %d inserted, %d updated, %d errors",
+                    result['inserted'], result['updated'], result['error_count'])
+        return result, 200
+
+def _serialize_purchase(purchase, coffee_name):
+    return {
+        'id': purchase.id,
+        'user_id': purchase.user_id,
+        'coffee_id': purchase.coffee_id,
+        'coffee_name': coffee_name,
+        'quantity': purchase.quantity,
+        'total_price': purchase.total_price,
+        'purchase_date': isoformat_utc(purchase.created_at)
+    }
+
+def _replay_purchase(user_id, key, fingerprint):
+    stored = idempotency.lookup(user_id, key)
+    if stored is None:
+        return None
+    if stored.request_hash != fingerprint:
+        return {"error": "Idempotency-Key was already used with a different request"}, 422
+    logger.info("Replaying purchase response for idempotency key")
+    return stored.body, stored.status_code, {'Idempotent-Replayed': 'true'}
+
+def _check_idempotency_key(user_id, data):
+    """Return ``(key, fingerprint, response)`` for the request's Idempotency-Key header.
+
+    ``response`` is set when the request must not run: the key is invalid,
+    or a purchase already committed under it is replayed.
+    """
+    key = request.headers.get('Idempotency-Key')
+    if key is None:
+        return None, None, None
+    if not key or len(key) > idempotency.max_key_length:
+        return key, None, ({"error": "Invalid Idempotency-Key"}, 400)
+    fingerprint = request_fingerprint(data)
+    return key, fingerprint, _replay_purchase(user_id, key, fingerprint)
+
+def _create_purchase(user_id, coffee_id, quantity, key=None, fingerprint=None):
+    reserved = Coffee.reserve_stock(coffee_id, quantity)
+    if reserved is None:
+        db.session.rollback()
+        if db.session.get(Coffee, coffee_id) is None:
+            return {"error": "Coffee not found"}, 404
+        return {"error": "Insufficient stock"}, 400
+    
+    coffee_name, price = reserved
+    purchase = Purchase(
+        user_id=user_id,
+        coffee_id=coffee_id,
+        quantity=quantity,
+        total_price=price * quantity
+    )
+    
+    db.session.add(purchase)
+    db.session.flush()
+    rollups.record_purchases([purchase])
+    result = _serialize_purchase(purchase, coffee_name)
+    if key is not None:
+        # Stored in the same transaction: either the purchase and its key commit, or neither does
+        stored = idempotency.save(user_id, key, fingerprint, 201, result)
+    db.session.commit()
+    if key is not None:
+        idempotency.remember(user_id, key, stored)
+    catalog_cache.invalidate()
+    replica_router.record_write(('user', user_id))
+    return result, 201
+
 @purchase_ns.route('/')
 class PurchaseList(Resource):
-    @purchase_ns.doc('create_purchase')
+    @purchase_ns.doc('create_purchase', params={
+        'Idempotency-Key': {'in': 'header', 'type': 'string',
+                            'description': 'Chave única por tentativa de compra; repetições devolvem a resposta original'}
+    })
     @purchase_ns.expect(purchase_model)
-    @purchase_ns.response(201, 'Compra realizada com sucesso', purchase_response_model)
+    @purchase_ns.response(201, 'Compra realizada com sucesso', purchase_response_model,
+                          headers={'Idempotent-Replayed': 'Presente quando a resposta é de uma tentativa anterior'})
     @purchase_ns.response(400, 'Dados inválidos ou estoque insuficiente', error_model)
     @purchase_ns.response(404, 'Café não encontrado', error_model)
+    @purchase_ns.response(422, 'Idempotency-Key já usada com outro pedido', error_model)
     @purchase_ns.response(500, 'Erro interno do servidor', error_model)
     @jwt_required()
     def post(self):
@@ -280,71 +661,244 @@ class PurchaseList(Resource):
             return {"error": "Missing JSON in request"}, 400
         
         data = request.get_json()
-        logger.info(f"Received purchase data: {data}")
+        logger.info("Received purchase data", extra={'body': data})
         
         if not all(k in data for k in ('coffee_id', 'quantity')):
             return {"error": "Missing required fields"}, 400
         
         current_user_id = int(get_jwt_identity())
-        user = User.query.get(current_user_id)
-        
-        if not user:
+        if current_user() is None:
             return {"error": "User not found"}, 404
         
-        coffee = Coffee.query.get(data['coffee_id'])
-        if not coffee:
-            return {"error": "Coffee not found"}, 404
-        
         quantity = int(data['quantity'])
         if quantity <= 0:
             return {"error": "Quantity must be positive"}, 400
         
-        if coffee.stock < quantity:
-            return {"error": "Insufficient stock"}, 400
+        key, fingerprint, response = _check_idempotency_key(current_user_id, data)
+        if response is not None:
+            return response
+        
+        try:
+            return _create_purchase(current_user_id, data['coffee_id'], quantity, key, fingerprint)
+        except IntegrityError as e:
+            db.session.rollback()
+            # A concurrent retry with the same key committed first
+            replay = key is not None and _replay_purchase(current_user_id, key, fingerprint)
+            return replay or ({"error": str(e)}, 500)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            return {"error": str(e)}, 500
+
+    @purchase_ns.doc('get_purchase_history')
+    @purchase_ns.expect(history_parser)
+    @purchase_ns.response(200, 'Histórico de compras do usuário', [purchase_response_model],
+                          headers={'X-Next-After-Id': 'Cursor para a próxima página, ausente na última'})
+    @jwt_required()
+    def get(self):
+        logger.info("Received get purchase history request")
+        current_user_id = int(get_jwt_identity())
+        args = history_parser.parse_args()
+        
+        query = db.session.query(Purchase, Coffee.name).join(Coffee, Purchase.coffee_id == Coffee.id) \
+            .filter(Purchase.user_id == current_user_id).order_by(Purchase.id)
+        headers = {}
+        if args['after_id'] is None and args['limit'] is None:
+            # Clients that do not page still get their whole history
+            rows = query.all()
+        else:
+            limit = args['limit']
+            limit = min(max(DEFAULT_HISTORY_LIMIT if limit is None else limit, 1), MAX_HISTORY_LIMIT)
+            if args['after_id'] is not None:
+                query = query.filter(Purchase.id > args['after_id'])
+            rows = query.limit(limit + 1).all()
+            if len(rows) > limit:
+                rows = rows[:limit]
+                headers['X-Next-After-Id'] = str(rows[-1][0].id)
+        
+        return [_serialize_purchase(purchase, coffee_name) for purchase, coffee_name in rows], 200, headers
+
+@purchase_ns.route('/summary')
+class PurchaseSummary(Resource):
+    @purchase_ns.doc('get_purchase_summary')
+    @purchase_ns.response(200, 'Totais de compras do usuário', purchase_summary_model)
+    @jwt_required()
+    def get(self):
+        logger.info("Received get purchase summary request")
+        current_user_id = int(get_jwt_identity())
+        summary = db.session.get(UserPurchaseSummary, current_user_id)
+        if summary is None:
+            return {'purchase_count': 0, 'units': 0, 'total_spent': 0.0, 'last_purchase_date': None}, 200
+        
+        return {
+            'purchase_count': summary.purchase_count,
+            'units': summary.units,
+            'total_spent': summary.total_spent,
+            'last_purchase_date': isoformat_utc(summary.last_purchase_at)
+        }, 200
+
+@purchase_ns.route('/export')
+class PurchaseExport(Resource):
+    @purchase_ns.doc('export_purchases')
+    @purchase_ns.expect(export_parser)
+    @purchase_ns.response(200, 'Compras exportadas em NDJSON ou CSV (streaming)')
+    @purchase_ns.response(400, 'Parâmetros inválidos', error_model)
+    @purchase_ns.response(403, 'Acesso negado - apenas admins', error_model)
+    @admin_required()
+    def get(self):
+        logger.info("Received export purchases request")
+        args = export_parser.parse_args()
+        stmt = exporter.purchase_export_query(args['start'], args['end'], args['coffee_id'])
+        fmt = args['format']
+        
+        return Response(
+            stream_with_context(exporter.iter_export(stmt, fmt, current_app.config['PURCHASE_EXPORT_BATCH_SIZE'])),
+            mimetype=exporter.FORMATS[fmt],
+            headers={'Content-Disposition': f'attachment; filename=purchases.{fmt}'}
+        )
+
+def _parse_cart_item(item):
+    """Return ``(coffee_id, quantity)`` for a cart item, or the error message."""
+    if not isinstance(item, dict) or not all(k in item for k in ('coffee_id', 'quantity')):
+        return "Missing required fields"
+    try:
+        coffee_id = int(item['coffee_id'])
+        quantity = int(item['quantity'])
+    except (TypeError, ValueError):
+        return "Invalid coffee_id or quantity"
+    if quantity <= 0:
+        return "Quantity must be positive"
+    return coffee_id, quantity
+
+def _cart_stock_error(quantities):
+    """Explain why reserving ``quantities`` failed: the first missing coffee, else the first short one."""
+    stock = dict(db.session.query(Coffee.id, Coffee.stock).filter(Coffee.id.in_(quantities)).all())
+    missing = sorted(set(quantities) - set(stock))
+    if missing:
+        return {"error": f"Coffee not found: {missing[0]}"}, 404
+    short = [c for c in sorted(quantities) if (stock[c] or 0) < quantities[c]]
+    if short:
+        return {"error": f"Insufficient stock for coffee {short[0]}"}, 400
+    return {"error": "Insufficient stock"}, 400
+
+@purchase_ns.route('/cart')
+class Cart(Resource):
+    @purchase_ns.doc('checkout_cart')
+    @purchase_ns.expect(cart_model)
+    @purchase_ns.response(201, 'Compras realizadas com sucesso', cart_response_model)
+    @purchase_ns.response(400, 'Dados inválidos ou estoque insuficiente', error_model)
+    @purchase_ns.response(404, 'Café não encontrado', error_model)
+    @purchase_ns.response(500, 'Erro interno do servidor', error_model)
+    @jwt_required()
+    def post(self):
+        logger.info("Received cart checkout request")
+        if not request.is_json:
+            logger.error("Request is not JSON")
+            return {"error": "Missing JSON in request"}, 400
+        
+        data = request.get_json()
+        logger.info("Received cart data", extra={'body': data})
+        
+        items = data.get('items') if isinstance(data, dict) else None
+        if not isinstance(items, list) or not items:
+            return {"error": "Cart must contain at least one item"}, 400
+        
+        lines = []
+        for item in items:
+            line = _parse_cart_item(item)
+            if not isinstance(line, tuple):
+                return {"error": line}, 400
+            lines.append(line)
+        quantities = {}
+        for coffee_id, quantity in lines:
+            quantities[coffee_id] = quantities.get(coffee_id, 0) + quantity
         
-        total_price = coffee.price * quantity
+        current_user_id = int(get_jwt_identity())
+        if current_user() is None:
+            return {"error": "User not found"}, 404
         
         try:
-            purchase = Purchase(
+            reserved = Coffee.reserve_stock_many(quantities)
+            if reserved is None:
+                db.session.rollback()
+                return _cart_stock_error(quantities)
+            
+            purchases = [Purchase(
                 user_id=current_user_id,
-                coffee_id=coffee.id,
+                coffee_id=coffee_id,
                 quantity=quantity,
-                total_price=total_price
-            )
+                total_price=reserved[coffee_id][1] * quantity
+            ) for coffee_id, quantity in lines]
             
-            coffee.stock -= quantity
+            db.session.add_all(purchases)
+            db.session.flush()
+            rollups.record_purchases(purchases)
             
-            db.session.add(purchase)
-            db.session.commit()
+            # Serialize before commit so the expired rows are not reloaded one by one
+            result = {
+                'purchases': [_serialize_purchase(purchase, reserved[purchase.coffee_id][0]) for purchase in purchases],
+                'total_price': sum(purchase.total_price for purchase in purchases)
+            }
             
-            return {
-                'id': purchase.id,
-                'user_id': purchase.user_id,
-                'coffee_id': purchase.coffee_id,
-                'coffee_name': coffee.name,
-                'quantity': purchase.quantity,
-                'total_price': purchase.total_price,
-                'purchase_date': purchase.created_at.isoformat()
-            }, 201
+            db.session.commit()
+            catalog_cache.invalidate()
+            replica_router.record_write(('user', current_user_id))
+            return result, 201
         except SQLAlchemyError as e:
             db.session.rollback()
             return {"error": str(e)}, 500
 
-    @purchase_ns.doc('get_purchase_history')
-    @purchase_ns.response(200, 'Histórico de compras do usuário', [purchase_response_model])
-    @jwt_required()
+@analytics_ns.route('/sales')
+class SalesReport(Resource):
+    @analytics_ns.doc('sales_report')
+    @analytics_ns.expect(sales_parser)
+    @analytics_ns.response(200, 'Vendas no período', sales_report_model)
+    @analytics_ns.response(400, 'Parâmetros inválidos', error_model)
+    @analytics_ns.response(403, 'Acesso negado - apenas admins', error_model)
+    @admin_required()
     def get(self):
-        logger.info("Received get purchase history request")
-        current_user_id = int(get_jwt_identity())
-        
-        purchases = Purchase.query.filter_by(user_id=current_user_id).all()
-        
-        return [{
-            'id': purchase.id,
-            'user_id': purchase.user_id,
-            'coffee_id': purchase.coffee_id,
-            'coffee_name': purchase.coffee.name,
-            'quantity': purchase.quantity,
-            'total_price': purchase.total_price,
-            'purchase_date': purchase.created_at.isoformat()
-        } for purchase in purchases], 200 
\ No newline at end of file
+        logger.info("Received sales report request")
+        args = sales_parser.parse_args()
+        end = args['end'] or datetime.now(timezone.utc).date()
+        start = args['start'] or end - timedelta(days=DEFAULT_SALES_DAYS - 1)
+        if start > end:
+            return {"error": "start must not be after end"}, 400
+        if (end - start).days >= MAX_SALES_DAYS:
+            return {"error": f"Date range cannot exceed {MAX_SALES_DAYS} days"}, 400
+        
+        # Reads only the rollup table, never the purchase history
+        columns = [SalesDaily.coffee_id, Coffee.name,
+                   db.func.sum(SalesDaily.units), db.func.sum(SalesDaily.revenue),
+                   db.func.sum(SalesDaily.purchase_count)]
+        group_by = [SalesDaily.coffee_id, Coffee.name]
+        if args['group_by'] == 'day':
+            columns.insert(0, SalesDaily.day)
+            group_by.insert(0, SalesDaily.day)
+        query = db.session.query(*columns).outerjoin(Coffee, SalesDaily.coffee_id == Coffee.id) \
+            .filter(SalesDaily.day >= start, SalesDaily.day <= end)
+        if args['coffee_id'] is not None:
+            query = query.filter(SalesDaily.coffee_id == args['coffee_id'])
+        
+        rows = []
+        for row in query.group_by(*group_by).order_by(*group_by).all():
+            if args['group_by'] == 'day':
+                day, *row = row
+            coffee_id, coffee_name, units, revenue, purchases = row
+            entry = {
+                'coffee_id': coffee_id,
+                'coffee_name': coffee_name,
+                'units': units,
+                'revenue': revenue,
+                'purchases': purchases
+            }
+            if args['group_by'] == 'day':
+                entry['day'] = day.isoformat()
+            rows.append(entry)
+        
+        return {
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'units': sum(row['units'] for row in rows),
+            'revenue': sum((row['revenue'] for row in rows), 0.0),
+            'purchases': sum(row['purchases'] for row in rows),
+            'rows': rows
+        }, 200
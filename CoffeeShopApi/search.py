@@ -0,0 +1,77 @@
+import re
+
+from sqlalchemy import and_, case, column, func, literal_column, or_, select, table
+
+from extensions import db
+from models import COFFEE_FTS_TABLE, Coffee
+
+SEARCH_COLUMNS = (Coffee.id, Coffee.name, Coffee.description, Coffee.price, Coffee.stock)
+
+# bm25 weights per indexed column: a hit in the name counts more than one in the description
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+_TERM = re.compile(r'\w+')
+
+_fts = table(COFFEE_FTS_TABLE, column('rowid'))
+
+# Database URL -> whether it has the FTS index; only schema commands change that
+_fts_tables = {}
+
+
+def terms(q):
+    """Split a user query into words; punctuation and FTS operators are dropped."""
+    return _TERM.findall(q or '')
+
+
+def fts_available():
+    """Whether the coffee FTS index exists, looked up once per database."""
+    bind = db.session.get_bind(Coffee.__mapper__)
+    if bind.dialect.name != 'sqlite':
+        return False
+    available = _fts_tables.get(bind.url)
+    if available is None:
+        available = _fts_tables[bind.url] = db.session.execute(
+            select(literal_column('1')).select_from(table('sqlite_master', column('type'), column('name')))
+            .where(column('type') == 'table', column('name') == COFFEE_FTS_TABLE)
+        ).first() is not None
+    return available
+
+
+def forget_fts(engine):
+    """Look the index up again on the next search, after a schema change on ``engine``."""
+    _fts_tables.pop(engine.url, None)
+
+
+def fts_query(words, limit):
+    # Every word must match, as a prefix; quoting keeps user input out of the FTS syntax
+    match = ' '.join('"%s"*' % word for word in words)
+    fts = literal_column(COFFEE_FTS_TABLE)
+    return select(*SEARCH_COLUMNS) \
+        .select_from(_fts.join(Coffee.__table__, Coffee.id == _fts.c.rowid)) \
+        .where(fts.op('MATCH')(match)) \
+        .order_by(func.bm25(fts, NAME_WEIGHT, DESCRIPTION_WEIGHT), Coffee.id) \
+        .limit(limit)
+
+
+def _like(word):
+    return '%' + word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def like_query(words, limit):
+    """Substring match for engines without FTS5; name matches rank first."""
+    in_name = [Coffee.name.ilike(_like(word), escape='\\') for word in words]
+    in_description = [Coffee.description.ilike(_like(word), escape='\\') for word in words]
+    return select(*SEARCH_COLUMNS) \
+        .where(*(or_(name, description) for name, description in zip(in_name, in_description))) \
+        .order_by(case((and_(*in_name), 0), else_=1), Coffee.name, Coffee.id) \
+        .limit(limit)
+
+
+def search_coffees(q, limit=20):
+    """Return up to ``limit`` coffees matching every word of ``q``, best first."""
+    words = terms(q)
+    if not words:
+        return []
+    stmt = fts_query(words, limit) if fts_available() else like_query(words, limit)
+    return [dict(row._mapping) for row in db.session.execute(stmt)]
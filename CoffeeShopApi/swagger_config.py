@@ -1,5 +1,6 @@
 from flask_restx import Api
-from routes_swagger import auth_ns, coffee_ns, purchase_ns
+from json_provider import output_json
+from routes_swagger import auth_ns, coffee_ns, purchase_ns, analytics_ns
 
 def configure_swagger(app):
     api = Api(
@@ -19,8 +20,11 @@ def configure_swagger(app):
         security='Bearer'
     )
     
+    api.representations['application/json'] = output_json
+    
     api.add_namespace(auth_ns, path='/auth')
     api.add_namespace(coffee_ns, path='/coffee')
     api.add_namespace(purchase_ns, path='/purchase')
+    api.add_namespace(analytics_ns, path='/analytics')
     
     return api 
\ No newline at end of file
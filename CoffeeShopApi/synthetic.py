@@ -0,0 +1,134 @@
+import itertools
+import random
+from datetime import datetime, time, timedelta, timezone
+
+from sqlalchemy import func, insert, select
+
+from extensions import db, hasher
+from models import User, Coffee, Purchase
+import rollups
+
+ORIGINS = ('Brazil', 'Colombia', 'Ethiopia', 'Kenya', 'Guatemala', 'Sumatra', 'Costa Rica', 'Honduras',
+           'Peru', 'Rwanda', 'Yemen', 'Panama')
+STYLES = ('Espresso', 'Latte', 'Cappuccino', 'Cold Brew', 'Filter', 'Mocha', 'Flat White', 'Macchiato',
+          'Americano', 'Cortado')
+ROASTS = ('Light', 'Medium', 'Dark', 'Decaf')
+
+# Relative order volume per hour of day (UTC): morning rush, lunch, afternoon
+HOUR_WEIGHTS = (1, 1, 1, 1, 1, 2, 6, 12, 14, 10, 7, 6, 8, 7, 6, 6, 5, 4, 3, 2, 2, 1, 1, 1)
+QUANTITIES = (1, 2, 3, 4)
+QUANTITY_WEIGHTS = (70, 20, 7, 3)
+
+SYNTHETIC_PASSWORD = 'password'
+
+
+def _cumulative(weights):
+    return list(itertools.accumulate(weights))
+
+
+def _next_id(column):
+    return (db.session.execute(select(func.max(column))).scalar() or 0) + 1
+
+
+def _insert_chunks(table, rows, chunk_size, progress=None):
+    """Insert ``rows`` with one executemany and one commit per chunk."""
+    total = 0
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return total
+        db.session.execute(insert(table), chunk)
+        db.session.commit()
+        total += len(chunk)
+        if progress:
+            progress(table.name, total)
+
+
+def generate(users, coffees, purchases, seed=0, days=365, end=None, chunk_size=10000,
+             popularity_skew=1.1, activity_skew=1.2, progress=None):
+    """Append a deterministic synthetic dataset and rebuild the rollups.
+
+    Coffee popularity follows a Zipf law (``popularity_skew``) and user
+    activity a Pareto law (``activity_skew``), so a few coffees and a few
+    heavy users dominate. Purchases spread over ``days`` days before ``end``,
+    leaning towards recent days and the morning rush.
+
+    Ids continue after the current maximum, so the same arguments produce
+    the same rows only on an empty database. Even then the password hash
+    differs between runs: ``SYNTHETIC_PASSWORD`` is hashed once, with a
+    random salt, and shared by every generated user.
+    """
+    rng = random.Random(seed)
+    end = end or datetime.now(timezone.utc).date()
+    start = datetime.combine(end, time(), timezone.utc) - timedelta(days=days - 1)
+    password_hash = hasher.hash(SYNTHETIC_PASSWORD)
+
+    first_user = _next_id(User.id)
+    first_coffee = _next_id(Coffee.id)
+    user_ids = range(first_user, first_user + users)
+    coffee_ids = range(first_coffee, first_coffee + coffees)
+
+    def user_rows():
+        for user_id in user_ids:
+            created_at = start + timedelta(seconds=rng.uniform(0, days * 86400))
+            yield {
+                'id': user_id,
+                'username': f'synth{user_id}',
+                'email': f'synth{user_id}@example.com',
+                'password_hash': password_hash,
+                'is_admin': False,
+                'created_at': created_at,
+                'updated_at': created_at,
+            }
+
+    prices = {}
+
+    def coffee_rows():
+        for coffee_id in coffee_ids:
+            prices[coffee_id] = round(min(max(rng.lognormvariate(1.5, 0.35), 1.5), 15.0), 2)
+            name = f'{rng.choice(ROASTS)} {rng.choice(ORIGINS)} {rng.choice(STYLES)} #{coffee_id}'
+            yield {
+                'id': coffee_id,
+                'name': name,
+                'description': f'Synthetic {name.lower()}',
+                'price': prices[coffee_id],
+                'stock': rng.randint(100, 10000),
+                'created_at': start,
+                'updated_at': start,
+            }
+
+    result = {
+        'users': _insert_chunks(User.__table__, user_rows(), chunk_size, progress),
+        'coffees': _insert_chunks(Coffee.__table__, coffee_rows(), chunk_size, progress),
+    }
+
+    # Popularity rank is shuffled so it is not simply the coffee id order
+    ranked = list(coffee_ids)
+    rng.shuffle(ranked)
+    coffee_weights = _cumulative(1 / (rank + 1) ** popularity_skew for rank in range(coffees))
+    user_weights = _cumulative(rng.paretovariate(activity_skew) for _ in user_ids)
+    hour_weights = _cumulative(HOUR_WEIGHTS)
+    quantity_weights = _cumulative(QUANTITY_WEIGHTS)
+
+    def purchase_rows():
+        for _ in range(purchases):
+            coffee_id = rng.choices(ranked, cum_weights=coffee_weights)[0]
+            quantity = rng.choices(QUANTITIES, cum_weights=quantity_weights)[0]
+            day = min(int(rng.triangular(0, days, days)), days - 1)
+            hour = rng.choices(range(24), cum_weights=hour_weights)[0]
+            created_at = start + timedelta(days=day, hours=hour, seconds=rng.randrange(3600))
+            yield {
+                'user_id': rng.choices(user_ids, cum_weights=user_weights)[0],
+                'coffee_id': coffee_id,
+                'quantity': quantity,
+                'total_price': round(prices[coffee_id] * quantity, 2),
+                'created_at': created_at,
+                'updated_at': created_at,
+            }
+
+    result['purchases'] = _insert_chunks(Purchase.__table__, purchase_rows(), chunk_size, progress) \
+        if users and coffees else 0
+
+    rollups.backfill_all(db.session)
+    db.session.commit()
+    return result
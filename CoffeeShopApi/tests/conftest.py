@@ -0,0 +1,64 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+from extensions import catalog_cache, idempotency, metrics, ratelimiter, replica_router, user_cache  # noqa: E402
+from models import Coffee, User  # noqa: E402
+
+TEST_CONFIG = {
+    'TESTING': True,
+    'JWT_SECRET_KEY': 'test-secret-key-12345',
+    'JWT_ACCESS_TOKEN_EXPIRES': False,
+    'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+}
+
+
+def reset_process_state():
+    """Empty the per-process caches and counters the extension singletons keep between apps."""
+    catalog_cache.invalidate()
+    user_cache.invalidate()
+    replica_router.clear()
+    idempotency.clear()
+    ratelimiter.reset()
+    metrics.reset()
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Factory for apps backed by a fresh SQLite file under ``tmp_path``.
+
+    ``make_app(users=[('buyer', 'buyer123')], coffees=[{...}], **config)``
+    seeds regular users and ``Coffee`` rows; ``config`` overrides
+    ``TEST_CONFIG``. Engines are disposed when the test ends.
+    """
+    apps = []
+
+    def factory(users=(), coffees=(), **config):
+        app = create_app({
+            **TEST_CONFIG,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / f'app{len(apps)}.db'}",
+            **config
+        })
+        apps.append(app)
+        with app.app_context():
+            db.create_all()
+            for username, password in users:
+                user = User(username=username, email=f'{username}@example.com')
+                user.set_password(password)
+                db.session.add(user)
+            db.session.add_all(Coffee(**fields) for fields in coffees)
+            db.session.commit()
+        reset_process_state()
+        return app
+
+    yield factory
+    reset_process_state()
+    for app in apps:
+        with app.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
@@ -4,8 +4,19 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import pytest
 from app import create_app, db
-from models import User, Coffee, Purchase
+from extensions import catalog_cache, user_cache, hasher, compressor, idempotency
+from werkzeug.security import generate_password_hash
+from models import User, Coffee, Purchase, SalesDaily, IdempotencyKey
 import json
+import base64
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from sqlalchemy import event, text
+import json_provider
+import catalog
+import search
+import gzip
+import time
 
 @pytest.fixture(scope='session')
 def app():
@@ -17,7 +28,9 @@ def app():
         'JWT_TOKEN_LOCATION': ['headers'],
         'JWT_HEADER_NAME': 'Authorization',
         'JWT_HEADER_TYPE': 'Bearer',
-        'JWT_ACCESS_TOKEN_EXPIRES': False
+        'JWT_ACCESS_TOKEN_EXPIRES': False,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'RATELIMIT_ENABLED': False
     }
     
     app = create_app(test_config)
@@ -27,6 +40,10 @@ def app():
 def _db(app):
     with app.app_context():
         db.create_all()
+        catalog_cache.invalidate()
+        user_cache.invalidate()
+        idempotency.clear()
+        search.forget_fts(db.engine)
         yield db
         db.session.remove()
         db.drop_all()
@@ -172,10 +189,61 @@ def test_purchase_coffee(client, regular_user, coffee_item, _db):
     data = json.loads(response.data)
     assert data['quantity'] == 2
     assert data['total_price'] == 20.0
+    assert isinstance(data['total_price'], float)
     
     updated_coffee = Coffee.query.get(coffee_item)
     assert updated_coffee.stock == 98
 
+def test_purchase_idempotency_key(app, client, regular_user, coffee_item, _db):
+    token = get_auth_token(client, 'user', 'user123')
+    headers = {'Authorization': f'Bearer {token}', 'Idempotency-Key': 'retry-1'}
+    
+    first = client.post('/purchase/', json={'coffee_id': coffee_item, 'quantity': 2}, headers=headers)
+    assert first.status_code == 201
+    assert 'Idempotent-Replayed' not in first.headers
+    
+    retry = client.post('/purchase/', json={'quantity': 2, 'coffee_id': coffee_item}, headers=headers)
+    assert retry.status_code == 201
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert json.loads(retry.data) == json.loads(first.data)
+    
+    # Another worker only has the table, not this process's cache
+    idempotency.clear()
+    retry = client.post('/purchase/', json={'coffee_id': coffee_item, 'quantity': 2}, headers=headers)
+    assert json.loads(retry.data) == json.loads(first.data)
+    
+    response = client.post('/purchase/', json={'coffee_id': coffee_item, 'quantity': 3}, headers=headers)
+    assert response.status_code == 422
+    
+    with app.app_context():
+        assert Purchase.query.count() == 1
+        assert _db.session.get(Coffee, coffee_item).stock == 98
+
+def test_purge_idempotency_keys(app, client, regular_user, coffee_item, _db):
+    token = get_auth_token(client, 'user', 'user123')
+    headers = {'Authorization': f'Bearer {token}', 'Idempotency-Key': 'old'}
+    client.post('/purchase/', json={'coffee_id': coffee_item, 'quantity': 1}, headers=headers)
+    
+    with app.app_context():
+        row = IdempotencyKey.query.filter_by(key='old').one()
+        row.created_at = datetime.now(timezone.utc) - timedelta(seconds=app.config['IDEMPOTENCY_TTL'] + 1)
+        _db.session.commit()
+    idempotency.clear()
+    
+    # An expired key is treated as new
+    response = client.post('/purchase/', json={'coffee_id': coffee_item, 'quantity': 1}, headers=headers)
+    assert response.status_code == 201
+    assert 'Idempotent-Replayed' not in response.headers
+    
+    with app.app_context():
+        row = IdempotencyKey.query.filter_by(key='old').one()
+        row.created_at = datetime.now(timezone.utc) - timedelta(seconds=app.config['IDEMPOTENCY_TTL'] + 1)
+        _db.session.commit()
+    result = app.test_cli_runner().invoke(args=['purge-idempotency-keys'])
+    assert 'Deleted 1 expired' in result.output
+    with app.app_context():
+        assert IdempotencyKey.query.count() == 0
+
 def test_get_purchase_history(client, regular_user, coffee_item, _db):
     token = get_auth_token(client, 'user', 'user123')
     
@@ -196,5 +264,716 @@ def test_get_purchase_history(client, regular_user, coffee_item, _db):
     assert len(data) == 1
     assert data[0]['quantity'] == 1
 
+def test_purchase_history_pagination(client, regular_user, coffee_item, _db):
+    token = get_auth_token(client, 'user', 'user123')
+    user_id = User.query.filter_by(username='user').first().id
+    _db.session.add_all([
+        Purchase(user_id=user_id, coffee_id=coffee_item, quantity=1, total_price=10.0)
+        for _ in range(5)
+    ])
+    _db.session.commit()
+    
+    response = client.get('/purchase/?limit=2',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    assert response.status_code == 200
+    first_page = json.loads(response.data)
+    assert len(first_page) == 2
+    assert response.headers['X-Next-After-Id'] == str(first_page[-1]['id'])
+    assert first_page[0]['coffee_name'] == 'Test Coffee'
+    
+    response = client.get(f"/purchase/?limit=2&after_id={response.headers['X-Next-After-Id']}",
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    second_page = json.loads(response.data)
+    assert len(second_page) == 2
+    assert second_page[0]['id'] > first_page[-1]['id']
+    
+    response = client.get(f"/purchase/?limit=2&after_id={second_page[-1]['id']}",
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    assert len(json.loads(response.data)) == 1
+    assert 'X-Next-After-Id' not in response.headers
+
+def test_purchase_history_unpaged_returns_everything(client, regular_user, coffee_item, _db):
+    token = get_auth_token(client, 'user', 'user123')
+    user_id = User.query.filter_by(username='user').first().id
+    _db.session.add_all([
+        Purchase(user_id=user_id, coffee_id=coffee_item, quantity=1, total_price=10.0)
+        for _ in range(60)
+    ])
+    _db.session.commit()
+    newest = client.post('/purchase/',
+        json={'coffee_id': coffee_item, 'quantity': 1},
+        headers={'Authorization': f'Bearer {token}'}
+    ).get_json()
+    
+    response = client.get('/purchase/',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    data = json.loads(response.data)
+    assert len(data) == Purchase.query.filter_by(user_id=user_id).count() > 60
+    assert newest['id'] in [purchase['id'] for purchase in data]
+    assert 'X-Next-After-Id' not in response.headers
+
+def test_purchase_history_query_count(client, regular_user, coffee_item, _db):
+    token = get_auth_token(client, 'user', 'user123')
+    user_id = User.query.filter_by(username='user').first().id
+    _db.session.add_all([
+        Purchase(user_id=user_id, coffee_id=coffee_item, quantity=1, total_price=10.0)
+        for _ in range(20)
+    ])
+    _db.session.commit()
+    _db.session.expunge_all()
+    
+    statements = []
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    event.listen(_db.engine, 'before_cursor_execute', count_statement)
+    try:
+        response = client.get('/purchase/',
+            headers={'Authorization': f'Bearer {token}'}
+        )
+    finally:
+        event.remove(_db.engine, 'before_cursor_execute', count_statement)
+    
+    assert response.status_code == 200
+    assert len(json.loads(response.data)) == 20
+    assert len(statements) == 1
+
+def test_list_coffees_etag(client, coffee_item):
+    response = client.get('/coffee/')
+    assert response.status_code == 200
+    assert json.loads(response.data)[0]['name'] == 'Test Coffee'
+    etag = response.headers['ETag']
+    
+    response = client.get('/coffee/', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+def test_list_coffees_invalidated_on_change(client, admin_user, coffee_item, _db):
+    token = get_auth_token(client, 'admin', 'admin123')
+    etag = client.get('/coffee/').headers['ETag']
+    
+    response = client.put(f'/coffee/{coffee_item}',
+        json={'price': 12.5},
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    assert response.status_code == 200
+    
+    response = client.get('/coffee/', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert json.loads(response.data)[0]['price'] == 12.5
+
+def test_list_coffees_filtered_and_paginated(app, client, _db):
+    with app.app_context():
+        for i, (price, stock) in enumerate([(3.0, 5), (4.5, 0), (4.5, 10), (6.0, 2), (9.0, 1)]):
+            _db.session.add(Coffee(name=f'Blend {i}', description='d', price=price, stock=stock))
+        _db.session.add(Coffee(name='Espresso', description='d', price=5.0, stock=3))
+        _db.session.commit()
+    
+    response = client.get('/coffee/?in_stock=true&min_price=4&max_price=8&sort=-price')
+    assert response.status_code == 200
+    assert [c['name'] for c in json.loads(response.data)] == ['Blend 3', 'Espresso', 'Blend 2']
+    assert 'X-Next-Cursor' not in response.headers
+    
+    response = client.get('/coffee/?name_prefix=Blend&in_stock=false&include_description=false')
+    assert json.loads(response.data) == [{'id': 2, 'name': 'Blend 1', 'price': 4.5, 'stock': 0}]
+    
+    # Without limit, cursor or sort, filters and cache-busters keep the full, unpaged list
+    response = client.get('/coffee/?in_stock=true&_=123')
+    assert len(json.loads(response.data)) == 5
+    assert 'X-Next-Cursor' not in response.headers
+    response = client.get('/coffee/?_=123')
+    assert response.headers['ETag']
+    assert len(json.loads(response.data)) == 6
+    
+    pages, url = [], '/coffee/?sort=price&limit=2'
+    while url:
+        response = client.get(url)
+        pages.append([c['name'] for c in json.loads(response.data)])
+        cursor = response.headers.get('X-Next-Cursor')
+        url = f'/coffee/?sort=price&limit=2&cursor={cursor}' if cursor else None
+    assert pages == [['Blend 0', 'Blend 1'], ['Blend 2', 'Espresso'], ['Blend 3', 'Blend 4']]
+
+def test_list_coffees_invalid_cursor(client, coffee_item):
+    price_cursor = catalog.encode_cursor('price', SimpleNamespace(id=coffee_item, price=10.0))
+    response = client.get(f'/coffee/?sort=name&cursor={price_cursor}')
+    assert response.status_code == 400
+    
+    response = client.get('/coffee/?sort=name&cursor=not-a-cursor')
+    assert response.status_code == 400
+    
+    response = client.get('/coffee/?sort=bogus')
+    assert response.status_code == 400
+    
+    for query in ('page=2', 'limit=0', 'in_stock=maybe', 'min_price=nan', 'max_price=inf', 'min_price=-inf&sort=price'):
+        assert client.get(f'/coffee/?{query}').status_code == 400, query
+    
+    for sort, payload in [('price', ['price', [1, 2], 3]), ('name', ['name', 5, 1]),
+                          ('price', ['price', 1.0, 'x']), ('-id', ['-id', True, 1])]:
+        tampered = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        response = client.get(f'/coffee/?sort={sort}&cursor={tampered}')
+        assert response.status_code == 400, payload
+
+def test_search_coffees(app, client, admin_user, _db):
+    with app.app_context():
+        _db.session.add_all([
+            Coffee(name='Ethiopia Filter', description='Floral and bright', price=5.0, stock=1),
+            Coffee(name='Brazil Espresso', description='Chocolate notes, great for espresso drinks', price=4.0, stock=1),
+            Coffee(name='Espresso Blend', description='Dark roast', price=3.0, stock=1),
+        ])
+        _db.session.commit()
+    
+    response = client.get('/coffee/search?q=espresso')
+    assert response.status_code == 200
+    assert [c['name'] for c in json.loads(response.data)] == ['Espresso Blend', 'Brazil Espresso']
+    
+    assert [c['name'] for c in json.loads(client.get('/coffee/search?q=choc espr').data)] == ['Brazil Espresso']
+    assert client.get('/coffee/search?q=***').status_code == 400
+    
+    token = get_auth_token(client, 'admin', 'admin123')
+    headers = {'Authorization': f'Bearer {token}'}
+    client.put('/coffee/1', json={'name': 'Ethiopia Espresso'}, headers=headers)
+    client.delete('/coffee/3', headers=headers)
+    assert [c['id'] for c in json.loads(client.get('/coffee/search?q=espresso').data)] == [1, 2]
+    
+    statements = []
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    event.listen(_db.engine, 'before_cursor_execute', count_statement)
+    try:
+        assert client.get('/coffee/search?q=espresso').status_code == 200
+    finally:
+        event.remove(_db.engine, 'before_cursor_execute', count_statement)
+    assert not any('sqlite_master' in statement for statement in statements)
+    
+    with app.app_context():
+        _db.session.execute(text('DROP TABLE coffee_fts'))
+        _db.session.commit()
+        search.forget_fts(_db.engine)
+    assert [c['name'] for c in json.loads(client.get('/coffee/search?q=espresso').data)] == \
+        ['Brazil Espresso', 'Ethiopia Espresso']
+
+def test_cart_checkout(client, regular_user, coffee_item, _db):
+    token = get_auth_token(client, 'user', 'user123')
+    other = Coffee(name='Other Coffee', description='Other', price=4.0, stock=3)
+    _db.session.add(other)
+    _db.session.commit()
+    other_id = other.id
+    
+    response = client.post('/purchase/cart',
+        json={'items': [
+            {'coffee_id': coffee_item, 'quantity': 2},
+            {'coffee_id': other_id, 'quantity': 3},
+            {'coffee_id': coffee_item, 'quantity': 1}
+        ]},
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    
+    assert response.status_code == 201
+    data = json.loads(response.data)
+    assert len(data['purchases']) == 3
+    assert data['total_price'] == 42.0
+    assert all(isinstance(p['total_price'], float) for p in data['purchases'])
+    assert data['purchases'][1]['coffee_name'] == 'Other Coffee'
+    _db.session.expire_all()
+    assert _db.session.get(Coffee, coffee_item).stock == 97
+    assert _db.session.get(Coffee, other_id).stock == 0
+
+def test_cart_checkout_matches_history(client, regular_user, coffee_item, _db):
+    token = get_auth_token(client, 'user', 'user123')
+    headers = {'Authorization': f'Bearer {token}'}
+    response = client.post('/purchase/cart', json={'items': [
+        {'coffee_id': coffee_item, 'quantity': 1},
+        {'coffee_id': coffee_item, 'quantity': 2}
+    ]}, headers=headers)
+    assert response.status_code == 201
+    
+    history = json.loads(client.get('/purchase/', headers=headers).data)
+    assert json.loads(response.data)['purchases'] == history
+
+def test_cart_checkout_is_all_or_nothing(client, regular_user, coffee_item, _db):
+    token = get_auth_token(client, 'user', 'user123')
+    other = Coffee(name='Other Coffee', description='Other', price=4.0, stock=1)
+    _db.session.add(other)
+    _db.session.commit()
+    other_id = other.id
+    
+    response = client.post('/purchase/cart',
+        json={'items': [
+            {'coffee_id': coffee_item, 'quantity': 2},
+            {'coffee_id': other_id, 'quantity': 2}
+        ]},
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    assert response.status_code == 400
+    assert json.loads(response.data)['error'] == f'Insufficient stock for coffee {other_id}'
+    
+    response = client.post('/purchase/cart',
+        json={'items': [{'coffee_id': 9999, 'quantity': 1}]},
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    assert response.status_code == 404
+    
+    _db.session.expire_all()
+    assert _db.session.get(Coffee, coffee_item).stock == 100
+    assert Purchase.query.count() == 0
+
+def test_import_coffees_csv(client, admin_user, coffee_item, _db):
+    token = get_auth_token(client, 'admin', 'admin123')
+    body = (
+        "name,description,price,stock\n"
+        "Test Coffee,Updated Description,11.0,7\n"
+        "Mocha,Chocolate,4.5,20\n"
+        "Broken,No price,,3\n"
+        "Latte,Milk,abc,5\n"
+    )
+    
+    response = client.post('/coffee/import', data=body, content_type='text/csv',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['rows'] == 4
+    assert data['inserted'] == 1
+    assert data['updated'] == 1
+    assert data['error_count'] == 2
+    assert [e['line'] for e in data['errors']] == [4, 5]
+    assert _db.session.get(Coffee, coffee_item).stock == 7
+    assert Coffee.query.filter_by(name='Mocha').one().price == 4.5
+
+def test_import_coffees_ndjson_requires_admin(client, admin_user, regular_user, _db):
+    body = '{"name": "Mocha", "description": "Chocolate", "price": 4.5, "stock": 20}\n\nnot json\n'
+    
+    token = get_auth_token(client, 'user', 'user123')
+    response = client.post('/coffee/import', data=body, content_type='application/x-ndjson',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    assert response.status_code == 403
+    
+    token = get_auth_token(client, 'admin', 'admin123')
+    response = client.post('/coffee/import', data=body, content_type='application/x-ndjson',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['inserted'] == 1
+    assert data['errors'][0]['line'] == 3
+
+def test_import_coffees_rejects_bad_numbers_and_ambiguous_names(client, admin_user, coffee_item, _db):
+    token = get_auth_token(client, 'admin', 'admin123')
+    _db.session.add_all([Coffee(name='Twin', description='A', price=1.0, stock=1),
+                         Coffee(name='Twin', description='B', price=1.0, stock=1)])
+    _db.session.commit()
+    body = (
+        "name,description,price,stock\n"
+        "Nan,x,nan,1\n"
+        "Inf,x,inf,1\n"
+        "Negative,x,-1,1\n"
+        "Oversold,x,1,-5\n"
+        "Twin,Updated,2.0,9\n"
+    )
+    
+    response = client.post('/coffee/import', data=body, content_type='text/csv',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert (data['inserted'], data['updated'], data['error_count']) == (0, 0, 5)
+    assert data['errors'][-1] == {'line': 6, 'error': "Ambiguous name: 2 coffees are named 'Twin'"}
+    assert [c.stock for c in Coffee.query.filter_by(name='Twin')] == [1, 1]
+
+def test_import_coffees_rejects_fractional_stock_and_reports_duplicates(client, admin_user, _db):
+    token = get_auth_token(client, 'admin', 'admin123')
+    body = (
+        '{"name": "Fraction", "description": "x", "price": 1, "stock": 2.7}\n'
+        '{"name": "Whole", "description": "x", "price": 1, "stock": 2.0}\n'
+        '{"name": "Flag", "description": "x", "price": 1, "stock": true}\n'
+        '{"name": "Twice", "description": "first", "price": 1, "stock": 1}\n'
+        '{"name": "Twice", "description": "second", "price": 2, "stock": 2}\n'
+    )
+    
+    response = client.post('/coffee/import', data=body, content_type='application/x-ndjson',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert (data['inserted'], data['updated'], data['error_count']) == (2, 0, 3)
+    assert data['errors'] == [
+        {'line': 1, 'error': 'Invalid value for stock: 2.7'},
+        {'line': 3, 'error': 'Invalid value for stock: True'},
+        {'line': 4, 'error': "Duplicate name 'Twice': superseded by line 5"},
+    ]
+    assert Coffee.query.filter_by(name='Whole').one().stock == 2
+    assert Coffee.query.filter_by(name='Twice').one().description == 'second'
+
+def test_import_coffees_reports_progress_on_bad_encoding(app, client, admin_user, _db, monkeypatch):
+    token = get_auth_token(client, 'admin', 'admin123')
+    monkeypatch.setitem(app.config, 'COFFEE_IMPORT_CHUNK_SIZE', 2)
+    good = ''.join(f'{{"name": "Coffee {i}", "description": "x", "price": 1, "stock": 1}}\n' for i in range(1000))
+    body = good.encode('utf-8') + b'{"name": "Caf\xe9", "description": "x", "price": 1, "stock": 1}\n'
+    
+    response = client.post('/coffee/import', data=body, content_type='application/x-ndjson',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    
+    assert response.status_code == 400
+    data = json.loads(response.data)
+    assert data['error'] == 'File must be UTF-8 encoded'
+    assert data['inserted'] > 0
+    assert Coffee.query.count() == data['inserted']
+
+def test_export_purchases(client, admin_user, regular_user, coffee_item, _db):
+    user_id = User.query.filter_by(username='user').first().id
+    _db.session.add_all([
+        Purchase(user_id=user_id, coffee_id=coffee_item, quantity=q, total_price=10.0 * q,
+                 created_at=datetime(2024, 1, q))
+        for q in (1, 2, 3)
+    ])
+    _db.session.commit()
+    
+    token = get_auth_token(client, 'user', 'user123')
+    response = client.get('/purchase/export', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 403
+    
+    token = get_auth_token(client, 'admin', 'admin123')
+    response = client.get('/purchase/export?start=2024-01-02',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [row['quantity'] for row in rows] == [2, 3]
+    assert rows[0]['username'] == 'user'
+    assert rows[0]['coffee_name'] == 'Test Coffee'
+    
+    response = client.get(f'/purchase/export?format=csv&end=2024-01-03&coffee_id={coffee_item}',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    lines = response.data.decode().splitlines()
+    assert lines[0].startswith('id,user_id,username')
+    assert len(lines) == 3
+
+def test_export_converts_offsets_to_utc(client, admin_user, regular_user, coffee_item, _db):
+    user_id = User.query.filter_by(username='user').first().id
+    _db.session.add_all([
+        Purchase(user_id=user_id, coffee_id=coffee_item, quantity=q, total_price=10.0 * q,
+                 created_at=datetime(2024, 1, q))
+        for q in (1, 2, 3)
+    ])
+    _db.session.commit()
+    headers = {'Authorization': f'Bearer {get_auth_token(client, "admin", "admin123")}'}
+    
+    # 00:00-01:00 is 01:00 UTC, after the purchase made at midnight UTC on the 2nd
+    response = client.get('/purchase/export', query_string={'start': '2024-01-02T00:00:00-01:00'}, headers=headers)
+    assert response.status_code == 200
+    assert [json.loads(line)['quantity'] for line in response.data.decode().splitlines()] == [3]
+    
+    response = client.get('/purchase/export', query_string={'end': '2024-01-02T02:00:00+02:00'}, headers=headers)
+    assert [json.loads(line)['quantity'] for line in response.data.decode().splitlines()] == [1]
+    
+    assert client.get('/purchase/export?start=yesterday', headers=headers).status_code == 400
+
+def test_admin_check_uses_token_claims(client, admin_user, _db):
+    token = get_auth_token(client, 'admin', 'admin123')
+    
+    statements = []
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    event.listen(_db.engine, 'before_cursor_execute', count_statement)
+    try:
+        response = client.post('/coffee/',
+            json={'name': 'Claims Coffee', 'description': 'No lookup', 'price': 5.0, 'stock': 1},
+            headers={'Authorization': f'Bearer {token}'}
+        )
+    finally:
+        event.remove(_db.engine, 'before_cursor_execute', count_statement)
+    
+    assert response.status_code == 201
+    assert not any('FROM user' in statement for statement in statements)
+
+def test_purchase_user_lookup_is_cached(client, regular_user, coffee_item, _db):
+    token = get_auth_token(client, 'user', 'user123')
+    headers = {'Authorization': f'Bearer {token}'}
+    client.post('/purchase/', json={'coffee_id': coffee_item, 'quantity': 1}, headers=headers)
+    
+    statements = []
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    event.listen(_db.engine, 'before_cursor_execute', count_statement)
+    try:
+        response = client.post('/purchase/', json={'coffee_id': coffee_item, 'quantity': 1}, headers=headers)
+    finally:
+        event.remove(_db.engine, 'before_cursor_execute', count_statement)
+    
+    assert response.status_code == 201
+    assert not any('FROM user' in statement for statement in statements)
+
+def test_login_rehashes_outdated_password(client, _db):
+    user = User(username='legacy', email='legacy@example.com',
+                password_hash=generate_password_hash('legacy123', method='pbkdf2:sha256:500'))
+    _db.session.add(user)
+    _db.session.commit()
+    
+    get_auth_token(client, 'legacy', 'legacy123')
+    
+    _db.session.refresh(user)
+    assert user.password_hash.startswith('pbkdf2:sha256:1000$')
+    assert not user.password_needs_rehash()
+    get_auth_token(client, 'legacy', 'legacy123')
+
+def test_password_verification_in_process_pool(app, client, regular_user):
+    app.config['PASSWORD_HASH_WORKERS'] = 1
+    try:
+        get_auth_token(client, 'user', 'user123')
+        response = client.post('/auth/login', json={'username': 'user', 'password': 'wrong'})
+        assert response.status_code == 401
+    finally:
+        app.config['PASSWORD_HASH_WORKERS'] = 0
+        hasher.shutdown()
+
+def test_saturated_password_pool_returns_503(app, client, regular_user):
+    app.config.update(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_TIMEOUT=0.05)
+    try:
+        # Keep the only worker busy so every hash waits past the timeout
+        hasher._pool().submit(time.sleep, 1)
+        response = client.post('/auth/login', json={'username': 'user', 'password': 'user123'})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '5'
+        
+        response = client.post('/auth/register', json={'username': 'new', 'email': 'new@example.com', 'password': 'x'})
+        assert response.status_code == 503
+        assert User.query.filter_by(username='new').first() is None
+    finally:
+        app.config.update(PASSWORD_HASH_WORKERS=0, PASSWORD_HASH_TIMEOUT=30)
+        hasher.shutdown()
+
+def test_register_duplicate_user(client, regular_user, _db):
+    response = client.post('/auth/register',
+        json={'username': 'user', 'email': 'other@example.com', 'password': 'x'}
+    )
+    assert response.status_code == 400
+    assert json.loads(response.data)['error'] == 'Username already exists'
+    
+    response = client.post('/auth/register',
+        json={'username': 'other', 'email': 'user@example.com', 'password': 'x'}
+    )
+    assert response.status_code == 400
+    assert json.loads(response.data)['error'] == 'Email already exists'
+
+def test_bulk_register_users(client, admin_user, regular_user, _db):
+    token = get_auth_token(client, 'admin', 'admin123')
+    users = [{'username': f'bulk{i}', 'email': f'bulk{i}@example.com', 'password': f'pass{i}'} for i in range(5)]
+    users += [
+        {'username': 'user', 'email': 'new@example.com', 'password': 'x'},
+        {'username': 'bulk0', 'email': 'again@example.com', 'password': 'x'},
+        {'username': 'nopass', 'email': 'nopass@example.com'},
+        {'username': ['list'], 'email': 'list@example.com', 'password': 'x'},
+        {'username': 'object', 'email': {'a': 1}, 'password': 'x'}
+    ]
+    
+    response = client.post('/auth/bulk-register', json={'users': users},
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    
+    assert response.status_code == 201
+    data = json.loads(response.data)
+    assert data['created'] == 5
+    assert [(e['index'], e['error']) for e in data['errors']] == [
+        (5, 'Username already exists'),
+        (6, 'Duplicate username in request'),
+        (7, 'Missing required fields'),
+        (8, 'Username, email and password must be strings'),
+        (9, 'Username, email and password must be strings')
+    ]
+    assert data['errors'][3]['username'] is None
+    get_auth_token(client, 'bulk3', 'pass3')
+
+def test_register_rejects_non_string_fields(client, _db):
+    response = client.post('/auth/register', json={'username': 'x', 'email': ['x@example.com'], 'password': 'x'})
+    assert response.status_code == 400
+    assert json.loads(response.data) == {'error': 'Username, email and password must be strings'}
+    
+    response = client.post('/auth/register', json=['username', 'email', 'password'])
+    assert response.status_code == 400
+
+def test_bulk_register_requires_admin(client, regular_user):
+    token = get_auth_token(client, 'user', 'user123')
+    response = client.post('/auth/bulk-register',
+        json={'users': [{'username': 'x', 'email': 'x@example.com', 'password': 'x'}]},
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    assert response.status_code == 403
+
+def test_sales_rollup_updated_with_purchases(app, client, admin_user, regular_user, coffee_item, _db):
+    token = get_auth_token(client, 'user', 'user123')
+    headers = {'Authorization': f'Bearer {token}'}
+    client.post('/purchase/', json={'coffee_id': coffee_item, 'quantity': 2}, headers=headers)
+    client.post('/purchase/cart', json={'items': [
+        {'coffee_id': coffee_item, 'quantity': 1},
+        {'coffee_id': coffee_item, 'quantity': 3}
+    ]}, headers=headers)
+    
+    today = datetime.now(timezone.utc).date().isoformat()
+    response = client.get(f'/analytics/sales?start={today}&end={today}', headers=headers)
+    assert response.status_code == 403
+    
+    token = get_auth_token(client, 'admin', 'admin123')
+    response = client.get(f'/analytics/sales?start={today}&end={today}',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['rows'] == [{'day': today, 'coffee_id': coffee_item, 'coffee_name': 'Test Coffee',
+                             'units': 6, 'revenue': 60.0, 'purchases': 3}]
+    assert (data['units'], data['revenue'], data['purchases']) == (6, 60.0, 3)
+    
+    response = client.get('/analytics/sales?start=2024-02-01&end=2024-01-01',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    assert response.status_code == 400
+    
+    response = client.get('/analytics/sales?start=2020-01-01&end=2020-01-31',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    data = json.loads(response.data)
+    assert data['rows'] == []
+    assert (data['units'], data['revenue'], data['purchases']) == (0, 0.0, 0)
+    assert isinstance(data['revenue'], float)
+
+def test_backfill_rollups_command(app, client, admin_user, regular_user, coffee_item, _db):
+    user_id = User.query.filter_by(username='user').first().id
+    _db.session.add_all([
+        Purchase(user_id=user_id, coffee_id=coffee_item, quantity=q, total_price=10.0 * q,
+                 created_at=datetime(2024, 1, 1 + q // 2, 12))
+        for q in (1, 2, 3)
+    ])
+    _db.session.commit()
+    
+    result = app.test_cli_runner().invoke(args=['backfill-rollups'])
+    assert result.exit_code == 0
+    
+    token = get_auth_token(client, 'admin', 'admin123')
+    response = client.get('/analytics/sales?start=2024-01-01&end=2024-01-31&group_by=day',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    assert [(row['day'], row['units']) for row in json.loads(response.data)['rows']] == \
+        [('2024-01-01', 1), ('2024-01-02', 5)]
+    
+    response = client.get('/analytics/sales?start=2024-01-01&end=2024-01-31&group_by=coffee',
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    rows = json.loads(response.data)['rows']
+    assert [(row['coffee_id'], row['units'], row['revenue']) for row in rows] == [(coffee_item, 6, 60.0)]
+    assert 'day' not in rows[0]
+
+def test_purchase_summary(app, client, regular_user, coffee_item, _db):
+    token = get_auth_token(client, 'user', 'user123')
+    headers = {'Authorization': f'Bearer {token}'}
+    response = client.get('/purchase/summary', headers=headers)
+    assert json.loads(response.data) == {'purchase_count': 0, 'units': 0, 'total_spent': 0.0,
+                                         'last_purchase_date': None}
+    
+    client.post('/purchase/cart', json={'items': [
+        {'coffee_id': coffee_item, 'quantity': 1},
+        {'coffee_id': coffee_item, 'quantity': 3}
+    ]}, headers=headers)
+    response = client.post('/purchase/', json={'coffee_id': coffee_item, 'quantity': 2}, headers=headers)
+    last_purchase_date = json.loads(response.data)['purchase_date']
+    history = json.loads(client.get('/purchase/', headers=headers).data)
+    assert history[-1]['purchase_date'] == last_purchase_date
+    
+    response = client.get('/purchase/summary', headers=headers)
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert (data['purchase_count'], data['units'], data['total_spent']) == (3, 6, 60.0)
+    assert data['last_purchase_date'] == last_purchase_date
+    
+    app.test_cli_runner().invoke(args=['backfill-rollups'])
+    assert json.loads(client.get('/purchase/summary', headers=headers).data) == data
+
+def test_generate_synthetic_data(app, _db):
+    args = ['generate-data', '--users', '20', '--coffees', '5', '--purchases', '300',
+            '--seed', '7', '--days', '10', '--end', '2024-03-10', '--chunk-size', '64']
+    result = app.test_cli_runner().invoke(args=args)
+    assert result.exit_code == 0, result.output
+    
+    assert User.query.count() == 20
+    assert len({user.password_hash for user in User.query}) == 1
+    assert Coffee.query.count() == 5
+    purchases = Purchase.query.order_by(Purchase.id).all()
+    assert len(purchases) == 300
+    assert all(datetime(2024, 3, 1) <= p.created_at < datetime(2024, 3, 11) for p in purchases)
+    units = _db.session.query(_db.func.sum(SalesDaily.units)).scalar()
+    assert units == sum(p.quantity for p in purchases)
+    first_run = [(p.user_id, p.coffee_id, p.quantity, p.created_at) for p in purchases]
+    
+    _db.drop_all()
+    _db.create_all()
+    assert app.test_cli_runner().invoke(args=args).exit_code == 0
+    assert [(p.user_id, p.coffee_id, p.quantity, p.created_at)
+            for p in Purchase.query.order_by(Purchase.id).all()] == first_run
+
+def test_json_provider_backends_agree(app):
+    data = {'when': datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc), 'count': 1, 'name': 'Café'}
+    backends = ['stdlib'] + (['orjson'] if json_provider.orjson is not None else [])
+    for backend in backends:
+        provider = json_provider.FastJSONProvider(app, backend, compact=True)
+        assert provider.dumps_bytes(data) == '{"when":"2024-01-02T03:04:05+00:00","count":1,"name":"Café"}'.encode()
+
+def test_responses_are_compact(client, coffee_item):
+    for path in ('/', '/coffee/', '/swagger.json'):
+        response = client.get(path)
+        assert response.status_code == 200
+        assert b'\n ' not in response.data
+
+def test_gzip_compression(client, _db):
+    _db.session.add_all([Coffee(name=f'Coffee {i}', description='Compressible', price=3.0, stock=1) for i in range(50)])
+    _db.session.commit()
+    compressor.clear()
+    
+    identity = client.get('/coffee/')
+    assert 'Content-Encoding' not in identity.headers
+    assert identity.headers['Vary'] == 'Accept-Encoding'
+    
+    response = client.get('/coffee/', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == identity.data
+    assert response.headers['ETag'] == f'W/{identity.headers["ETag"]}'
+    
+    again = client.get('/coffee/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
+    
+    client.get('/coffee/', headers={'Accept-Encoding': 'gzip'})
+    client.get('/swagger.json', headers={'Accept-Encoding': 'gzip'})
+    client.get('/swagger.json', headers={'Accept-Encoding': 'gzip'})
+    assert len(compressor._cache) == 2
+    
+    small = client.get('/purchase/summary', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers
+
+def test_init_db_and_seed_admin_commands(app, client, _db):
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['init-db'])
+    assert result.exit_code == 0
+    assert 'Database initialized.' in result.output
+    
+    result = runner.invoke(args=['seed-admin', '--password', 'secret123'])
+    assert result.exit_code == 0
+    assert 'Admin user admin created.' in result.output
+    assert 'already exists' in runner.invoke(args=['seed-admin']).output
+    
+    response = client.post('/auth/login', json={'username': 'admin', 'password': 'secret123'})
+    assert response.status_code == 200
+
 if __name__ == '__main__':
     pytest.main([__file__]) 
\ No newline at end of file
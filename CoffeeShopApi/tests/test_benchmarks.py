@@ -0,0 +1,20 @@
+from benchmarks.api_suite import compare
+
+BASE = {'requests': 100, 'failures': 0, 'throughput': 500.0, 'p50_ms': 2.0, 'p99_ms': 5.0}
+
+
+def test_compare_flags_slower_endpoints():
+    slower = dict(BASE, p50_ms=3.0, throughput=300.0)
+    assert compare({'login': slower}, {'login': BASE}, 0.25) == [
+        'login p50_ms: 2.00 -> 3.00', 'login throughput: 500.0 -> 300.0'
+    ]
+    assert compare({'login': slower}, {'login': BASE}, 0.25, metrics=('p99_ms',)) == []
+
+
+def test_compare_flags_new_failures_even_when_faster():
+    failing = dict(BASE, failures=100, throughput=2000.0, p50_ms=0.5, p99_ms=1.0)
+    assert compare({'purchase_create': failing}, {'purchase_create': BASE}, 0.25, metrics=('p50_ms',)) == [
+        'purchase_create failures: 0 -> 100'
+    ]
+    assert compare({'purchase_create': failing}, {}, 0.25) == ['purchase_create failures: 0 -> 100']
+    assert compare({'login': BASE}, {'login': BASE}, 0.25) == []
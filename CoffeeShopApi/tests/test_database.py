@@ -0,0 +1,30 @@
+from flask import Flask
+from sqlalchemy import text
+
+import database
+from app import db
+
+
+def test_sqlite_connections_get_the_pragmas(make_app):
+    app = make_app(SQLITE_PRAGMAS={'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 1234})
+    with app.app_context():
+        with db.engine.connect() as conn:
+            assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+            assert conn.execute(text('PRAGMA synchronous')).scalar() == 1
+            assert conn.execute(text('PRAGMA busy_timeout')).scalar() == 1234
+
+
+def test_pool_options_reach_non_sqlite_engines():
+    # The engine itself would need a PostgreSQL driver; the options are what create_app hands to it
+    app = Flask(__name__)
+    database.configure_defaults(app)
+    app.config.update(SQLALCHEMY_DATABASE_URI='postgresql://coffee@localhost/coffee', DB_POOL_SIZE=3,
+                      SQLALCHEMY_ENGINE_OPTIONS={'pool_recycle': 60})
+    database.configure_engine_options(app)
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS'] == {
+        'pool_size': 3,
+        'max_overflow': 20,
+        'pool_timeout': 30,
+        'pool_recycle': 60,
+        'pool_pre_ping': True,
+    }
@@ -0,0 +1,81 @@
+import io
+import os
+import json
+import logging
+import threading
+
+import pytest
+
+import logs
+
+
+@pytest.fixture
+def logged_app(make_app):
+    app = make_app(users=[('user', 'user123')], LOG_SAMPLE_RATES={'coffee_coffee_list': 0.0})
+    stream = io.StringIO()
+    logs.configure_logging(app, stream=stream)
+    yield app, stream
+    logs.shutdown()
+
+
+def read_records(stream):
+    logs.shutdown()
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_request_body_is_logged_as_redacted_json(logged_app):
+    app, stream = logged_app
+    response = app.test_client().post('/auth/login', json={'username': 'user', 'password': 'user123'})
+    assert response.status_code == 200
+
+    records = [r for r in read_records(stream) if r['message'] == 'Received login data']
+    assert len(records) == 1
+    assert records[0]['body'] == {'username': 'user', 'password': logs.REDACTED}
+    assert records[0]['endpoint'] == 'auth_login'
+    assert records[0]['logger'] == 'routes_swagger'
+    assert 'user123' not in stream.getvalue()
+
+
+def test_sampled_out_endpoint_keeps_warnings(logged_app):
+    app, stream = logged_app
+    client = app.test_client()
+    client.get('/coffee/')
+    with app.test_request_context('/coffee/'):
+        app.preprocess_request()
+        logging.getLogger('routes_swagger').warning("Slow catalog build")
+
+    records = read_records(stream)
+    assert not any(r['message'] == 'Received get coffees request' for r in records)
+    assert [r['message'] for r in records if r['level'] == 'WARNING'] == ['Slow catalog build']
+
+
+def test_full_queue_drops_records(logged_app):
+    app, stream = logged_app
+    handler = app.extensions['log_handler']
+    logs.shutdown()
+    handler.queue.maxsize = 1
+    handler.enqueue(logging.makeLogRecord({'msg': 'kept'}))
+    handler.enqueue(logging.makeLogRecord({'msg': 'dropped'}))
+    assert handler.dropped == 1
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+def test_forked_child_starts_listener_on_first_record(logged_app):
+    app, stream = logged_app
+    pid = os.fork()
+    if pid == 0:
+        # Child: report through the exit status, never return into pytest
+        status = 0
+        try:
+            if threading.active_count() != 1:
+                status |= 1
+            logging.getLogger('routes_swagger').warning("From the child")
+            if threading.active_count() != 2:
+                status |= 2
+            logs.shutdown()
+            if 'From the child' not in stream.getvalue():
+                status |= 4
+        finally:
+            os._exit(status)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
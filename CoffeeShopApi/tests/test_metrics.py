@@ -0,0 +1,88 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from extensions import catalog_cache, metrics
+
+
+@pytest.fixture
+def metered_app(make_app, tmp_path):
+    return make_app(coffees=[{'name': 'Coffee', 'description': '', 'price': 3.0, 'stock': 5}],
+                    METRICS_DIR=str(tmp_path / 'metrics'), CATALOG_CACHE_TTL=0)
+
+
+def test_metrics_count_requests_and_sql(metered_app):
+    client = metered_app.test_client()
+    for _ in range(3):
+        catalog_cache.invalidate()
+        assert client.get('/coffee/').status_code == 200
+    client.get('/no-such-page')
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    text = response.data.decode()
+    assert 'http_requests_total{method="GET",namespace="coffee",route="/coffee/",status="200"} 3' in text
+    assert 'http_requests_total{method="GET",namespace="unmatched",route="unmatched",status="404"} 1' in text
+    assert 'http_request_duration_seconds_count{method="GET",namespace="coffee",route="/coffee/"} 3' in text
+    assert 'sql_statements_total{method="GET",namespace="coffee",route="/coffee/"} 3' in text
+    assert '# TYPE http_request_sql_seconds histogram' in text
+
+
+def test_metrics_merge_worker_snapshots(metered_app, tmp_path):
+    client = metered_app.test_client()
+    client.get('/coffee/')
+    write_snapshot(tmp_path / 'metrics' / 'metrics-1.json', 4)
+
+    text = client.get('/metrics').data.decode()
+    assert 'http_requests_total{method="GET",namespace="coffee",route="/coffee/",status="200"} 5' in text
+
+
+def test_metrics_keep_counts_of_exited_workers(metered_app, tmp_path):
+    client = metered_app.test_client()
+    client.get('/coffee/')
+    worker = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+    write_snapshot(tmp_path / 'metrics' / f'metrics-{worker.pid}.json', 4)
+    series = 'http_requests_total{method="GET",namespace="coffee",route="/coffee/",status="200"}'
+    assert f'{series} 5' in client.get('/metrics').data.decode()
+
+    worker.kill()
+    worker.wait()
+    assert f'{series} 5' in client.get('/metrics').data.decode()
+    assert sorted(os.listdir(tmp_path / 'metrics')) == ['.archive.lock', 'archived.json', f'metrics-{os.getpid()}.json']
+
+    # A new worker that reuses a pid archives the old file instead of overwriting it
+    os.remove(tmp_path / 'metrics' / f'metrics-{os.getpid()}.json')
+    write_snapshot(tmp_path / 'metrics' / f'metrics-{os.getpid()}.json', 2, token='previous-worker')
+    metrics._claimed = None
+    assert f'{series} 7' in client.get('/metrics').data.decode()
+
+
+def write_snapshot(path, requests, token='other-worker'):
+    snapshot = {
+        'token': token,
+        'counters': [['http_requests_total',
+                      [['method', 'GET'], ['namespace', 'coffee'], ['route', '/coffee/'], ['status', '200']], requests]],
+        'histograms': []
+    }
+    with open(path, 'w') as f:
+        json.dump(snapshot, f)
+
+
+def test_metrics_restricted_to_allowed_ips_and_admins(metered_app):
+    client = metered_app.test_client()
+    remote = {'REMOTE_ADDR': '203.0.113.7'}
+    assert client.get('/metrics').status_code == 200
+    assert client.get('/metrics', environ_base=remote).status_code == 403
+
+    with metered_app.app_context():
+        admin = create_access_token(identity='1', additional_claims={'is_admin': True})
+        user = create_access_token(identity='2', additional_claims={'is_admin': False})
+    assert client.get('/metrics', environ_base=remote,
+                      headers={'Authorization': f'Bearer {user}'}).status_code == 403
+    assert client.get('/metrics', environ_base=remote,
+                      headers={'Authorization': f'Bearer {admin}'}).status_code == 200
@@ -0,0 +1,68 @@
+from sqlalchemy import create_engine, inspect, text
+
+import migrations
+from app import db
+
+LEGACY_SCHEMA = (
+    '''CREATE TABLE user (
+        id INTEGER NOT NULL PRIMARY KEY, username VARCHAR(80) NOT NULL UNIQUE,
+        email VARCHAR(120) NOT NULL UNIQUE, password_hash VARCHAR(128), is_admin BOOLEAN,
+        created_at DATETIME, updated_at DATETIME)''',
+    '''CREATE TABLE coffee (
+        id INTEGER NOT NULL PRIMARY KEY, name VARCHAR(100) NOT NULL, description TEXT,
+        price FLOAT NOT NULL, stock INTEGER, created_at DATETIME, updated_at DATETIME)''',
+    '''CREATE TABLE purchase (
+        id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user (id),
+        coffee_id INTEGER NOT NULL REFERENCES coffee (id), quantity INTEGER NOT NULL,
+        total_price FLOAT NOT NULL, created_at DATETIME, updated_at DATETIME)''',
+    "INSERT INTO coffee (id, name, price, stock) VALUES (1, 'Kept', 2.0, 5)",
+)
+
+
+def test_upgrade_existing_database_in_place(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.execute(text(statement))
+
+    ran = migrations.upgrade(engine)
+
+    assert [step.version for step in ran] == [step.version for step in migrations.MIGRATIONS]
+    indexes = {index['name'] for index in inspect(engine).get_indexes('purchase')}
+    assert {'ix_purchase_user_id_id', 'ix_purchase_coffee_id_created_at', 'ix_purchase_created_at'} <= indexes
+    tables = set(inspect(engine).get_table_names())
+    assert {'sales_daily', 'user_purchase_summary', 'idempotency_key', 'recent_write'} <= tables
+    coffee_indexes = {index['name'] for index in inspect(engine).get_indexes('coffee')}
+    assert {'ix_coffee_price_id', 'ix_coffee_in_stock'} <= coffee_indexes
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT name FROM coffee')).scalar() == 'Kept'
+        assert conn.execute(text("SELECT rowid FROM coffee_fts WHERE coffee_fts MATCH 'kept'")).scalar() == 1
+
+    assert migrations.upgrade(engine) == []
+    assert migrations.pending(engine) == []
+    engine.dispose()
+
+
+def _schema(engine, tables):
+    inspector = inspect(engine)
+    return {table: ({(column['name'], str(column['type']), column['nullable']) for column in inspector.get_columns(table)},
+                    inspector.get_pk_constraint(table)['constrained_columns'],
+                    {(index['name'], tuple(index['column_names'])) for index in inspector.get_indexes(table)})
+            for table in tables}
+
+
+def test_upgraded_schema_matches_a_fresh_one(tmp_path):
+    upgraded = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with upgraded.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.execute(text(statement))
+    migrations.upgrade(upgraded)
+    fresh = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    db.metadata.create_all(fresh)
+    migrations.upgrade(fresh)
+
+    tables = ('sales_daily', 'user_purchase_summary', 'idempotency_key', 'recent_write')
+    assert _schema(upgraded, tables) == _schema(fresh, tables)
+    assert _schema(upgraded, ('coffee',))['coffee'][2] == _schema(fresh, ('coffee',))['coffee'][2]
+    upgraded.dispose()
+    fresh.dispose()
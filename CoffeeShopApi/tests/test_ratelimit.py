@@ -0,0 +1,143 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, inspect, select
+
+from database import DEFAULT_SQLITE_PRAGMAS
+from extensions import hasher
+from ratelimit import MemoryBuckets, SQLBuckets
+
+
+@pytest.fixture
+def limited_app(make_app):
+    return make_app(
+        users=[('buyer', 'buyer123')],
+        coffees=[{'name': 'Coffee', 'description': '', 'price': 3.0, 'stock': 10}],
+        RATELIMIT_RULES={
+            'auth_login': [('ip', 5, 60), ('username', 2, 60)],
+            'purchase_purchase_list': [('user', 1, 60)],
+        }
+    )
+
+
+def test_login_limited_per_username_before_hashing(limited_app, monkeypatch):
+    client = limited_app.test_client()
+    for _ in range(2):
+        assert client.post('/auth/login', json={'username': 'Buyer', 'password': 'bad'}).status_code == 401
+
+    verify_calls = []
+    monkeypatch.setattr(hasher, 'verify', lambda *args: verify_calls.append(args))
+    response = client.post('/auth/login', json={'username': 'buyer', 'password': 'buyer123'})
+    assert response.status_code == 429
+    assert 1 <= int(response.headers['Retry-After']) <= 30
+    assert verify_calls == []
+
+    # The denied attempt did not spend an IP token; other usernames use the remaining three
+    for username in ('other1', 'other2', 'other3'):
+        assert client.post('/auth/login', json={'username': username, 'password': 'x'}).status_code == 401
+    assert client.post('/auth/login', json={'username': 'other4', 'password': 'x'}).status_code == 429
+
+
+def test_purchase_limited_per_user_only_for_writes(limited_app):
+    client = limited_app.test_client()
+    token = client.post('/auth/login', json={'username': 'buyer', 'password': 'buyer123'}).get_json()['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    assert client.post('/purchase/', json={'coffee_id': 1, 'quantity': 1}, headers=headers).status_code == 201
+    response = client.post('/purchase/', json={'coffee_id': 1, 'quantity': 1}, headers=headers)
+    assert response.status_code == 429
+    assert response.get_json() == {'error': 'Too many requests'}
+    assert client.get('/purchase/', headers=headers).status_code == 200
+
+    # Without a token there is no user to limit; the view answers 401
+    assert client.post('/purchase/', json={'coffee_id': 1, 'quantity': 1}).status_code == 401
+
+
+def test_ip_buckets_follow_forwarded_for_behind_a_proxy(make_app):
+    app = make_app(PROXY_FIX_X_FOR=1, RATELIMIT_RULES={'auth_login': [('ip', 1, 60)]})
+    client = app.test_client()
+
+    def login(client_ip):
+        return client.post('/auth/login', json={'username': 'x', 'password': 'x'},
+                           headers={'X-Forwarded-For': client_ip}).status_code
+
+    assert login('203.0.113.1') == 401
+    assert login('203.0.113.1') == 429
+    assert login('203.0.113.2') == 401
+
+
+def test_shared_buckets_hold_across_workers(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'buckets.db'}"
+    first, second = SQLBuckets(uri), SQLBuckets(uri)
+    ip, user = ('login:ip:1.2.3.4', 2, 2 / 60), ('login:username:buyer', 1, 1 / 60)
+
+    assert first.take_all([ip, user]) == 0
+    assert 59 < second.take_all([ip, user]) <= 60
+    assert second.take_all([ip]) == 0
+    assert 29 < first.take_all([ip]) <= 30
+    assert second.take_all([('login:ip:5.6.7.8', 2, 2 / 60)]) == 0
+    first.engine.dispose()
+    second.engine.dispose()
+
+
+def test_shared_buckets_under_concurrent_workers(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'buckets.db'}"
+    workers = [SQLBuckets(uri, DEFAULT_SQLITE_PRAGMAS) for _ in range(4)]
+    allowed = []
+
+    def hammer(buckets):
+        for _ in range(25):
+            allowed.append(buckets.take_all([('purchase:user:1', 30, 1e-6)]) == 0)
+
+    threads = [threading.Thread(target=hammer, args=(buckets,)) for buckets in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(allowed) == 100
+    assert sum(allowed) == 30
+    for buckets in workers:
+        buckets.engine.dispose()
+
+
+def test_shared_buckets_prune_refilled_rows(tmp_path):
+    buckets = SQLBuckets(f"sqlite:///{tmp_path / 'buckets.db'}", idle_after=60, prune_interval=3600)
+    for i in range(5):
+        assert buckets.take_all([(f'login:username:user{i}', 10, 10 / 60)]) == 0
+    with buckets.engine.begin() as conn:
+        conn.execute(buckets.table.update().where(buckets.table.c.key != 'login:username:user0')
+                     .values(updated_at=time.time() - 61))
+
+    assert buckets.prune() == 4
+    with buckets.engine.connect() as conn:
+        assert conn.execute(select(buckets.table.c.key)).scalars().all() == ['login:username:user0']
+    buckets.engine.dispose()
+
+
+def test_shared_buckets_table_created_on_first_use(make_app, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'buckets.db'}")
+    app = make_app(RATELIMIT_STORAGE_URI=str(engine.url))
+    assert not inspect(engine).has_table('rate_limit_bucket')
+
+    assert app.test_client().post('/auth/login', json={'username': 'x', 'password': 'x'}).status_code == 401
+    assert inspect(engine).has_table('rate_limit_bucket')
+    app.extensions['ratelimiter'].storage.engine.dispose()
+    engine.dispose()
+
+
+def test_memory_buckets_evict_within_a_stripe():
+    buckets = MemoryBuckets(max_keys=64)
+    for i in range(1000):
+        assert buckets.take_all([(f'key{i}', 1, 1.0)]) == 0
+    assert sum(len(stripe) for _, stripe in buckets._stripes) <= 64
+
+
+def test_memory_buckets_keep_throttled_keys():
+    buckets = MemoryBuckets(max_keys=256)
+    assert buckets.take_all([('attacker', 1, 1e-6)]) == 0
+    for i in range(1000):
+        assert buckets.take_all([('attacker', 1, 1e-6)]) > 0
+        buckets.take_all([(f'key{i}', 1, 1.0)])
+    assert buckets.take_all([('attacker', 1, 1e-6)]) > 0
@@ -0,0 +1,116 @@
+import pytest
+
+from app import db
+from extensions import catalog_cache, replica_router
+from models import Coffee
+
+
+@pytest.fixture
+def replicated_app(make_app, tmp_path):
+    app = make_app(users=[('user', 'user123')],
+                   SQLALCHEMY_REPLICA_URI=f"sqlite:///{tmp_path / 'replica.db'}")
+    assert app.test_cli_runner().invoke(args=['sync-replica']).exit_code == 0
+    return app
+
+
+def test_get_reads_from_replica_until_synced(replicated_app):
+    client = replicated_app.test_client()
+    with replicated_app.app_context():
+        db.session.add(Coffee(name='Fresh Coffee', description='', price=3.0, stock=5))
+        db.session.commit()
+
+    assert client.get('/coffee/').json == []
+
+    assert replicated_app.test_cli_runner().invoke(args=['sync-replica']).exit_code == 0
+    catalog_cache.invalidate()
+    assert [coffee['name'] for coffee in client.get('/coffee/').json] == ['Fresh Coffee']
+
+
+def test_history_reads_own_purchase_from_primary(replicated_app):
+    client = replicated_app.test_client()
+    with replicated_app.app_context():
+        coffee = Coffee(name='Coffee', description='', price=3.0, stock=5)
+        db.session.add(coffee)
+        db.session.commit()
+        coffee_id = coffee.id
+    assert replicated_app.test_cli_runner().invoke(args=['sync-replica']).exit_code == 0
+
+    token = client.post('/auth/login', json={'username': 'user', 'password': 'user123'}).json['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+    assert client.get('/purchase/', headers=headers).json == []
+
+    response = client.post('/purchase/', json={'coffee_id': coffee_id, 'quantity': 1}, headers=headers)
+    assert response.status_code == 201
+
+    history = client.get('/purchase/', headers=headers).json
+    assert [purchase['coffee_id'] for purchase in history] == [coffee_id]
+
+
+def test_read_your_writes_holds_across_workers(make_app, tmp_path):
+    shared = {'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'primary.db'}",
+              'SQLALCHEMY_REPLICA_URI': f"sqlite:///{tmp_path / 'replica.db'}"}
+    writer = make_app(users=[('user', 'user123')],
+                      coffees=[{'name': 'Coffee', 'description': '', 'price': 3.0, 'stock': 5}], **shared)
+    reader = make_app(**shared)
+    assert writer.test_cli_runner().invoke(args=['sync-replica']).exit_code == 0
+
+    client = writer.test_client()
+    token = client.post('/auth/login', json={'username': 'user', 'password': 'user123'}).json['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+    assert client.post('/purchase/', json={'coffee_id': 1, 'quantity': 1}, headers=headers).status_code == 201
+
+    # The other worker has nothing in memory; only the marker on the primary pins its reads
+    replica_router.clear()
+    history = reader.test_client().get('/purchase/', headers=headers).json
+    assert [purchase['coffee_id'] for purchase in history] == [1]
+
+
+def test_replica_bind_is_private_to_its_app(replicated_app):
+    # Other apps sharing ``db`` must not see a metadata entry for the replica
+    assert 'replica' not in db.metadatas
+
+
+def test_history_decodes_jwt_once(replicated_app, monkeypatch):
+    from flask_jwt_extended import view_decorators
+
+    client = replicated_app.test_client()
+    token = client.post('/auth/login', json={'username': 'user', 'password': 'user123'}).json['access_token']
+    decode = view_decorators._decode_jwt_from_request
+    calls = []
+    monkeypatch.setattr(view_decorators, '_decode_jwt_from_request',
+                        lambda *args, **kwargs: calls.append(1) or decode(*args, **kwargs))
+
+    assert client.get('/purchase/', headers={'Authorization': f'Bearer {token}'}).status_code == 200
+    assert len(calls) == 1
+
+
+def test_purchase_does_not_pin_the_catalog(replicated_app):
+    client = replicated_app.test_client()
+    with replicated_app.app_context():
+        db.session.add(Coffee(name='Coffee', description='', price=3.0, stock=5))
+        db.session.commit()
+    assert replicated_app.test_cli_runner().invoke(args=['sync-replica']).exit_code == 0
+
+    token = client.post('/auth/login', json={'username': 'user', 'password': 'user123'}).json['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+    assert client.post('/purchase/', json={'coffee_id': 1, 'quantity': 1}, headers=headers).status_code == 201
+
+    with replicated_app.app_context():
+        assert replica_router.recently_written(('user', 1))
+        assert not replica_router.recently_written('catalog')
+
+
+def test_missing_marker_is_cached(replicated_app, monkeypatch):
+    with replicated_app.app_context():
+        engine = db.engine
+        connects = []
+        connect = type(engine).connect
+        monkeypatch.setattr(type(engine), 'connect', lambda self: connects.append(1) or connect(self))
+
+        assert not replica_router.recently_written(('user', 1))
+        assert not replica_router.recently_written(('user', 1))
+        assert len(connects) == 1
+
+        # A write from this process replaces the cached miss
+        replica_router.record_write(('user', 1))
+        assert replica_router.recently_written(('user', 1))
@@ -0,0 +1,56 @@
+import threading
+
+import pytest
+
+from app import db
+from models import Coffee, Purchase
+
+THREADS = 8
+ATTEMPTS_PER_THREAD = 10
+INITIAL_STOCK = 25
+
+
+@pytest.fixture
+def file_app(make_app):
+    app = make_app(users=[('buyer', 'buyer123')],
+                   coffees=[{'name': 'Scarce Coffee', 'description': 'Limited', 'price': 5.0, 'stock': INITIAL_STOCK}],
+                   RATELIMIT_ENABLED=False)
+    return app, 1
+
+
+def test_concurrent_purchases_never_oversell(file_app):
+    app, coffee_id = file_app
+    client = app.test_client()
+    token = client.post('/auth/login', json={'username': 'buyer', 'password': 'buyer123'}).json['access_token']
+
+    statuses = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(THREADS)
+
+    def buy():
+        thread_client = app.test_client()
+        barrier.wait()
+        for _ in range(ATTEMPTS_PER_THREAD):
+            response = thread_client.post(
+                '/purchase/',
+                json={'coffee_id': coffee_id, 'quantity': 1},
+                headers={'Authorization': f'Bearer {token}'}
+            )
+            with lock:
+                statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=buy) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        stock = db.session.get(Coffee, coffee_id).stock
+        purchased = db.session.query(db.func.coalesce(db.func.sum(Purchase.quantity), 0)).scalar()
+
+    assert len(statuses) == THREADS * ATTEMPTS_PER_THREAD
+    assert stock == 0
+    assert purchased == INITIAL_STOCK
+    assert statuses.count(201) == INITIAL_STOCK
+    assert set(statuses) == {201, 400}